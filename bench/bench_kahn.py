@@ -0,0 +1,74 @@
+# Copyright 2024 Lion Kimbro
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""benchmark kahn.topological_sort on large synthetic graphs
+
+  python bench/bench_kahn.py [nodes ...]
+
+Times the sort on two shapes of graph, each with a share of duplicated
+edges (the way restated major-stage chains produce them):
+
+* random  -- a random DAG, a few edges per node
+* wide  -- one root fanning out to every other node, and all of those
+           joining into one sink (the worst case for a list-based queue)
+"""
+
+import sys
+import time
+import random
+import pathlib
+
+sys.path.insert(0, str(pathlib.Path(__file__).parent.parent / "src"))
+
+from chassis2024 import kahn
+
+
+kDEFAULT_SIZES = [10_000, 100_000]
+kEDGES_PER_NODE = 3
+kDUPLICATE_SHARE = 0.25
+kSEED = 2024
+
+
+def make_edges(n, edges_per_node=kEDGES_PER_NODE, seed=kSEED):
+    """Return a list of edges over n nodes that is guaranteed acyclic."""
+    rng = random.Random(seed)
+    names = ["N%d" % i for i in range(n)]
+    edges = []
+    for i in range(1, n):
+        for _ in range(edges_per_node):
+            edges.append((names[rng.randrange(i)], names[i]))
+    edges.extend(rng.sample(edges, int(len(edges) * kDUPLICATE_SHARE)))
+    return edges
+
+
+def make_wide_edges(n):
+    """Return edges for a root -> (n-2 nodes) -> sink fan-out/fan-in."""
+    middle = ["N%d" % i for i in range(1, n-1)]
+    edges = [("ROOT", m) for m in middle] + [(m, "SINK") for m in middle]
+    edges.extend(edges[:int(len(edges) * kDUPLICATE_SHARE)])
+    return edges
+
+
+def bench(n, make=make_edges, repeat=3):
+    edges = make(n)
+    best = None
+    for _ in range(repeat):
+        t = time.perf_counter()
+        order = kahn.topological_sort(edges)
+        elapsed = time.perf_counter() - t
+        best = elapsed if best is None else min(best, elapsed)
+    assert len(order) == n
+    return len(edges), best
+
+
+def main(argv):
+    sizes = [int(x) for x in argv] or kDEFAULT_SIZES
+    for shape, make in [("random", make_edges), ("wide", make_wide_edges)]:
+        for n in sizes:
+            num_edges, best = bench(n, make)
+            print(f"{shape:>6}  {n:>9} nodes  {num_edges:>9} edges"
+                  f"  {best*1000:10.1f} ms")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,335 @@
+# Copyright 2024 Lion Kimbro
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""benchmark chassis planning, dispatch, and persistence
+
+  python bench/bench_suite.py [-o results.json] [--quick]
+  python bench/bench_suite.py --baseline before.json [--tolerance 0.25]
+
+Times, on synthetic component sets of N nodes, E edges, and K
+interfaces (spread over packages of kNODES_PER_PACKAGE nodes each):
+
+* discover  -- Chassis._locate_chassis2024_packages (scan, and register)
+* kahn  -- Chassis._kahn (the topological sort)
+* plan  -- Chassis._plan (discovery, assembling the graph, and sorting
+           it); and plan_cached, the same, with a PLAN_CACHE_FILEPATH
+           that holds the plan already
+* execute  -- Chassis._execute, with handlers that do nothing (so: the
+              dispatch overhead), sequentially and on a thread pool
+* run  -- a whole Chassis.run
+
+...and basicjsonpersistence, on files of S records:
+
+* load  -- READ_BASICJSONPERSISTENCE, timed by the chassis's own
+           instrumentation
+* save  -- .save() after changing one record, with HASH and TRACKED
+           change detection
+
+Each time is the best of several repeats, in seconds.  The results are
+written as JSON, one entry per benchmark, keyed by name, with its
+parameters -- sorted and indented, so that two runs diff cleanly:
+
+  {"VERSION": 1,
+   "PYTHON": "3.11.4",
+   "RESULTS": {"kahn n=1000 e=3000 k=50": {"PARAMS": {...},
+                                           "SECONDS": 0.00123},
+               ...}}
+
+With --baseline, the results are compared against an earlier run's, and
+the exit status is 1 if any benchmark took more than (1 + tolerance)
+times as long as it did then, and more than --floor seconds longer.
+"""
+
+import gc
+import sys
+import json
+import time
+import types
+import random
+import pathlib
+import argparse
+import platform
+import tempfile
+
+sys.path.insert(0, str(pathlib.Path(__file__).parent.parent / "src"))
+
+import chassis2024
+from chassis2024 import chassis
+from chassis2024.words import *
+
+
+kVERSION = 1
+
+# results file keys
+VERSION = "VERSION"
+PYTHON = "PYTHON"
+RESULTS = "RESULTS"
+PARAMS = "PARAMS"
+SECONDS = "SECONDS"
+
+kSEED = 2024
+kNODES_PER_PACKAGE = 10
+kREPEAT = 5
+kDEFAULT_TOLERANCE = 0.25
+kDEFAULT_FLOOR = 0.0005  # (seconds; slowdowns smaller than this are noise)
+
+# (nodes, edges, interfaces)
+kGRAPHS = [(100, 300, 10), (1_000, 3_000, 50), (10_000, 30_000, 200)]
+kQUICK_GRAPHS = [(100, 300, 10), (1_000, 3_000, 50)]
+
+# records in the persistence file
+kRECORD_COUNTS = [1_000, 10_000, 100_000]
+kQUICK_RECORD_COUNTS = [1_000, 10_000]
+
+kPARALLEL_WORKERS = 4
+kPACKAGE_PREFIX = "_bench_component_"
+
+
+def best_of(fn, repeat=kREPEAT):
+    """Return the least time, in seconds, that fn() took, of repeat calls."""
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        t = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - t
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+# synthetic component sets
+
+def _noop(n):
+    pass
+
+def make_packages(n, e, k, seed=kSEED):
+    """Return synthetic chassis2024 packages: n nodes, e edges, k interfaces.
+
+    The nodes are divided among packages of kNODES_PER_PACKAGE each;
+    each edge runs from a lower-numbered node to a higher-numbered one
+    (so the graph is acyclic), and is declared by the later node's
+    package.  Every node also follows ACTIVATE and precedes UP.
+    """
+    rng = random.Random(seed)
+    names = ["BENCH_NODE_%d" % i for i in range(n)]
+    packages = []
+    for start in range(0, n, kNODES_PER_PACKAGE):
+        module_object = types.ModuleType("%s%d" % (kPACKAGE_PREFIX,
+                                                   len(packages)))
+        nodes = names[start:start+kNODES_PER_PACKAGE]
+        module_object.CHASSIS2024_SPEC = {
+            EXECUTES_GRAPH_NODES: nodes,
+            EXECUTION_GRAPH_SEQUENCES: [(ACTIVATE, node, UP)
+                                        for node in nodes],
+            INTERFACES: {}}
+        module_object.perform_execution_graph_node = _noop
+        packages.append(module_object)
+    for _ in range(e):
+        j = rng.randrange(1, n)
+        i = rng.randrange(j)
+        D = packages[j // kNODES_PER_PACKAGE].CHASSIS2024_SPEC
+        D[EXECUTION_GRAPH_SEQUENCES].append((names[i], names[j]))
+    for i in range(k):
+        D = packages[i % len(packages)].CHASSIS2024_SPEC
+        D[INTERFACES]["BENCH_INTERFACE_%d" % i] = object()
+    return packages
+
+def install(packages):
+    for module_object in packages:
+        sys.modules[module_object.__name__] = module_object
+
+def uninstall(packages):
+    for module_object in packages:
+        sys.modules.pop(module_object.__name__, None)
+
+
+# chassis benchmarks
+
+def _located():
+    """Return a new Chassis, with its packages located (not yet sorted.)"""
+    c = chassis.Chassis()
+    c._init()
+    c._populate_major_stages()
+    c._locate_chassis2024_packages()
+    return c
+
+def _planned():
+    c = _located()
+    c._kahn()
+    return c
+
+def bench_chassis(graphs, results):
+    for (n, e, k) in graphs:
+        params = {"nodes": n, "edges": e, "interfaces": k}
+        suffix = "n=%d e=%d k=%d" % (n, e, k)
+        packages = make_packages(n, e, k)
+        install(packages)
+        try:
+            def discover():
+                c = chassis.Chassis()
+                c._init()
+                c._populate_major_stages()
+                c._locate_chassis2024_packages()
+            results["discover " + suffix] = _result(params, best_of(discover))
+
+            c = _located()
+            sequences = list(c.execution_graph_sequences)
+            def kahn():
+                c.execution_graph_sequences[:] = sequences
+                c._kahn()
+            results["kahn " + suffix] = _result(params, best_of(kahn))
+
+            results["plan " + suffix] = _result(
+                params, best_of(lambda: chassis.Chassis()._plan({})))
+            spec = {CHASSIS2024: {PLAN_CACHE_FILEPATH: str(
+                pathlib.Path(tempfile.mkdtemp()) / "plan.json")}}
+            chassis.Chassis()._plan(spec)  # (writes the cache)
+            results["plan_cached " + suffix] = _result(
+                params, best_of(lambda: chassis.Chassis()._plan(spec)))
+
+            c = _planned()
+            results["execute " + suffix] = _result(params,
+                                                   best_of(c._execute))
+            c = _planned()
+            c.execution_spec[CHASSIS2024] = {
+                PARALLEL_WORKERS: kPARALLEL_WORKERS}
+            results["execute_parallel " + suffix] = _result(
+                dict(params, workers=kPARALLEL_WORKERS), best_of(c._execute))
+
+            results["run " + suffix] = _result(
+                params, best_of(lambda: chassis.Chassis().run({})))
+        finally:
+            uninstall(packages)
+
+
+# persistence benchmarks
+
+def make_records(count, seed=kSEED):
+    rng = random.Random(seed)
+    return {"r%d" % i: {"name": "record %d" % i,
+                        "kind": rng.choice(["a", "b", "c"]),
+                        "scores": [rng.randrange(1000) for _ in range(8)]}
+            for i in range(count)}
+
+def bench_persistence(record_counts, results):
+    import chassis2024.basicjsonpersistence as persistence
+    from chassis2024 import instrument
+    from chassis2024.basicjsonpersistence.words import (
+        BASICJSONPERSISTENCE, READ_BASICJSONPERSISTENCE, FILEPATH,
+        SAVE_AT_EXIT, CHANGE_DETECTION, HASH, TRACKED)
+
+    up = types.ModuleType(kPACKAGE_PREFIX + "up")
+    up.CHASSIS2024_SPEC = {EXECUTES_GRAPH_NODES: [UP]}
+    sys.modules[up.__name__] = up
+    dirpath = pathlib.Path(tempfile.mkdtemp())
+    try:
+        for count in record_counts:
+            filepath = dirpath / ("records_%d.json" % count)
+            filepath.write_text(json.dumps(make_records(count)))
+            params = {"records": count,
+                      "bytes": filepath.stat().st_size}
+            suffix = "records=%d" % count
+            for mode in (HASH, TRACKED):
+                timings = {"load": [], "save": []}
+                def at_up(n):
+                    P = chassis2024.interface(PERSISTENCE_DATA, required=True)
+                    D = P.data()
+                    D["r0"] = dict(D["r0"], name="changed")
+                    t = time.perf_counter()
+                    P.save()
+                    timings["save"].append(time.perf_counter() - t)
+                    D["r0"] = dict(D["r0"], name="record 0")
+                    P.save()
+                up.perform_execution_graph_node = at_up
+                for _ in range(kREPEAT):
+                    c = chassis.Chassis()
+                    gc.collect()
+                    c.run({CHASSIS2024: {INSTRUMENT: True},
+                           BASICJSONPERSISTENCE: {FILEPATH: str(filepath),
+                                                  SAVE_AT_EXIT: False,
+                                                  CHANGE_DETECTION: mode}})
+                    if c.exception_type_value_tracebacks_encountered:
+                        (exc_type, exc, tb) = \
+                            c.exception_type_value_tracebacks_encountered[0]
+                        raise exc
+                    timings["load"].extend(
+                        r[instrument.WALL] for r in c.instrumentation.records
+                        if r[instrument.NAME] == READ_BASICJSONPERSISTENCE)
+                if mode == HASH:
+                    results["load " + suffix] = _result(
+                        params, min(timings["load"]))
+                results["save %s %s" % (mode.lower(), suffix)] = _result(
+                    dict(params, change_detection=mode),
+                    min(timings["save"]))
+    finally:
+        del sys.modules[up.__name__]
+        sys.modules.pop(persistence.__name__, None)
+        chassis.registered_packages.pop(persistence.__name__, None)
+
+
+# results
+
+def _result(params, seconds):
+    return {PARAMS: params, SECONDS: seconds}
+
+def regressions(baseline, current, tolerance, floor=kDEFAULT_FLOOR):
+    """Return [(name, before, after), ...] for the benchmarks that slowed.
+
+    Benchmarks in only one of the two runs are ignored.
+    """
+    slower = []
+    for (name, result) in sorted(current[RESULTS].items()):
+        before = baseline[RESULTS].get(name)
+        if before is None:
+            continue
+        if (result[SECONDS] > before[SECONDS] * (1 + tolerance) and
+            result[SECONDS] - before[SECONDS] > floor):
+            slower.append((name, before[SECONDS], result[SECONDS]))
+    return slower
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        description="benchmark chassis planning, dispatch, and persistence")
+    parser.add_argument("-o", "--output", metavar="file",
+                        help="write the results here (default: stdout)")
+    parser.add_argument("--baseline", metavar="file",
+                        help="compare against an earlier run's results")
+    parser.add_argument("--tolerance", type=float, default=kDEFAULT_TOLERANCE,
+                        help="slowdown allowed, against the baseline "
+                             "(default: %(default)s, for 25%%)")
+    parser.add_argument("--floor", type=float, default=kDEFAULT_FLOOR,
+                        help="slowdown always allowed, in seconds "
+                             "(default: %(default)s)")
+    parser.add_argument("--quick", action="store_true",
+                        help="only the smaller sizes")
+    args = parser.parse_args(argv)
+
+    results = {}
+    bench_chassis(kQUICK_GRAPHS if args.quick else kGRAPHS, results)
+    bench_persistence(kQUICK_RECORD_COUNTS if args.quick else
+                      kRECORD_COUNTS, results)
+    for (name, result) in sorted(results.items()):
+        print(f"{name:<44} {result[SECONDS]*1000:10.3f} ms", file=sys.stderr)
+
+    D = {VERSION: kVERSION,
+         PYTHON: platform.python_version(),
+         RESULTS: results}
+    text = json.dumps(D, indent=1, sort_keys=True)
+    if args.output:
+        pathlib.Path(args.output).write_text(text + "\n")
+    else:
+        print(text)
+
+    if args.baseline:
+        baseline = json.loads(pathlib.Path(args.baseline).read_text())
+        slower = regressions(baseline, D, args.tolerance, args.floor)
+        for (name, before, after) in slower:
+            print(f"REGRESSION  {name}: {before*1000:.3f} ms"
+                  f" -> {after*1000:.3f} ms", file=sys.stderr)
+        return 1 if slower else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -28,16 +28,70 @@
 
 from .words import *
 from .exceptions import *
+import collections.abc
+
 from . import chassis
+from .chassis import Chassis
+
+
+class _CurrentExecutionSpec(collections.abc.MutableMapping):
+    """The execution spec of the current chassis (see chassis.current().)"""
+
+    def __getitem__(self, key):
+        return chassis.current().execution_spec[key]
+
+    def __setitem__(self, key, value):
+        chassis.current().execution_spec[key] = value
 
+    def __delitem__(self, key):
+        del chassis.current().execution_spec[key]
 
-execution_spec = {}  # will be reset in run(...) call
+    def __iter__(self):
+        return iter(chassis.current().execution_spec)
+
+    def __len__(self):
+        return len(chassis.current().execution_spec)
+
+    def __repr__(self):
+        return repr(chassis.current().execution_spec)
+
+
+execution_spec = _CurrentExecutionSpec()  # will be reset in run(...) call
 
 
 def run(execution_spec = {}):
     """Execute the program, providing a specific execution specification."""
     chassis.run(execution_spec)
 
+async def run_async(execution_spec = {}):
+    """Execute the program on the running asyncio event loop.
+
+    Execution node handlers (perform_execution_graph_node) may be
+    coroutine functions, and so may call_before_termination callbacks.
+    Nodes that don't depend on one another are awaited concurrently.
+
+      asyncio.run(chassis2024.run_async(EXECUTION_SPEC))
+    """
+    await chassis.run_async(execution_spec)
+
+def register(module_object):
+    """Register a package (a module with a CHASSIS2024_SPEC.)
+
+    Registered packages are found without scanning sys.modules, when the
+    execution spec's DISCOVERY includes REGISTRY.
+    """
+    chassis.register(module_object)
+
+def register_lazy(module_name, manifest):
+    """Declare a package by module name, without importing it yet.
+
+    The manifest describes the package's EXECUTES_GRAPH_NODES,
+    EXECUTION_GRAPH_SEQUENCES, and INTERFACES (a list of interface
+    names.)  The module is imported when one of its execution nodes is
+    performed, or when one of its interfaces is first asked for.
+    """
+    chassis.register_lazy(module_name, manifest)
+
 def interface(interface_name, required=False):
     """Access the object registered for a given interface.
     
@@ -45,9 +99,6 @@ def interface(interface_name, required=False):
     
     If it doesn't exist, and it's required, raises InterfaceUndefined.
     """
-    found = chassis.interfaces.get(interface_name)
-    if required and not found:
-        raise InterfaceUndefined(interface_name)
-    return found
+    return chassis.current().interface(interface_name, required)
 
 
@@ -133,29 +133,41 @@ CHASSIS2024_SPEC = {
     INTERFACES: {"ARGPARSE": sys.modules[__name__]}
 }
 
+chassis2024.register(sys.modules[__name__])
 
-# globals
 
-parser = None
-args = None
+# state (one per chassis; see chassis.Chassis.component_state)
+
+class _State:
+    def __init__(self):
+        self.parser = None
+        self.args = None
+
+def _state():
+    return chassis2024.chassis.current().component_state(__name__, _State)
+
+def __getattr__(name):
+    # .parser and .args are the current chassis's
+    if name in ("parser", "args"):
+        return getattr(_state(), name)
+    raise AttributeError(name)
 
 
 # entry
 
 def perform_execution_graph_node(n):
-    global parser, args
+    S = _state()
     
     if n == CLEAR_ARGPARSE:
-        parser = None
-        args = None
+        S.parser = None
+        S.args = None
     
     elif n == RESET_ARGPARSE:
-        parser = argparse.ArgumentParser()
-        args = None
+        S.parser = argparse.ArgumentParser()
+        S.args = None
         module = chassis2024.interface(ARGPARSE_CONFIGURE)
         if module is not None:
-            module.argparse_configure(parser)
+            module.argparse_configure(S.parser)
     
     elif n == ARGPARSE:
-        args = parser.parse_args()
-
+        S.args = S.parser.parse_args()
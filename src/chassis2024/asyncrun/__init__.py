@@ -0,0 +1,382 @@
+# Copyright 2024 Lion Kimbro
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""asyncio runner -- runs interface RUN's run() on an event loop
+
+
+STAGES:
+------------------------------------------------------------------------
+
+  <CLEAR>
+  <RESET>
+  + *RESET_ASYNCRUN  -- reads the configuration
+  <ARGPARSE>
+  <CONNECT>
+  <ACTIVATE>
+  *UP  -- runs RUN, and the tasks it spawns, until done or stopped;
+          then cancels and drains what's left
+
+  (key):  <BUILT-IN EXECUTION NODE>
+          + CREATED EXECUTION NODE
+          *IMPLEMENTED_EXECUTION_NODE
+             (executed via this module's
+              .perform_execution_graph_node(n) implementation)
+
+
+INTERFACES IMPLEMENTED:
+------------------------------------------------------------------------
+
+  Interface "ASYNC_TASKS":
+
+    .spawn(fn, *args, restart=False)  -- starts fn(*args), a coroutine
+                                         function, as a supervised task;
+                                         returns the asyncio.Task
+    .slot()  -- returns an async context manager that holds one of the
+                MAX_CONCURRENCY places while within it
+    .tasks()  -- returns the supervised tasks that haven't finished
+    .stop()  -- asks for a graceful shutdown
+    .stopping()  -- returns whether a shutdown has been asked for
+    .wait_stop()  -- a coroutine that returns once a shutdown is asked for
+
+
+INTERFACES CONSUMED:
+------------------------------------------------------------------------
+
+  Interface "RUN"
+
+    .run()  -- a coroutine function (or a plain function, as for
+               basicrun), called on the event loop
+
+
+CONFIGURATION PROCEDURES:
+------------------------------------------------------------------------
+
+  This is a drop-in replacement for chassis2024.basicrun; use one or
+  the other, not both.  It is configured by way of the execution spec.
+
+  (example:)
+  ----------------------------------------------------------------------
+  ...
+  import chassis2024.asyncrun
+  ...
+  from chassis2024.asyncrun.words import *
+  ...
+
+  EXECUTION_SPEC = {
+      ASYNCRUN: {
+          MAX_CONCURRENCY: 100,
+          SHUTDOWN_TIMEOUT: 10.0,
+          RESTART_DELAY: 1.0,
+          HANDLE_SIGNALS: True
+      }
+  }
+  ----------------------------------------------------------------------
+
+  Under chassis2024.run(...), UP starts an event loop (asyncio.run),
+  and runs everything on it.  Under chassis2024.run_async(...), an
+  event loop is already running, and UP returns a coroutine instead,
+  which the chassis awaits on that loop.  (Calling chassis2024.run(...)
+  from within a running event loop fails, with AwaitableNotAwaited:
+  nothing there would await UP's coroutine.  Use run_async.)
+
+  MAX_CONCURRENCY bounds how many supervised tasks (and .slot()
+  holders) run at once; the rest wait their turn.  None (the default)
+  means no bound.
+
+  With HANDLE_SIGNALS (and UP on the main thread, on a POSIX system),
+  SIGTERM and SIGINT ask for a graceful shutdown, as .stop() does.
+
+
+USE PROCEDURES:
+------------------------------------------------------------------------
+
+  (by way of example:)
+  ----------------------------------------------------------------------
+  async def run():
+      P = chassis2024.interface(ASYNC_TASKS, required=True)
+      P.spawn(refresh_cache_forever, restart=True)
+      server = await asyncio.start_server(handle_client, port=8080)
+      async with server:
+          await P.wait_stop()
+
+  async def handle_client(reader, writer):
+      async with chassis2024.interface(ASYNC_TASKS, required=True).slot():
+          ...
+  ----------------------------------------------------------------------
+
+  The service runs until RUN's run() has returned and every supervised
+  task has finished, or until a shutdown is asked for (or run() raises
+  an exception.)  Then every task still running, run() included, is
+  cancelled, and given up to SHUTDOWN_TIMEOUT seconds to finish (their
+  "finally:" blocks, and "except asyncio.CancelledError:" handlers,
+  run then.)  Only once they're drained does UP complete, and the
+  call_before_termination callbacks run.  A task that hasn't finished by
+  then (one that ignores its cancellation, say) is abandoned, left
+  pending on the closed event loop.
+
+  A supervised task that raises an exception has its traceback printed;
+  with restart=True, it is started again, after RESTART_DELAY seconds
+  (unless shutting down.)  Otherwise, UP raises the first such failure,
+  once everything is drained.
+"""
+
+
+import sys
+import signal
+import asyncio
+import inspect
+import threading
+import traceback
+
+import chassis2024
+from chassis2024.words import *
+
+from .words import *
+
+
+CHASSIS2024_SPEC = {
+    EXECUTES_GRAPH_NODES: [RESET_ASYNCRUN, UP],
+    EXECUTION_GRAPH_SEQUENCES: [(RESET, RESET_ASYNCRUN, ARGPARSE)],
+    INTERFACES: {ASYNC_TASKS: sys.modules[__name__]}
+}
+
+chassis2024.register(sys.modules[__name__])
+
+
+# constants
+
+kDEFAULT_MAX_CONCURRENCY = None  # no bound
+kDEFAULT_SHUTDOWN_TIMEOUT = 10.0  # seconds
+kDEFAULT_RESTART_DELAY = 1.0  # seconds
+kDEFAULT_HANDLE_SIGNALS = True
+
+kSIGNALS = (signal.SIGTERM, signal.SIGINT)
+
+
+# state (one per chassis; see chassis.Chassis.component_state)
+
+class _State:
+    def __init__(self):
+        self.max_concurrency = None  # most tasks at once [int, or None]
+        self.shutdown_timeout = None  # seconds to drain [float]
+        self.restart_delay = None  # seconds before a restart [float]
+        self.handle_signals = None  # whether to stop on signals [bool]
+        self.loop = None  # the event loop, while running
+        self.stop_event = None  # set once a shutdown is asked for
+        self.semaphore = None  # [asyncio.Semaphore], with MAX_CONCURRENCY
+        self.tasks = set()  # {asyncio.Task, ...}, supervised, unfinished
+        self.failures = []  # [exception, ...], of tasks not restarted
+
+def _state():
+    return chassis2024.chassis.current().component_state(__name__, _State)
+
+
+# read execution_spec
+
+def _execution_spec_section():
+    """Return the execution spec's ASYNCRUN, or else None."""
+    return chassis2024.execution_spec.get(ASYNCRUN, None)
+
+def _execution_spec_max_concurrency():
+    """Return execution spec's MAX_CONCURRENCY, or else the default."""
+    val = (_execution_spec_section() or {}).get(MAX_CONCURRENCY)
+    return kDEFAULT_MAX_CONCURRENCY if val is None else val
+
+def _execution_spec_shutdown_timeout():
+    """Return execution spec's SHUTDOWN_TIMEOUT, or else the default."""
+    val = (_execution_spec_section() or {}).get(SHUTDOWN_TIMEOUT)
+    return kDEFAULT_SHUTDOWN_TIMEOUT if val is None else val
+
+def _execution_spec_restart_delay():
+    """Return execution spec's RESTART_DELAY, or else the default."""
+    val = (_execution_spec_section() or {}).get(RESTART_DELAY)
+    return kDEFAULT_RESTART_DELAY if val is None else val
+
+def _execution_spec_handle_signals():
+    """Return execution spec's HANDLE_SIGNALS, or else the default."""
+    val = (_execution_spec_section() or {}).get(HANDLE_SIGNALS)
+    return kDEFAULT_HANDLE_SIGNALS if val is None else val
+
+
+# entry
+
+def perform_execution_graph_node(n):
+    S = _state()
+    if n == RESET_ASYNCRUN:
+        S.max_concurrency = _execution_spec_max_concurrency()
+        S.shutdown_timeout = _execution_spec_shutdown_timeout()
+        S.restart_delay = _execution_spec_restart_delay()
+        S.handle_signals = _execution_spec_handle_signals()
+        if S.max_concurrency is not None and not (
+                isinstance(S.max_concurrency, int) and S.max_concurrency > 0):
+            raise ValueError(S.max_concurrency)
+
+    elif n == UP:
+        if _loop_running():
+            return _serve()  # (run_async awaits it, on its loop)
+        _run_loop()
+
+def _run_loop():
+    """Run _serve() on an event loop of its own, then close the loop.
+
+    (Not asyncio.run(): after the main coroutine, it cancels every task
+    left, and waits for them without limit -- including tasks that _drain
+    has abandoned, at SHUTDOWN_TIMEOUT, for not finishing.)
+    """
+    loop = asyncio.new_event_loop()
+    try:
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(_serve())
+    finally:
+        try:
+            loop.run_until_complete(loop.shutdown_asyncgens())
+        finally:
+            asyncio.set_event_loop(None)
+            loop.close()
+
+def _loop_running():
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+# the service
+
+async def _serve():
+    S = _state()
+    S.loop = asyncio.get_running_loop()
+    S.stop_event = asyncio.Event()
+    S.semaphore = (asyncio.Semaphore(S.max_concurrency)
+                   if S.max_concurrency is not None else None)
+    S.tasks = set()
+    S.failures = []
+    signals = _install_signal_handlers()
+    main = S.loop.create_task(_run())
+    stopper = S.loop.create_task(S.stop_event.wait())
+    try:
+        # until run() is done, and its tasks are, or a shutdown is asked for
+        await asyncio.wait([main, stopper],
+                           return_when=asyncio.FIRST_COMPLETED)
+        while S.tasks and not stopper.done() and not _failed(main):
+            await asyncio.wait(list(S.tasks) + [stopper],
+                               return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        S.stop_event.set()
+        stopper.cancel()
+        _remove_signal_handlers(signals)
+        await _drain(main)
+        S.loop = None
+    if _failed(main):
+        raise main.exception()
+    if S.failures:
+        raise S.failures[0]
+
+def _failed(task):
+    """Return whether the task has finished by raising an exception."""
+    return (task.done() and not task.cancelled() and
+            task.exception() is not None)
+
+async def _run():
+    result = chassis2024.interface(RUN, required=True).run()
+    if inspect.isawaitable(result):
+        await result
+
+async def _drain(main):
+    """Cancel main and the supervised tasks; wait for them to finish."""
+    S = _state()
+    deadline = S.loop.time() + S.shutdown_timeout
+    cancelled = set()
+    while True:
+        # (tasks may spawn others, even as they're cancelled)
+        tasks = [t for t in [main] + list(S.tasks) if not t.done()]
+        if not tasks:
+            return
+        for t in tasks:
+            if t not in cancelled:
+                t.cancel()
+                cancelled.add(t)
+        remaining = deadline - S.loop.time()
+        if remaining <= 0:
+            print("asyncrun: %d task(s) didn't finish within "
+                  "SHUTDOWN_TIMEOUT; abandoning them" % len(tasks),
+                  file=sys.stderr)
+            return
+        await asyncio.wait(tasks, timeout=remaining)
+
+async def _supervise(fn, args, restart):
+    S = _state()
+    while True:
+        try:
+            async with slot():
+                await fn(*args)
+            return
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            traceback.print_exc()
+            if not restart or S.stop_event.is_set():
+                S.failures.append(e)
+                return
+        await asyncio.sleep(S.restart_delay)
+
+def _install_signal_handlers():
+    """Arrange for SIGTERM/SIGINT to stop; return the signals arranged."""
+    S = _state()
+    if not S.handle_signals:
+        return []
+    if threading.current_thread() is not threading.main_thread():
+        return []
+    arranged = []
+    for signum in kSIGNALS:
+        try:
+            S.loop.add_signal_handler(signum, S.stop_event.set)
+        except (NotImplementedError, RuntimeError, ValueError):
+            break  # (not supported here: Windows, say)
+        arranged.append(signum)
+    return arranged
+
+def _remove_signal_handlers(signals):
+    S = _state()
+    for signum in signals:
+        S.loop.remove_signal_handler(signum)
+
+
+class _NoSlot:
+    """An async context manager that does nothing (no MAX_CONCURRENCY.)"""
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, exc_traceback):
+        return False
+
+
+# interface ASYNC_TASKS
+
+def spawn(fn, *args, restart=False):
+    S = _state()
+    task = S.loop.create_task(_supervise(fn, args, restart))
+    S.tasks.add(task)
+    task.add_done_callback(S.tasks.discard)
+    return task
+
+def slot():
+    S = _state()
+    return S.semaphore if S.semaphore is not None else _NoSlot()
+
+def tasks():
+    return [t for t in _state().tasks if not t.done()]
+
+def stop():
+    S = _state()
+    if S.stop_event is not None:
+        S.stop_event.set()
+
+def stopping():
+    S = _state()
+    return S.stop_event is not None and S.stop_event.is_set()
+
+async def wait_stop():
+    await _state().stop_event.wait()
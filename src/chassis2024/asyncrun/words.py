@@ -0,0 +1,18 @@
+# Copyright 2024 Lion Kimbro
+# SPDX-License-Identifier: BSD-3-Clause
+
+
+# execution nodes
+RESET_ASYNCRUN = "RESET_ASYNCRUN"
+
+
+# interfaces
+ASYNC_TASKS = "ASYNC_TASKS"
+
+
+# execution_spec info
+ASYNCRUN = "ASYNCRUN"  # primary key
+MAX_CONCURRENCY = "MAX_CONCURRENCY"  # None, or int: most tasks running at once
+SHUTDOWN_TIMEOUT = "SHUTDOWN_TIMEOUT"  # seconds cancelled tasks get to finish (default: 10)
+RESTART_DELAY = "RESTART_DELAY"  # seconds before restarting a failed task (default: 1)
+HANDLE_SIGNALS = "HANDLE_SIGNALS"  # True/False: stop on SIGTERM/SIGINT (default: True)
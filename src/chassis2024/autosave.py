@@ -0,0 +1,92 @@
+# Copyright 2024 Lion Kimbro
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""save on a background thread, a little while after changes stop
+
+An Autosaver calls a save function on a thread of its own.  Each call
+to .notify() (made, typically, by a tracked.TrackedDict's on_change
+hook) says that something has changed; the save happens once changes
+have stopped coming for `debounce` seconds, or `max_delay` seconds
+after the first unsaved change, whichever comes first.  So a burst of
+a thousand changes costs one save, and a steady trickle of them can't
+put saving off forever.
+
+The save function is responsible for saving a consistent snapshot,
+and for resetting the record of changes before it takes it (so that a
+change made while it is saving is saved again, the next time.)
+
+.stop() waits for any save in progress, and re-raises the first
+exception that a background save raised, if any.
+"""
+
+import time
+import threading
+import contextvars
+
+
+class Autosaver:
+
+    def __init__(self, save, debounce, max_delay):
+        self.save = save  # fn()
+        self.debounce = debounce  # seconds of quiet before saving
+        self.max_delay = max_delay  # most seconds a change waits to be saved
+        self.pending = False  # whether there are unsaved changes
+        self.first_change = None  # time.monotonic() of first unsaved change
+        self.last_change = None  # time.monotonic() of last change
+        self.stopping = False
+        self.exception = None  # first exception raised by a save
+        self.wakeup = threading.Event()
+        self.thread = None
+
+    def start(self):
+        # (copy the context, so that the save sees the same chassis)
+        context = contextvars.copy_context()
+        self.thread = threading.Thread(target=context.run,
+                                       args=(self._run,),
+                                       name="chassis2024-autosave",
+                                       daemon=True)
+        self.thread.start()
+
+    def notify(self):
+        """Record that something has changed; called on every change."""
+        now = time.monotonic()
+        self.last_change = now
+        if not self.pending:
+            self.first_change = now
+            self.pending = True
+            self.wakeup.set()
+
+    def stop(self):
+        """Stop the thread, after any save in progress; re-raise its error."""
+        self.stopping = True
+        self.wakeup.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        if self.exception is not None:
+            exception, self.exception = self.exception, None
+            raise exception
+
+    def _run(self):
+        while not self.stopping:
+            if not self.pending:
+                self.wakeup.wait()
+                self.wakeup.clear()
+                continue
+            delay = self._delay()
+            if delay > 0:
+                self.wakeup.wait(delay)
+                self.wakeup.clear()
+                continue
+            self.pending = False
+            try:
+                self.save()
+            except Exception as e:
+                if self.exception is None:
+                    self.exception = e
+
+    def _delay(self):
+        """Return how many seconds remain before saving."""
+        now = time.monotonic()
+        return min(self.last_change + self.debounce,
+                   self.first_change + self.max_delay) - now
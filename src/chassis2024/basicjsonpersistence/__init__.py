@@ -29,7 +29,17 @@ INTERFACES IMPLEMENTED:
   Interface "PERSISTENCE_DATA":
 
     .data()  -- returns the dictionary of loaded persistence data
+                (a chassis2024.tracked.TrackedDict, or with LAZY_LOAD,
+                 a chassis2024.lazyjson.LazyJSONDict)
     .save()  -- forces an immediate save of the persistence data
+                (if it has changed since it was loaded or last saved)
+    .dirty()  -- returns whether the data has changed since it was
+                 loaded or last saved
+    .flush()  -- waits for a save that is being written in the background
+                 (SNAPSHOT only), and raises its failure, if it failed
+    .memory_report()  -- returns what COMPACT saved, when the data was
+                         read (or None, without COMPACT)
+    .index(name)  -- returns the named index (see INDEXES), up to date
     .save_at_exit(False)  -- turns off exit-time persistence data saving
     .save_at_exit(True)  -- turns back on exit-time persistence data saving
     .save_at_exit()  -- returns whether exit-time persistence data saving is
@@ -128,13 +138,28 @@ USE PROCEDURES:
   Any changes you make to the dictionary, will be automatically saved
   when the program exits.
 
-  /!\\ WARNING: This system is NOT durable!  If the process dies for
-      any reason, including power-outtage, while the process is in the
-      middle of writing the JSON data, then the JSON data will be
-      corrupted, and there is no back-up.
-
-      In the future, I intend to write a more durable data storage
-      component.  This is just the "basic" JSON persistence system.
+  The file is saved by writing a temporary file beside it, and then
+  renaming that over it, so if the process dies in the middle of a
+  save, the file is left as it was.  But all changes since the last
+  save are lost; for a record of each change as it is made, see the
+  chassis2024.journalpersistence component.
+
+  That holds if the process dies; if the whole system does (power is
+  lost, say), the rename can reach the disk before the data, and leave
+  an empty or partial file.  With FSYNC set to True (or LOCKING, which
+  implies it), the temporary file is flushed to the disk before it is
+  renamed, which rules that out -- at the cost of waiting on the disk,
+  at every save.  It is off by default, since with AUTOSAVE, saves can
+  come every second.
+
+  Several processes can share one file.  With LOCKING set to True in
+  the execution spec, reading and saving hold an advisory lock (on
+  FILEPATH + ".lock") so that they don't interleave; but the last
+  process to save still overwrites the others' saves.  With MERGE set
+  to True (which implies LOCKING), a save first reads the file, and if
+  another process has saved it since, merges its changes in, key by
+  key: keys that only the other process changed take its values, and
+  keys that this process changed keep this process's values.
 
   If you want to save the data in the middle of execution:
 
@@ -142,6 +167,118 @@ USE PROCEDURES:
   chassis2024.interface(PERSISTENCE_DATA, required=True).save()
   ----------------------------------------------------------------------
 
+  Saving only writes the file if the data has changed since it was
+  loaded or last saved.  How that is determined is set by
+  CHANGE_DETECTION in the execution spec:
+
+    HASH  -- (default) the data is serialized, and a hash of the result
+             is compared with that of the file as loaded or last saved;
+             this catches every change, but every save (and the one
+             at exit) still serializes and hashes the whole data set --
+             only the write is skipped
+    TRACKED  -- the dictionary's own record of changed top-level keys is
+                trusted; an unchanged save costs nothing, but changes
+                made deep within a value must be reported, by calling
+                .data().touch(key)
+
+  HASH stays the default because it is the compatible choice: a program
+  that changes values in place, without touching them, has every change
+  saved.  Programs that touch what they change should set TRACKED, for
+  saves that cost what the changes do, rather than what the data does.
+
+  For a large file, of which a program uses only a little, set
+  LAZY_LOAD to True in the execution spec.  The file is then mapped
+  into memory, and only indexed, when it is read; each top-level value
+  is decoded the first time it is accessed.  When saving, the bytes of
+  values that were never accessed are copied through, as they were,
+  and the new file is written beside the old one and renamed over it.
+  The index is kept beside the file (FILEPATH + ".index"), so that
+  while the file is unchanged, it needn't even be scanned.
+  .data() is then a chassis2024.lazyjson.LazyJSONDict, which is a
+  mapping, but not a dict.
+
+  The file needn't be JSON, despite this component's name.  Set CODEC
+  in the execution spec to CODEC_FAST_JSON (orjson, if installed),
+  CODEC_MARSHAL, or CODEC_PICKLE (both binary, and only for trusted
+  local data), and COMPRESSION to COMPRESSION_ZLIB or COMPRESSION_LZMA
+  (with COMPRESSION_LEVEL, if wanted) to compress it.  See
+  chassis2024.codec, which can also convert a file between formats:
+
+    python -m chassis2024.codec a.json a.json.xz --to-compression LZMA
+
+  With SHARDS in the execution spec, FILEPATH names a folder, rather
+  than a file, holding the data in shard files, and a manifest (see
+  chassis2024.shards): SHARDS: SHARD_PER_KEY gives each top-level key
+  a file of its own, and SHARDS: n divides the keys among n files, by
+  hash.  A save then only writes the shards that have changed.  With
+  LAZY_LOAD as well, each shard is loaded when one of its keys is
+  first accessed, and .data() is a chassis2024.shards.ShardedDict.
+  Changing SHARDS (or CODEC, or COMPRESSION) rewrites every shard, the
+  next time the data is saved.
+
+  For a large data set of many small records, set COMPACT to True in
+  the execution spec, and the data is made more compact in memory as
+  it is read (see chassis2024.compact): equal strings are shared, and
+  lists of only ints, or only floats, become array.array's.  They are
+  written back out as lists.  .memory_report() tells how much memory
+  that saved.  An array works like a list, but only holds numbers of
+  its kind, and doesn't compare equal to a list.  COMPACT needs a JSON
+  codec, and doesn't work with LAZY_LOAD, SHARDS, or MERGE.
+
+  To find records by a field, without scanning every value, declare
+  indexes in the execution spec:
+
+    INDEXES: {"by_email": "email",
+              "by_city": ["address", "city"]}
+
+  Each index is built when the data is read, and kept up to date with
+  the changes made to the dictionary (including .touch(key)).  Look
+  records up by the field's value:
+
+  ----------------------------------------------------------------------
+  P = chassis2024.interface(PERSISTENCE_DATA, required=True)
+  keys = P.index("by_city").lookup("Oslo")  # [key, ...]
+  keys = P.index("by_city").range("A", "M")  # "A" <= city < "M"
+  ----------------------------------------------------------------------
+
+  With PERSIST_INDEXES set to True, the indexes are written beside the
+  file (FILEPATH + ".indexes") at termination, and read back, rather
+  than built, the next time -- if the file hasn't changed since.  See
+  chassis2024.indexes.  Building an index decodes every value, so under
+  LAZY_LOAD or SHARDS, it loads the whole data set; persisted indexes
+  don't.
+
+  A long-running program can have the data saved in the background, by
+  setting AUTOSAVE to True in the execution spec.  Each change to the
+  dictionary (and each .touch(key)) is noted, and the data is saved on
+  a thread of its own once changes have stopped coming for
+  AUTOSAVE_DEBOUNCE seconds (default: 1), or AUTOSAVE_MAX_DELAY seconds
+  (default: 10) after the first unsaved change, whichever is sooner.
+  Saves never overlap, and the termination callback waits for one in
+  progress before the final save.  The snapshot is taken by json.dumps,
+  which (for plain JSON data, using the standard library's C encoder)
+  runs without letting another thread in; with LAZY_LOAD, each value
+  is consistent, but values changed while saving may be saved as of
+  either side of the change, until the next save.
+
+  Saving ordinarily writes the file before .save() returns.  With
+  SNAPSHOT in the execution spec, .save() only takes a snapshot of the
+  data, and the file is written in the background, so that the program
+  can go on changing the data meanwhile (see chassis2024.snapshot):
+
+    SNAPSHOT_KEYS  -- each top-level value's encoding is kept from save
+                      to save, and (with CHANGE_DETECTION: TRACKED) only
+                      the keys changed since are encoded again; the
+                      encodings are joined, and written, on a thread
+                      (CODEC_JSON or CODEC_FAST_JSON only)
+    SNAPSHOT_FORK  -- the process fork()s, and the child encodes and
+                      writes the data, as it was at the fork (POSIX
+                      only; a save waits for the previous child)
+
+  .flush() waits for the write, and raises its failure, if it failed;
+  the termination callback flushes.  SNAPSHOT doesn't work with
+  LAZY_LOAD, SHARDS, or MERGE.
+
   Exit-time saving is on by default.  This can be overridden in the
   execution spec.  It can also be toggled manually:
 
@@ -157,12 +294,33 @@ USE PROCEDURES:
 """
 
 
+import os
 import sys
 import json
+import mmap
+import hashlib
 import pathlib
+import threading
+import contextlib
+
+try:
+    import fcntl
+except ImportError:  # (Windows)
+    fcntl = None
+    import msvcrt
 
 import chassis2024
 from chassis2024.words import *
+from chassis2024.tracked import TrackedDict
+from chassis2024 import lazyjson
+from chassis2024.lazyjson import LazyJSONDict
+from chassis2024.autosave import Autosaver
+from chassis2024 import codec
+from chassis2024 import compact
+from chassis2024.indexes import Indexes
+from chassis2024 import shards
+from chassis2024.shards import ShardedDict
+from chassis2024.snapshot import KeySnapshot, BackgroundWriter, ForkWriter
 
 from ..words import *
 from .words import *
@@ -183,6 +341,8 @@ CHASSIS2024_SPEC = {
     INTERFACES: {PERSISTENCE_DATA: sys.modules[__name__]}
 }
 
+chassis2024.register(sys.modules[__name__])
+
 
 # constants
 
@@ -193,15 +353,87 @@ kDEFAULT_CREATE_FOLDER_POLICY = False
 
 kDEFAULT_SAVE_AT_EXIT = True
 
-kARGPARSE_PERSISTENCE_FILE_FILEPATH = "persistence_file_filepath"
+kDEFAULT_CHANGE_DETECTION = HASH
+
+kDEFAULT_LAZY_LOAD = False
+
+kINDEX_SUFFIX = ".index"  # (LAZY_LOAD keeps the file's index beside it)
+
+kDEFAULT_CODEC = CODEC_JSON
+
+kDEFAULT_COMPRESSION = COMPRESSION_NONE
+
+kDEFAULT_LOCKING = False
+
+kDEFAULT_MERGE = False
+
+kDEFAULT_FSYNC = False
+
+kLOCK_SUFFIX = ".lock"  # (LOCKING locks a file of this name, beside it)
+
+_ABSENT = object()  # (a key's "value," in a merge, when it isn't there)
 
+kDEFAULT_AUTOSAVE = False
 
-# globals
+kDEFAULT_AUTOSAVE_DEBOUNCE = 1.0  # seconds
 
-_data = None  # the data (will be a dictionary) kept in RAM
-_save_at_exit = None  # whether to save at exit, or not [bool]
-_filepath = None  # filepath to the persistence file [pathlib.Path]
-_initial_cwd = None  # initial CWD [pathlib.Path]
+kDEFAULT_AUTOSAVE_MAX_DELAY = 10.0  # seconds
+
+kDEFAULT_SNAPSHOT = SNAPSHOT_NONE
+
+kDEFAULT_COMPACT = False
+
+kDEFAULT_PERSIST_INDEXES = False
+
+kINDEXES_SUFFIX = ".indexes"  # (PERSIST_INDEXES keeps them beside it)
+
+kARGPARSE_PERSISTENCE_FILE_FILEPATH = "persistence_file_filepath"
+
+
+# state (one per chassis; see chassis.Chassis.component_state)
+
+class _State:
+    def __init__(self):
+        self.data = None  # the data (will be a dictionary) kept in RAM
+        self.save_at_exit = None  # whether to save at exit, or not [bool]
+        self.filepath = None  # filepath to the persistence file [pathlib.Path]
+        self.initial_cwd = None  # initial CWD [pathlib.Path]
+        self.change_detection = None  # HASH or TRACKED
+        self.digest = None  # hash of the file's contents, as last read/written
+        self.lazy_load = None  # whether to index, rather than decode, the file
+        self.mmap = None  # the file, mapped into memory (LAZY_LOAD only)
+        self.codec = None  # CODEC_JSON, CODEC_FAST_JSON, ... (see codec.py)
+        self.compression = None  # COMPRESSION_NONE, COMPRESSION_ZLIB, ...
+        self.compression_level = None  # None, or an int, per compression
+        self.locking = None  # whether to lock the file, to read & save [bool]
+        self.merge = None  # whether to merge others' saves, on saving [bool]
+        self.fsync = None  # whether to flush saves to the disk [bool]
+        self.base_raw = None  # the file's bytes, as last read/written (MERGE)
+        self.shards = None  # None, SHARD_PER_KEY, or a number of buckets
+        self.shard_format = None  # (shards, codec, compression) on disk
+        self.shard_files = None  # {filename: [key, ...]} on disk
+        self.shard_tag = None  # the shard filenames' tag on disk ("": none)
+        self.shard_digests = None  # {filename: digest} on disk
+        self.autosave = None  # whether to save in the background [bool]
+        self.autosave_debounce = None  # seconds [float]
+        self.autosave_max_delay = None  # seconds [float]
+        self.autosaver = None  # the background saver (AUTOSAVE only)
+        self.snapshot = None  # SNAPSHOT_NONE, SNAPSHOT_KEYS, SNAPSHOT_FORK
+        self.key_snapshot = None  # encodings, by key (SNAPSHOT_KEYS only)
+        self.writer = None  # BackgroundWriter, or ForkWriter (SNAPSHOT only)
+        self.compact = None  # whether to compact the data, as read [bool]
+        self.memory_report = None  # compact.compact()'s report (COMPACT)
+        self.index_specs = None  # {name: field path}
+        self.persist_indexes = None  # whether to keep indexes in a file
+        self.indexes = None  # the indexes [indexes.Indexes], if any
+        self.lock = threading.RLock()  # held while saving
+
+    def format(self):
+        """Return (shards, codec, compression), as configured."""
+        return (self.shards, self.codec, self.compression)
+
+def _state():
+    return chassis2024.chassis.current().component_state(__name__, _State)
 
 
 # convert a string path to a pathlib.Path
@@ -217,7 +449,7 @@ def _str_to_path(str_path):
     """
     p = pathlib.Path(str_path).expanduser()
     if not p.is_absolute():
-        return _initial_cwd / p
+        return _state().initial_cwd / p
     else:
         return p
 
@@ -246,6 +478,75 @@ def _execution_spec_save_at_exit():
     """Return execution spec's SAVE_AT_EXIT, or else None."""
     return (_execution_spec_section() or {}).get(SAVE_AT_EXIT)
 
+def _execution_spec_lazy_load():
+    """Return execution spec's LAZY_LOAD, or else None."""
+    return (_execution_spec_section() or {}).get(LAZY_LOAD)
+
+def _execution_spec_codec():
+    """Return execution spec's CODEC, or else the default."""
+    return (_execution_spec_section() or {}).get(CODEC) or kDEFAULT_CODEC
+
+def _execution_spec_compression():
+    """Return execution spec's COMPRESSION, or else the default."""
+    return ((_execution_spec_section() or {}).get(COMPRESSION) or
+            kDEFAULT_COMPRESSION)
+
+def _execution_spec_compression_level():
+    """Return execution spec's COMPRESSION_LEVEL, or else None."""
+    return (_execution_spec_section() or {}).get(COMPRESSION_LEVEL)
+
+def _execution_spec_shards():
+    """Return execution spec's SHARDS, or else None."""
+    return (_execution_spec_section() or {}).get(SHARDS)
+
+def _execution_spec_locking():
+    """Return execution spec's LOCKING, or else None."""
+    return (_execution_spec_section() or {}).get(LOCKING)
+
+def _execution_spec_merge():
+    """Return execution spec's MERGE, or else None."""
+    return (_execution_spec_section() or {}).get(MERGE)
+
+def _execution_spec_fsync():
+    """Return execution spec's FSYNC, or else None."""
+    return (_execution_spec_section() or {}).get(FSYNC)
+
+def _execution_spec_autosave():
+    """Return execution spec's AUTOSAVE, or else None."""
+    return (_execution_spec_section() or {}).get(AUTOSAVE)
+
+def _execution_spec_autosave_debounce():
+    """Return execution spec's AUTOSAVE_DEBOUNCE, or else the default."""
+    seconds = (_execution_spec_section() or {}).get(AUTOSAVE_DEBOUNCE)
+    return kDEFAULT_AUTOSAVE_DEBOUNCE if seconds is None else seconds
+
+def _execution_spec_autosave_max_delay():
+    """Return execution spec's AUTOSAVE_MAX_DELAY, or else the default."""
+    seconds = (_execution_spec_section() or {}).get(AUTOSAVE_MAX_DELAY)
+    return kDEFAULT_AUTOSAVE_MAX_DELAY if seconds is None else seconds
+
+def _execution_spec_snapshot():
+    """Return execution spec's SNAPSHOT, or else the default."""
+    return ((_execution_spec_section() or {}).get(SNAPSHOT) or
+            kDEFAULT_SNAPSHOT)
+
+def _execution_spec_compact():
+    """Return execution spec's COMPACT, or else None."""
+    return (_execution_spec_section() or {}).get(COMPACT)
+
+def _execution_spec_indexes():
+    """Return execution spec's INDEXES, or else an empty dictionary."""
+    return (_execution_spec_section() or {}).get(INDEXES) or {}
+
+def _execution_spec_persist_indexes():
+    """Return execution spec's PERSIST_INDEXES, or else None."""
+    return (_execution_spec_section() or {}).get(PERSIST_INDEXES)
+
+def _execution_spec_change_detection():
+    """Return execution spec's CHANGE_DETECTION, or else the default."""
+    return ((_execution_spec_section() or {}).get(CHANGE_DETECTION) or
+            kDEFAULT_CHANGE_DETECTION)
+
 
 # ARGPARSE module cooperation
 
@@ -274,7 +575,7 @@ def _commandline_persistence_file_filepath():
         return _str_to_path(p) if p else None
 
 
-# creating parent folders for _filepath, if required
+# creating parent folders for the filepath, if required
 
 def _create_folder_policy():
     """First, check the execution spec.  If not specified, return default."""
@@ -289,70 +590,606 @@ def _create_folder_policy():
         return policy  # True or False
 
 def _create_folder():
-    if not _filepath.parent.exists():
-        _filepath.parent.mkdir(parents=True)
+    filepath = _state().filepath
+    if not filepath.parent.exists():
+        filepath.parent.mkdir(parents=True)
 
 
 # entry
 
 def perform_execution_graph_node(n):
-    global _initial_cwd, _save_at_exit, _data, _filepath
+    S = _state()
     if n == CLEAR_BASICJSONPERSISTENCE:
-        _data = None
-        _save_at_exit = None
-        _filepath = None
-        _initial_cwd = pathlib.Path.cwd()
+        S.data = None
+        S.save_at_exit = None
+        S.filepath = None
+        S.initial_cwd = pathlib.Path.cwd()
         
     elif n == RESET_BASICJSONPERSISTENCE:
-        _data = None
-        _filepath = None
+        S.data = None
+        S.filepath = None
         # Take SAVE_AT_EXIT from the execution spec is defined,
         # otherwise, use kDEFAULT_SAVE_AT_EXIT.
         val = _execution_spec_save_at_exit()
-        _save_at_exit = kDEFAULT_SAVE_AT_EXIT if val is None else val
+        S.save_at_exit = kDEFAULT_SAVE_AT_EXIT if val is None else val
+        S.change_detection = _execution_spec_change_detection()
+        if S.change_detection not in (HASH, TRACKED):
+            raise ValueError(S.change_detection)
+        val = _execution_spec_lazy_load()
+        S.lazy_load = kDEFAULT_LAZY_LOAD if val is None else val
+        S.codec = _execution_spec_codec()
+        S.compression = _execution_spec_compression()
+        S.compression_level = _execution_spec_compression_level()
+        codec.check(S.codec, S.compression)
+        S.shards = _execution_spec_shards()
+        if S.shards is not None:
+            shards.check(S.shards)
+        elif S.lazy_load and (S.codec, S.compression) != (CODEC_JSON,
+                                                          COMPRESSION_NONE):
+            raise ValueError("LAZY_LOAD requires uncompressed CODEC_JSON")
+        val = _execution_spec_merge()
+        S.merge = kDEFAULT_MERGE if val is None else val
+        if S.merge and (S.lazy_load or S.shards is not None):
+            raise ValueError("MERGE doesn't work with LAZY_LOAD or SHARDS")
+        val = _execution_spec_locking()
+        S.locking = kDEFAULT_LOCKING if val is None else val
+        S.locking = S.locking or S.merge  # (MERGE implies LOCKING)
+        val = _execution_spec_fsync()
+        S.fsync = kDEFAULT_FSYNC if val is None else val
+        S.fsync = S.fsync or S.locking  # (LOCKING implies FSYNC)
+        val = _execution_spec_autosave()
+        S.autosave = kDEFAULT_AUTOSAVE if val is None else val
+        S.autosave_debounce = _execution_spec_autosave_debounce()
+        S.autosave_max_delay = _execution_spec_autosave_max_delay()
+        S.snapshot = _execution_spec_snapshot()
+        if S.snapshot not in (SNAPSHOT_NONE, SNAPSHOT_KEYS, SNAPSHOT_FORK):
+            raise ValueError(S.snapshot)
+        if S.snapshot != SNAPSHOT_NONE and (S.lazy_load or S.merge or
+                                            S.shards is not None):
+            raise ValueError("SNAPSHOT doesn't work with LAZY_LOAD, "
+                             "SHARDS, or MERGE")
+        if S.snapshot == SNAPSHOT_FORK and not hasattr(os, "fork"):
+            raise ValueError("SNAPSHOT_FORK requires os.fork()")
+        val = _execution_spec_compact()
+        S.compact = kDEFAULT_COMPACT if val is None else val
+        if S.compact and (S.lazy_load or S.merge or S.shards is not None):
+            raise ValueError("COMPACT doesn't work with LAZY_LOAD, "
+                             "SHARDS, or MERGE")
+        if S.compact and S.codec not in (CODEC_JSON, CODEC_FAST_JSON):
+            raise ValueError("COMPACT requires CODEC_JSON or CODEC_FAST_JSON")
+        S.index_specs = _execution_spec_indexes()
+        if not isinstance(S.index_specs, dict):
+            raise ValueError(S.index_specs)
+        val = _execution_spec_persist_indexes()
+        S.persist_indexes = kDEFAULT_PERSIST_INDEXES if val is None else val
 
     elif n == READ_BASICJSONPERSISTENCE:
         # First, make sure that while closing down, that the data is saved.
         chassis2024.chassis.call_before_termination(_do_final_save)
 
         # Set default values.
-        _data = {}
-        _filepath = _str_to_path(kDEFAULT_PERSISTENCE_FILEPATH)
+        S.data = TrackedDict()
+        S.digest = None
+        S.base_raw = None
+        S.memory_report = None
+        S.filepath = _str_to_path(kDEFAULT_PERSISTENCE_FILEPATH)
         
         # override from execution spec, if available.
-        _filepath = _execution_spec_persistence_file_filepath() or _filepath
+        S.filepath = _execution_spec_persistence_file_filepath() or S.filepath
 
         # override from CLI args, if available
-        _filepath = _commandline_persistence_file_filepath() or _filepath
+        S.filepath = _commandline_persistence_file_filepath() or S.filepath
         
         # Read it (if the file exists)
-        if _filepath.exists():
-            _data.clear()
-            _data.update(json.load(open(_filepath)))
+        if S.shards is not None:
+            _read_shards()
+        elif S.lazy_load:
+            _read_lazily()
+        else:
+            with _file_lock():
+                raw = _read_raw()
+            if raw is not None:
+                dict.update(S.data, codec.decode(raw, S.codec))
+                if S.compact:
+                    S.memory_report = compact.compact(S.data)
+                S.data.reset_changes()
+                S.digest = _digest(raw)
+                S.base_raw = raw if S.merge else None
+
+        # Index the data.
+        S.indexes = None
+        if S.index_specs:
+            S.indexes = Indexes(S.index_specs)
+            if S.persist_indexes and _indexes_source().exists():
+                S.indexes.read(_indexes_filepath(), _indexes_source())
+            S.indexes.watch(S.data)
+
+        # Write saves in the background, from a snapshot.
+        if S.snapshot == SNAPSHOT_KEYS:
+            S.key_snapshot = KeySnapshot(S.codec)
+            S.writer = BackgroundWriter()
+        elif S.snapshot == SNAPSHOT_FORK:
+            S.writer = ForkWriter()
+
+        # Save in the background, a little while after changes stop.
+        if S.autosave:
+            S.autosaver = Autosaver(save,
+                                    S.autosave_debounce,
+                                    S.autosave_max_delay)
+            S.data.on_change = S.autosaver.notify
+            S.autosaver.start()
+
+def _digest(raw):
+    return hashlib.sha256(raw).digest()
+
+def _read_raw():
+    """Return the file's (decompressed) bytes, or None if there's no file."""
+    S = _state()
+    try:
+        f = open(S.filepath, "rb")
+    except FileNotFoundError:
+        return None
+    with f:
+        return codec.read(f, S.compression)
+
+
+# sharing the file with other processes
+
+@contextlib.contextmanager
+def _file_lock():
+    """Hold the advisory lock on the persistence file (if LOCKING.)
+
+    The lock is taken on a file of its own (FILEPATH + ".lock"), since
+    the persistence file itself is replaced, not rewritten, on saving.
+    """
+    S = _state()
+    lock_filepath = S.filepath.with_name(S.filepath.name + kLOCK_SUFFIX)
+    if not S.locking or not lock_filepath.parent.exists():
+        yield
+        return
+    with open(lock_filepath, "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+def _write_temporary(write, filepath=None):
+    """Write a temporary file beside the file, via write(f); return its path.
+
+    (With FSYNC, it is fsync'ed, so that once renamed over the file, even
+     a system crash can leave only the old file, or the new one.)
+    """
+    S = _state()
+    filepath = filepath or S.filepath
+    tmp_filepath = filepath.with_name("%s.%d.%d.tmp" % (filepath.name,
+                                                        os.getpid(),
+                                                        threading.get_ident()))
+    try:
+        with open(tmp_filepath, "wb") as f:
+            write(f)
+            if S.fsync:
+                f.flush()
+                os.fsync(f.fileno())
+    except BaseException:
+        _remove(tmp_filepath)
+        raise
+    return tmp_filepath
+
+def _replace(tmp_filepath, filepath=None):
+    try:
+        os.replace(tmp_filepath, filepath or _state().filepath)
+    except BaseException:
+        _remove(tmp_filepath)
+        raise
+
+def _remove(filepath):
+    try:
+        os.remove(filepath)
+    except OSError:
+        pass
+
+def _merge():
+    """Fold into the data the changes others have saved to the file.
+
+    It's a three-way merge, key by key, between the data as it was last
+    read or saved (the base), the data as it is now (mine), and the data
+    in the file (theirs).  A key only they changed takes their value; a
+    key both changed keeps mine.  Returns the digest of the file.
+    """
+    S = _state()
+    raw = _read_raw()
+    if raw is None:
+        return None
+    digest = _digest(raw)
+    if digest == S.digest:
+        return digest  # (nobody else has saved since)
+    theirs = codec.decode(raw, S.codec)
+    base = codec.decode(S.base_raw, S.codec) if S.base_raw else {}
+    for key in list(theirs) + [key for key in base if key not in theirs]:
+        b = base.get(key, _ABSENT)
+        t = theirs.get(key, _ABSENT)
+        if t == b:
+            continue  # (they didn't change it)
+        if dict.get(S.data, key, _ABSENT) == b:
+            # (only they changed it; it isn't a change of ours to record)
+            if t is _ABSENT:
+                dict.pop(S.data, key)
+            else:
+                dict.__setitem__(S.data, key, t)
+            if S.indexes is not None:
+                S.indexes.changed(key)
+    return digest
+
+def _indexes_filepath():
+    filepath = _state().filepath
+    return filepath.with_name(filepath.name + kINDEXES_SUFFIX)
+
+def _indexes_source():
+    """Return the file whose contents the indexes describe."""
+    S = _state()
+    if S.shards is not None:
+        return S.filepath / shards.kMANIFEST_FILENAME
+    return S.filepath
+
+def _write_indexes(saved):
+    """Keep the indexes beside the file, if they describe it as it is.
+
+    saved tells whether the data was just saved (and so is the file.)
+    """
+    S = _state()
+    if S.indexes is None or not S.persist_indexes:
+        return
+    if _indexes_source().exists() and (saved or not dirty()):
+        S.indexes.write(_indexes_filepath(), _indexes_source())
+
+def _map(filepath):
+    with open(filepath, "rb") as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+def _index_filepath():
+    filepath = _state().filepath
+    return filepath.with_name(filepath.name + kINDEX_SUFFIX)
+
+def _read_lazily():
+    S = _state()
+    S.mmap = None
+    S.data = LazyJSONDict()
+    with _file_lock():
+        if S.filepath.exists():
+            S.mmap = _map(S.filepath)
+            entries = lazyjson.read_index(_index_filepath(), S.filepath)
+            S.data = LazyJSONDict(S.mmap, entries)
+            if entries is None:
+                lazyjson.write_index(_index_filepath(), S.filepath,
+                                     S.data.index())
+
+def _save_lazily():
+    S = _state()
+    if S.mmap is not None:
+        if S.change_detection == TRACKED:
+            unchanged = not S.data.dirty()
+        else:
+            unchanged = S.data.unchanged()
+        if unchanged:
+            S.data.reset_changes()
+            return
+    if _create_folder_policy():
+        _create_folder()
+    with _resetting_changes(S.data), _file_lock():
+        raw, spans = S.data.encode()
+        tmp_filepath = _write_temporary(lambda f: f.write(raw))
+        with S.data.lock:
+            # (Windows won't replace a file that is mapped into memory)
+            if S.mmap is not None:
+                S.mmap.close()
+            try:
+                _replace(tmp_filepath)
+            except BaseException:
+                S.mmap = _map(S.filepath) if S.filepath.exists() else None
+                S.data.rebase(S.mmap, S.data.spans)
+                raise
+            S.mmap = _map(S.filepath)
+            S.data.rebase(S.mmap, spans)
+        lazyjson.write_index(_index_filepath(), S.filepath, S.data.index())
+
+def _read_shards():
+    S = _state()
+    S.shard_format = None
+    S.shard_files = {}
+    S.shard_tag = ""
+    S.shard_digests = {}
+    with _file_lock():
+        M = shards.read_manifest(S.filepath) if S.filepath.is_dir() else None
+    if M is not None:
+        S.shard_format = (M[shards.kSHARDS],
+                          M[shards.kCODEC],
+                          M[shards.kCOMPRESSION])
+        S.shard_files = M[shards.kFILES]
+        S.shard_tag = M.get(shards.kTAG, "")
+    (shard_codec, shard_compression) = (S.shard_format or S.format())[1:]
+    def load(name):
+        D, raw = shards.read_shard(S.filepath / name,
+                                   shard_codec, shard_compression)
+        S.shard_digests[name] = _digest(raw)
+        return D
+    if S.lazy_load:
+        S.data = ShardedDict(S.shard_files, load)
+    else:
+        for name in S.shard_files:
+            dict.update(S.data, load(name))
+        S.data.reset_changes()
+
+def _shards_to_write(changed, cleared):
+    """Return (assigned, writes, removes) for saving the data as shards.
+
+    changed and cleared are the data's record of changes (which has to
+    be taken before it is reset, and the data serialized; see
+    _resetting_changes.)
+
+    assigned is {filename: [key, ...]}, for the shards whose keys have
+    changed (every shard, if all are to be rewritten); writes is
+    {filename: raw bytes} of the shards that have changed, and removes
+    is [filename, ...] of the shards that are no longer needed.
+
+    Every key added or deleted is in changed (or else the data was
+    cleared), so, short of rewriting everything, only the changed keys
+    are assigned to shards afresh.
+    """
+    S = _state()
+    tag = _shard_tag()
+    rewrite_all = S.shard_format != S.format() or cleared
+    if rewrite_all:
+        assigned = shards.assign(list(S.data), S.shards, tag)
+        # (and any shards left by a rewrite that was cut short)
+        on_disk = (set(S.shard_files) |
+                   {p.name for p in S.filepath.glob("*.shard")})
+        removes = sorted(name for name in on_disk if name not in assigned)
+        candidates = set(assigned)
+    else:
+        assigned = shards.reassign(S.shard_files, S.shards, changed, S.data,
+                                   tag)
+        removes = [name for (name, keys) in assigned.items() if not keys]
+        if S.change_detection == TRACKED:
+            candidates = {shards.filename(key, S.shards, tag)
+                          for key in changed}
+        elif S.lazy_load:  # (only loaded shards can have changed)
+            candidates = ((set(S.shard_files) - S.data.unloaded_files()) |
+                          set(assigned))
+        else:
+            candidates = set(S.shard_files) | set(assigned)
+        candidates -= set(removes)
+    writes = {}
+    for name in candidates:
+        keys = assigned[name] if name in assigned else S.shard_files[name]
+        raw = codec.encode(_shard_contents(keys), S.codec)
+        if rewrite_all or _digest(raw) != S.shard_digests.get(name):
+            writes[name] = raw
+    return assigned, writes, removes
+
+def _shard_tag():
+    """Return the tag for the names of the shards to be written.
+
+    A new format gets a new tag, so that its shards don't overwrite the
+    old ones, which the manifest on disk still describes.
+    """
+    S = _state()
+    if S.shard_format is None or S.shard_format == S.format():
+        return S.shard_tag
+    return shards.format_tag(*S.format())
+
+def _shard_contents(keys):
+    S = _state()
+    D = {}
+    for key in keys:
+        try:
+            D[key] = S.data[key]
+        except KeyError:
+            pass  # (listed, but missing from its shard; see ShardedDict)
+    return D
+
+def _save_shards():
+    S = _state()
+    if (S.change_detection == TRACKED and S.shard_format is not None and
+        not S.data.dirty()):
+        return
+    if _create_folder_policy():
+        _create_folder()
+    changed, cleared = S.data.changed, S.data.cleared
+    with _resetting_changes(S.data), _file_lock():
+        assigned, writes, removes = _shards_to_write(changed, cleared)
+        reassigned = S.shard_format != S.format() or assigned or removes
+        if not reassigned and not writes:
+            return
+        S.filepath.mkdir(exist_ok=True)
+        for (name, raw) in writes.items():
+            filepath = S.filepath / name
+            _replace(_write_temporary(
+                lambda f: codec.write(f, raw, S.compression,
+                                      S.compression_level),
+                filepath), filepath)
+            S.shard_digests[name] = _digest(raw)
+        if not reassigned:
+            return  # (the manifest still describes the shards)
+        files = dict(S.shard_files)
+        files.update(assigned)
+        for name in removes:
+            del files[name]
+        # (the manifest goes after the shards it lists, and before the
+        #  shards it no longer lists are removed)
+        filepath = S.filepath / shards.kMANIFEST_FILENAME
+        tag = _shard_tag()
+        M = shards.manifest(S.shards, S.codec, S.compression, files, tag)
+        _replace(_write_temporary(
+            lambda f: f.write(json.dumps(M).encode("utf-8")),
+            filepath), filepath)
+        for name in removes:
+            _remove(S.filepath / name)
+            S.shard_digests.pop(name, None)
+        S.shard_files = files
+        S.shard_format = S.format()
+        S.shard_tag = tag
+
+def _save_snapshot():
+    """Take a snapshot of the data, and have it written in the background."""
+    S = _state()
+    if S.snapshot == SNAPSHOT_FORK:
+        S.writer.poll()  # (for the digest of what it wrote)
+    if (S.change_detection == TRACKED and S.digest is not None and
+        not S.data.dirty()):
+        return
+    if _create_folder_policy():
+        _create_folder()
+    changed = S.data.changed
+    if S.change_detection == HASH or S.data.cleared:
+        changed = None  # (re-encode everything)
+    with _resetting_changes(S.data):
+        if S.snapshot == SNAPSHOT_KEYS:
+            items = S.key_snapshot.take(S.data, changed)
+            S.writer.submit(lambda: _write_in_thread(
+                lambda: S.key_snapshot.join(items)))
+        else:
+            S.writer.submit(lambda: _write_snapshot(
+                codec.encode(S.data, S.codec)), _written)
+
+def _write_snapshot(raw):
+    """Write raw to the file, unless it is what's there; return its digest."""
+    S = _state()
+    digest = _digest(raw)
+    with _file_lock():
+        if digest != S.digest:
+            _replace(_write_temporary(
+                lambda f: codec.write(f, raw, S.compression,
+                                      S.compression_level)))
+    return digest
+
+def _write_in_thread(encode):
+    S = _state()
+    try:
+        S.digest = _write_snapshot(encode())
+    except BaseException:
+        S.digest = None  # (so that the next save writes it, regardless)
+        raise
+
+def _written(digest):
+    """Record the digest, from a fork()'ed writer, of what it wrote."""
+    _state().digest = digest or None
+
+@contextlib.contextmanager
+def _resetting_changes(D):
+    """Reset D's record of changes; restore it, if saving fails.
+
+    (It is reset before the data is serialized, so that a change made
+     meanwhile, by another thread, is saved again next time, not lost.)
+    """
+    changed, cleared = D.changed, D.cleared
+    D.reset_changes()
+    try:
+        yield
+    except BaseException:
+        D.changed |= changed
+        D.cleared = D.cleared or cleared
+        raise
 
 def _do_final_save():
-    if _save_at_exit:
-        save()
+    S = _state()
+    saved = False
+    try:
+        if S.autosaver is not None:
+            S.data.on_change = None
+            S.autosaver.stop()  # (re-raises a background save's failure)
+    finally:
+        S.autosaver = None
+        try:
+            if S.save_at_exit:
+                save()
+                saved = True
+        finally:
+            if S.writer is not None:
+                writer, S.writer = S.writer, None
+                writer.stop()  # (re-raises a background write's failure)
+        _write_indexes(saved)
 
 
 # interface PERSISTENCE_DATA
 
 def data():
-    return _data
+    return _state().data
 
 def save():
-    if _create_folder_policy():
-        _create_folder()
-    json.dump(_data, open(_filepath, "w"))
+    S = _state()
+    with S.lock:
+        if S.shards is not None:
+            _save_shards()
+            return
+        elif S.lazy_load:
+            _save_lazily()
+            return
+        elif S.snapshot != SNAPSHOT_NONE:
+            _save_snapshot()
+            return
+        if (S.change_detection == TRACKED and S.digest is not None and
+            not S.data.dirty()):
+            return
+        if _create_folder_policy():
+            _create_folder()
+        with _resetting_changes(S.data), _file_lock():
+            file_digest = _merge() if S.merge else S.digest
+            raw = codec.encode(S.data, S.codec)
+            digest = _digest(raw)
+            if digest != file_digest:
+                _replace(_write_temporary(
+                    lambda f: codec.write(f, raw, S.compression,
+                                          S.compression_level)))
+            S.digest = digest
+            S.base_raw = raw if S.merge else None
+
+def dirty():
+    S = _state()
+    if S.shards is not None and S.change_detection == TRACKED:
+        return S.shard_format is None or S.data.dirty()
+    elif S.shards is not None:
+        assigned, writes, removes = _shards_to_write(S.data.changed,
+                                                     S.data.cleared)
+        return bool(S.shard_format != S.format() or
+                    assigned or writes or removes)
+    elif S.lazy_load and S.change_detection == TRACKED:
+        return S.mmap is None or S.data.dirty()
+    elif S.change_detection == TRACKED:
+        return S.digest is None or S.data.dirty()
+    elif S.lazy_load:
+        return S.mmap is None or not S.data.unchanged()
+    return _digest(codec.encode(S.data, S.codec)) != S.digest
+
+def index(name):
+    S = _state()
+    if S.indexes is None:
+        raise KeyError(name)
+    return S.indexes[name]
+
+def memory_report():
+    return _state().memory_report
+
+def flush():
+    S = _state()
+    if S.writer is not None:
+        S.writer.flush()
 
 def save_at_exit(set_to=None):
-    global _save_at_exit
+    S = _state()
     if set_to is None:
-        return _save_at_exit
+        return S.save_at_exit
     elif set_to == True:
-        _save_at_exit = True
+        S.save_at_exit = True
     elif set_to == False:
-        _save_at_exit = False
+        S.save_at_exit = False
     else:
         raise ValueError(set_to)
-
@@ -18,4 +18,42 @@ BASICJSONPERSISTENCE = "BASICJSONPERSISTENCE"  # primary key
 SAVE_AT_EXIT = "SAVE_AT_EXIT"  # True/False
 CREATE_FOLDER = "CREATE_FOLDER"  # True/False
 FILEPATH = "FILEPATH"  # "....json" filename
+CHANGE_DETECTION = "CHANGE_DETECTION"  # HASH/TRACKED (default: HASH)
+LAZY_LOAD = "LAZY_LOAD"  # True/False (default: False)
+CODEC = "CODEC"  # CODEC_JSON/... (default: CODEC_JSON)
+COMPRESSION = "COMPRESSION"  # COMPRESSION_NONE/... (default: ..._NONE)
+COMPRESSION_LEVEL = "COMPRESSION_LEVEL"  # int (default: per compression)
+SHARDS = "SHARDS"  # None/SHARD_PER_KEY/number of buckets (default: None)
+LOCKING = "LOCKING"  # True/False (default: False)
+MERGE = "MERGE"  # True/False (default: False; implies LOCKING)
+FSYNC = "FSYNC"  # True/False (default: False; LOCKING implies it)
+AUTOSAVE = "AUTOSAVE"  # True/False (default: False)
+AUTOSAVE_DEBOUNCE = "AUTOSAVE_DEBOUNCE"  # seconds of quiet before saving
+AUTOSAVE_MAX_DELAY = "AUTOSAVE_MAX_DELAY"  # most seconds a change waits
+SNAPSHOT = "SNAPSHOT"  # SNAPSHOT_NONE/KEYS/FORK (default: ..._NONE)
+COMPACT = "COMPACT"  # True/False (default: False)
+INDEXES = "INDEXES"  # {name: field path} (default: none)
+PERSIST_INDEXES = "PERSIST_INDEXES"  # True/False (default: False)
 
+# CHANGE_DETECTION values
+HASH = "HASH"  # compare a hash of the serialized data with the file's
+TRACKED = "TRACKED"  # trust the record of top-level changes (see tracked.py)
+
+# CODEC values (see chassis2024.codec)
+CODEC_JSON = "CODEC_JSON"  # the standard library's json
+CODEC_FAST_JSON = "CODEC_FAST_JSON"  # orjson, if installed; compact json
+CODEC_MARSHAL = "CODEC_MARSHAL"  # marshal (trusted local data only)
+CODEC_PICKLE = "CODEC_PICKLE"  # pickle (trusted local data only)
+
+# COMPRESSION values
+COMPRESSION_NONE = "COMPRESSION_NONE"
+COMPRESSION_ZLIB = "COMPRESSION_ZLIB"
+COMPRESSION_LZMA = "COMPRESSION_LZMA"
+
+# SHARDS values (besides a number of buckets; see chassis2024.shards)
+SHARD_PER_KEY = "SHARD_PER_KEY"
+
+# SNAPSHOT values (see chassis2024.snapshot)
+SNAPSHOT_NONE = "SNAPSHOT_NONE"  # save() writes the file before returning
+SNAPSHOT_KEYS = "SNAPSHOT_KEYS"  # re-encode changed keys; write on a thread
+SNAPSHOT_FORK = "SNAPSHOT_FORK"  # a fork()'ed child encodes and writes
@@ -4,6 +4,8 @@
 """basic runner -- calls interface RUN's run() method"""
 
 
+import sys
+
 import chassis2024
 from chassis2024.words import *
 
@@ -12,6 +14,8 @@ CHASSIS2024_SPEC = {
     EXECUTES_GRAPH_NODES: [UP]
 }
 
+chassis2024.register(sys.modules[__name__])
+
 
 # entry
 
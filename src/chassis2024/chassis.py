@@ -1,164 +1,796 @@
 # Copyright 2024 Lion Kimbro
 # SPDX-License-Identifier: BSD-3-Clause
 
+"""the chassis itself
+
+All of the state of a run lives in a Chassis instance.  The module-level
+API (chassis2024.run(...), chassis2024.interface(...),
+chassis2024.execution_spec, chassis.call_before_termination(...), ...)
+works on the *current* chassis: the one that is running in this thread
+(or asyncio task), or else the default instance, chassis.default.
+
+Several Chassis instances can run at the same time, in different
+threads; each one has its own execution spec, execution graph,
+interfaces, callbacks, and component state (see component_state.)
+
+The module-level names for the state of a run
+(chassis.execution_node_handlers, chassis.interfaces, ...) also refer to
+the current chassis's state.
+"""
+
 
 import sys
+import heapq
+import asyncio
+import inspect
+import importlib
+import threading
 import traceback
-
-import chassis2024
+import contextvars
+import concurrent.futures
 
 from .words import *
 from .exceptions import *
 from . import kahn
+from . import plancache
+from . import lazy
+from . import instrument
+from . import explain
+from . import history
 
 
 # constants
 kMAJOR_STAGES = [CLEAR, RESET, ARGPARSE, CONNECT, ACTIVATE, UP]
 kPERFORM_EXECUTION_GRAPH_NODE_FN = "perform_execution_graph_node"
+kENTRY_POINT_GROUP = "chassis2024.components"
+kDEFAULT_DISCOVERY = [SCAN]  # (finds packages that don't register, too)
+
+# the names of the per-run state, readable as module attributes
+kSTATE_NAMES = frozenset(["execution_spec",
+                          "chassis2024_package_objs",
+                          "execution_node_handlers",
+                          "execution_graph_sequences",
+                          "execution_node_order_calculated",
+                          "interfaces",
+                          "call_before_termination_callbacks",
+                          "exception_type_value_tracebacks_encountered",
+                          "instrumentation"])
 
 
 # globals
 
-chassis2024_package_objs = []  # [module object, ...]
-execution_node_handlers = {}  # {str:node name: module object w/ perform_execution_graph_node(node name)}
-execution_graph_sequences = []  # [(str:node name (before), str:node name (after), ...]
-execution_node_order_calculated = []  # list of strings (node names)
-interfaces = {}  # str:name to object that implements interface
-call_before_termination_callbacks = []  # [fn() -> None, ...], last to first order
-exception_type_value_tracebacks_encountered = []  # [(type, val, tb), ...]
+# (process-wide -- packages register themselves as they are imported)
+registered_packages = {}  # {str:module name: module object}
+lazy_packages = {}  # {str:module name: manifest (see lazy.py)}
+_entry_point_module_names = None  # [str:module name, ...], read on first use
+
+_current = contextvars.ContextVar("chassis2024_current_chassis")
+
+
+class Chassis:
+
+    def __init__(self):
+        self.execution_spec = {}
+        self.chassis2024_package_objs = []  # [module object, ...]
+        self.execution_node_handlers = {}  # {str:node name: module object w/ perform_execution_graph_node(node name)}
+        self.execution_graph_sequences = []  # [(str:node name (before), str:node name (after), ...]
+        self.execution_node_order_calculated = []  # list of strings (node names)
+        self.interfaces = {}  # str:name to object that implements interface
+        self.call_before_termination_callbacks = []  # [fn() -> None, ...], last to first order
+        self.exception_type_value_tracebacks_encountered = []  # [(type, val, tb), ...]
+        self.instrumentation = None  # instrument.Recorder, if instrumentation is on
+        self.planner = None  # kahn.IncrementalOrder, once packages are hot-plugged
+        self.priorities = None  # {node: seconds of longest path remaining}, from history
+        self.component_states = {}  # {key: state object} (see component_state)
+        self._running_lock = threading.Lock()  # held while running
+        self._states_lock = threading.Lock()  # guards component_states
+
+    # main functionality
+
+    def run(self, execution_spec):
+        with self._running_lock:
+            token = _current.set(self)
+            try:
+                self._plan(execution_spec)
+                self._execute()
+                self._call_before_termination_callbacks()
+                self._write_trace()
+                self._write_explanation()
+                self._write_history()
+                self._report_exceptions()
+            finally:
+                _current.reset(token)
+
+    async def run_async(self, execution_spec):
+        # (never block the event loop waiting for the lock)
+        if not self._running_lock.acquire(blocking=False):
+            raise ChassisAlreadyRunning(self)
+        token = _current.set(self)
+        try:
+            self._plan(execution_spec)
+            await self._execute_async()
+            await self._call_before_termination_callbacks_async()
+            self._write_trace()
+            self._write_explanation()
+            self._write_history()
+            self._report_exceptions()
+        finally:
+            _current.reset(token)
+            self._running_lock.release()
+
+    def call_before_termination(self, cb):
+        self.call_before_termination_callbacks.append(cb)
+
+    def interface(self, interface_name, required=False):
+        """Access the object registered for a given interface.
+
+        If it doesn't exist, and it's not required, return None.
+
+        If it doesn't exist, and it's required, raises InterfaceUndefined.
+        """
+        found = self.interfaces.get(interface_name)
+        if isinstance(found, lazy.LazyInterface):
+            found = self.interfaces[interface_name] = found.resolve()
+        if required and not found:
+            raise InterfaceUndefined(interface_name)
+        return found
+
+    def explain(self, costs=None):
+        """Return a critical path report on the plan (see explain.py.)
+
+        costs is {node: seconds}; by default, the execution spec's
+        NODE_COSTS, overridden by what instrumentation measured, if it
+        was on.  Only the edges the run started with are explained.
+        """
+        if costs is None:
+            costs = dict(self._execution_spec_section().get(NODE_COSTS) or {})
+            if self.instrumentation is not None:
+                costs.update(explain.costs_from_records(
+                    self.instrumentation.records))
+        return explain.explain(self.execution_graph_sequences, costs)
+
+    def component_state(self, key, factory):
+        """Return this chassis's state object for a component.
+
+        The state object is created by calling factory(), the first time
+        that key (by convention, the component's module name) is asked
+        for.  It persists across runs of the same chassis.
+        """
+        try:
+            return self.component_states[key]
+        except KeyError:
+            with self._states_lock:
+                if key not in self.component_states:
+                    self.component_states[key] = factory()
+                return self.component_states[key]
+
+    # hot-plugging packages, after planning
+
+    def add_package(self, module_object):
+        """Add a package to the plan, after the run has been planned.
+
+        The new package's nodes and edges are woven into the existing
+        order incrementally (see kahn.IncrementalOrder), at a cost that
+        follows the size of the change, not the size of the graph.
+
+        Returns the execution nodes that the package handles, that are in
+        the graph, in order: the nodes that still need to be performed
+        (see perform_nodes.)  These include nodes that were already in
+        the graph (declared by another package, say), without a handler.
+
+        After hot-plugging, self.planner holds the live graph and order;
+        execution_graph_sequences and execution_node_order_calculated
+        continue to describe the plan the run started with.
+        """
+        planner = self._planner()
+        D = getattr(module_object, CHASSIS2024_SPEC)
+        nodes = list(D.get(EXECUTES_GRAPH_NODES, []))
+        for n in nodes:
+            if n in self.execution_node_handlers:
+                raise MultiplePackagesHandlingExecutionGraphNode(
+                    {PACKAGE: module_object, EXECUTION_GRAPH_NODE: n})
+        for k, v in D.get(INTERFACES, {}).items():
+            if k in self.interfaces:
+                raise MultipleDefinitionsOfInterface(
+                    {PACKAGE: module_object, INTERFACE: k, IMPLEMENTATION: v})
+
+        # Weave in the edges; on a cycle, take back what was added.
+        edges = _sequence_edges(D)
+        added_nodes = [n for n in _edge_nodes(edges) if n not in planner]
+        done = []
+        try:
+            for u, v in edges:
+                planner.add_edge(u, v)
+                done.append((u, v))
+        except kahn.CycleDetected as e:
+            for u, v in done:
+                planner.remove_edge(u, v)
+            for n in added_nodes:
+                if n in planner:
+                    planner.remove_node(n)
+            raise ExecutionGraphCycleDetected({CYCLE: e.cycle})
+
+        self.chassis2024_package_objs.append(module_object)
+        for n in nodes:
+            self.execution_node_handlers[n] = module_object
+        self.interfaces.update(D.get(INTERFACES, {}))
+        return planner.sort(n for n in nodes if n in planner)
+
+    def remove_package(self, module_object):
+        """Remove a package from the plan: its nodes, edges, and interfaces.
+
+        Nodes that no longer have any edges, or a handler, leave the graph.
+        """
+        planner = self._planner()
+        D = getattr(module_object, CHASSIS2024_SPEC)
+        self.chassis2024_package_objs.remove(module_object)
+        for n in D.get(EXECUTES_GRAPH_NODES, []):
+            if self.execution_node_handlers.get(n) is module_object:
+                del self.execution_node_handlers[n]
+        for k, v in D.get(INTERFACES, {}).items():
+            if self.interfaces.get(k) is v:
+                del self.interfaces[k]
+        edges = _sequence_edges(D)
+        for u, v in edges:
+            planner.remove_edge(u, v)
+        for n in _edge_nodes(edges):
+            if (n in planner and planner.is_isolated(n) and
+                n not in self.execution_node_handlers):
+                planner.remove_node(n)
+
+    def perform_nodes(self, nodes):
+        """Perform the given nodes, in the order given, as _execute would."""
+        try:
+            for execution_graph_node in nodes:
+                if execution_graph_node in self.execution_node_handlers:
+                    self._perform(execution_graph_node)
+        except SystemExit:
+            raise
+        except:  # Yes, I really want to capture EVERYTHING else.
+            self._record_exception_details()
+
+    def _planner(self):
+        if self.planner is None:
+            self.planner = kahn.IncrementalOrder(
+                self.execution_node_order_calculated,
+                self.execution_graph_sequences)
+        return self.planner
+
+    def _plan(self, execution_spec):
+        self._init()
+        self._populate_major_stages()
+        self.execution_spec.update(execution_spec)
+        if self._instrumentation_requested():
+            self.instrumentation = instrument.Recorder()
+        packages = self._find_chassis2024_packages()
+        for module_object in packages:
+            self._register_package(module_object)
+        cache_filepath = self._execution_spec_section().get(PLAN_CACHE_FILEPATH)
+        if not (cache_filepath and self._load_plan(cache_filepath, packages)):
+            self._kahn()
+            if cache_filepath:
+                plancache.save(cache_filepath, packages,
+                               self.execution_node_order_calculated)
+        self._prioritize()
+
+    def _init(self):
+        """Clear all per-run state."""
+        self.execution_spec.clear()
+        del self.chassis2024_package_objs[:]
+        self.execution_node_handlers.clear()
+        del self.execution_graph_sequences[:]
+        del self.execution_node_order_calculated[:]
+        self.interfaces.clear()
+        del self.call_before_termination_callbacks[:]
+        del self.exception_type_value_tracebacks_encountered[:]
+        self.instrumentation = None
+        self.planner = None
+        self.priorities = None
+
+    def _populate_major_stages(self):
+        self._define_execution_sequence(kMAJOR_STAGES)
+
+    def _define_execution_sequence(self, graph_sequence):
+        for i in range(len(graph_sequence)-1):
+            self.execution_graph_sequences.append((graph_sequence[i],
+                                                   graph_sequence[i+1]))
+
+    def _locate_chassis2024_packages(self):
+        for module_object in self._find_chassis2024_packages():
+            self._register_package(module_object)
+
+    def _find_chassis2024_packages(self):
+        """Return [module object, ...] for the participating packages.
+
+        The execution spec's DISCOVERY lists the sources to look in, in
+        order; a module found by more than one source is listed once.
+
+        Lazily declared packages always participate: as the module itself,
+        if it has been imported by now, or else as a lazy.LazyPackage.
+        """
+        sources = self._execution_spec_section().get(DISCOVERY,
+                                                     kDEFAULT_DISCOVERY)
+        found = {}  # {id(module object): module object}
+        for source in sources:
+            if source == SCAN:
+                candidates = list(sys.modules.values())
+            elif source == REGISTRY:
+                candidates = list(registered_packages.values())
+                candidates.append(sys.modules.get("__main__"))
+            elif source == ENTRY_POINTS:
+                candidates = [importlib.import_module(name)
+                              for name in _entry_point_modules()]
+            else:
+                raise ValueError(source)
+            for module_object in candidates:
+                if _is_chassis2024_package(module_object):
+                    found.setdefault(id(module_object), module_object)
+        names = {module_object.__name__ for module_object in found.values()}
+        for module_name, manifest in list(lazy_packages.items()):
+            if module_name not in names:
+                module_object = sys.modules.get(module_name)
+                if not _is_chassis2024_package(module_object):
+                    module_object = lazy.LazyPackage(module_name, manifest)
+                found[id(module_object)] = module_object
+        return list(found.values())
+
+    def _register_package(self, module_object):
+        D = getattr(module_object, CHASSIS2024_SPEC)
+
+        # Remember this module in the chassis's memory.
+        self.chassis2024_package_objs.append(module_object)
+
+        # Now store the graph nodes that it handles.
+        for execution_graph_node in D.get(EXECUTES_GRAPH_NODES, []):
+            if execution_graph_node in self.execution_node_handlers:
+                error_info = {PACKAGE: module_object,
+                              EXECUTION_GRAPH_NODE: execution_graph_node}
+                raise MultiplePackagesHandlingExecutionGraphNode(error_info)
+            else:
+                self.execution_node_handlers[execution_graph_node] = module_object
+
+        # And note the graph edges that it requires.
+        for graph_sequence in D.get(EXECUTION_GRAPH_SEQUENCES, []):
+            self._define_execution_sequence(graph_sequence)
+
+        # Now store interfaces that it provides implementations for.
+        for k, v in D.get(INTERFACES, {}).items():
+            if k in self.interfaces:
+                error_info = {PACKAGE: module_object,
+                              INTERFACE: k,
+                              IMPLEMENTATION: v}
+                raise MultipleDefinitionsOfInterface(error_info)
+            else:
+                self.interfaces[k] = v
+
+    def _kahn(self):
+        key = None
+        if self.priorities is not None:
+            priorities = self.priorities
+            key = lambda n: -priorities.get(n, 0.0)  # longest remaining first
+        try:
+            result = kahn.topological_sort(self.execution_graph_sequences,
+                                           key=key)
+        except kahn.CycleDetected as e:
+            raise ExecutionGraphCycleDetected({CYCLE: e.cycle})
+        self.execution_node_order_calculated[:] = result
+
+    def _prioritize(self):
+        """Re-sort, longest path remaining first, if there's a history.
+
+        (The plan cache keeps the order computed without a history, so
+        that a run without one gets the same order either way.)
+        """
+        filepath = self._execution_spec_section().get(HISTORY_FILEPATH)
+        if not filepath:
+            return
+        self.priorities = history.priorities(self.execution_graph_sequences,
+                                             history.load(filepath))
+        if self.priorities is not None:
+            self._kahn()
+
+    def _load_plan(self, filepath, packages):
+        """Adopt a cached order, if there's a valid one for the graph.
+
+        Returns True if the order was adopted, False if it must be sorted.
+        """
+        order = plancache.load(filepath, packages,
+                               self.execution_graph_sequences)
+        if order is None:
+            return False
+        self.execution_node_order_calculated[:] = order
+        return True
+
+    def _execution_spec_section(self):
+        """Return the execution spec's CHASSIS2024 section, or else {}."""
+        return self.execution_spec.get(CHASSIS2024) or {}
+
+    def _instrumentation_requested(self):
+        D = self._execution_spec_section()
+        return bool(D.get(INSTRUMENT) or D.get(TRACE_FILEPATH) or
+                    D.get(EXPLAIN_FILEPATH) or D.get(HISTORY_FILEPATH) or
+                    instrument.env_instrument() or
+                    instrument.env_trace_filepath() or
+                    explain.env_explain_filepath())
+
+    def _write_trace(self):
+        if self.instrumentation is None:
+            return
+        filepath = (self._execution_spec_section().get(TRACE_FILEPATH) or
+                    instrument.env_trace_filepath())
+        if filepath:
+            try:
+                self.instrumentation.write_chrome_trace(filepath)
+            except:  # Yes, I really want to capture EVERYTHING.
+                self._record_exception_details()
+
+    def _write_explanation(self):
+        filepath = (self._execution_spec_section().get(EXPLAIN_FILEPATH) or
+                    explain.env_explain_filepath())
+        if filepath:
+            try:
+                explain.write_report(self.explain(), filepath)
+            except:  # Yes, I really want to capture EVERYTHING.
+                self._record_exception_details()
+
+    def _write_history(self):
+        filepath = self._execution_spec_section().get(HISTORY_FILEPATH)
+        if filepath and self.instrumentation is not None:
+            try:
+                measured = explain.costs_from_records(
+                    self.instrumentation.records)
+                history.save(filepath, history.blend(history.load(filepath),
+                                                     measured))
+            except:  # Yes, I really want to capture EVERYTHING.
+                self._record_exception_details()
+
+    def _execute(self):
+        workers = self._execution_spec_section().get(PARALLEL_WORKERS)
+        if workers:
+            self._execute_parallel(workers)
+        else:
+            self._execute_sequential()
+
+    def _execute_sequential(self):
+        # str:execution_graph_node (the name of the execution graph node)
+        try:
+            for execution_graph_node in self.execution_node_order_calculated:
+                if execution_graph_node in self.execution_node_handlers:
+                    self._perform(execution_graph_node)
+        # TODO: This should be configured through the system.
+        #       When you import chassis2024.argparse,
+        #       the CHASSIS2024_SPEC should include that
+        #       SystemExit is permitted to pass through.
+        #   Similarly, other modules could permit KeyboardInterrupt,
+        #   and such, to pass through.
+        except SystemExit:
+            raise
+        except:  # Yes, I really want to capture EVERYTHING else.
+            self._record_exception_details()
+
+    def _handler_fn(self, execution_graph_node):
+        pkg = self.execution_node_handlers[execution_graph_node]
+        # It's mandatory that this function exists.
+        # An AttributeError will be raised if it isn't found -- rightly so.
+        return getattr(pkg, kPERFORM_EXECUTION_GRAPH_NODE_FN)  # pkg.perform_execution_graph_node("...")
+
+    def _perform(self, execution_graph_node):
+        """Perform a single node that has a handler.
+
+        Outside of run_async, nothing would await an awaitable that the
+        handler returns; that's an error, rather than a node quietly
+        left undone.
+        """
+        fn = self._handler_fn(execution_graph_node)
+        if self.instrumentation is None:
+            result = fn(execution_graph_node)
+        else:
+            with self.instrumentation.measure(instrument.NODE,
+                                              execution_graph_node):
+                result = fn(execution_graph_node)
+        if inspect.isawaitable(result):
+            if inspect.iscoroutine(result):
+                result.close()  # (no "never awaited" warning, as well)
+            raise AwaitableNotAwaited(
+                "%s returned an awaitable; run the chassis with "
+                "chassis2024.run_async(...) to have it awaited"
+                % execution_graph_node)
+        return result
+
+    def _dispatch_order(self):
+        """Return the nodes, in the order that ready nodes are picked in.
+
+        That's the calculated order; or, with priorities from a history,
+        longest path remaining first (ties going by the calculated order.)
+        """
+        order = self.execution_node_order_calculated
+        if self.priorities is None:
+            return order
+        priorities = self.priorities
+        position = {n: i for i, n in enumerate(order)}
+        return sorted(order, key=lambda n: (-priorities.get(n, 0.0),
+                                            position[n]))
+
+    def _ready_queue(self, order):
+        """Prepare to schedule the nodes of order by readiness.
+
+        Returns (ready, waiting, successors):
+        * ready  -- heap of positions (in order) of the nodes that have no
+                    unfinished predecessors
+        * waiting  -- {node: number of unfinished predecessors}
+        * successors  -- {node: [node, ...]}
+
+        Popping the lowest position first means that, whenever there is a
+        choice, nodes go in the given order (see _dispatch_order.)
+        """
+        waiting = dict.fromkeys(order, 0)
+        successors = {n: [] for n in order}
+        for u, v in kahn.unique_edges(self.execution_graph_sequences):
+            successors[u].append(v)
+            waiting[v] += 1
+        ready = [i for i, n in enumerate(order) if waiting[n] == 0]
+        heapq.heapify(ready)
+        return ready, waiting, successors
+
+    def _execute_parallel(self, max_workers):
+        """Execute nodes on a thread pool, as soon as their predecessors finish.
+
+        Every declared edge still holds: a node is submitted only after all
+        of its predecessors have completed.  After the first failure, no new
+        nodes are started; the nodes already running are waited for, and
+        every exception is recorded.
+        """
+        order = self._dispatch_order()
+        position = {n: i for i, n in enumerate(order)}
+        ready, waiting, successors = self._ready_queue(order)
+        running = {}  # {future: node}
+        failed = False
+        system_exit = None
+        with concurrent.futures.ThreadPoolExecutor(max_workers) as pool:
+            while ready or running:
+                while ready and not failed:
+                    n = order[heapq.heappop(ready)]
+                    if n in self.execution_node_handlers:
+                        # (copy the context, so the worker sees this chassis)
+                        context = contextvars.copy_context()
+                        running[pool.submit(context.run, self._perform, n)] = n
+                    else:
+                        _node_completed(n, ready, waiting, successors, position)
+                if not running:
+                    break
+                done, _ = concurrent.futures.wait(
+                    running, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    n = running.pop(future)
+                    exc = future.exception()
+                    if exc is None:
+                        _node_completed(n, ready, waiting, successors, position)
+                    elif isinstance(exc, SystemExit):
+                        failed = True
+                        system_exit = exc
+                    else:
+                        failed = True
+                        self._record_exception(exc)
+        if system_exit is not None:
+            raise system_exit
+
+    async def _perform_async(self, execution_graph_node):
+        """Perform a node; await the result, if the handler returned one.
+
+        Returns the exception raised, or None.  (SystemExit must not escape
+        a task, or it would tear down the event loop mid-flight.)
+        """
+        try:
+            fn = self._handler_fn(execution_graph_node)
+            if self.instrumentation is None:
+                result = fn(execution_graph_node)
+                if inspect.isawaitable(result):
+                    await result
+            else:
+                with self.instrumentation.measure(instrument.NODE,
+                                                  execution_graph_node):
+                    result = fn(execution_graph_node)
+                    if inspect.isawaitable(result):
+                        await result
+        except asyncio.CancelledError:
+            raise
+        except BaseException as exc:  # Yes, I really want EVERYTHING.
+            return exc
+        return None
+
+    async def _execute_async(self):
+        """Execute nodes on the running event loop.
+
+        Handlers may be coroutine functions (or otherwise return an
+        awaitable.)  Every node whose predecessors have all completed is
+        started right away, so independent nodes are awaited concurrently;
+        a plain (blocking) handler simply runs to completion in place.
+        Failure handling matches _execute_parallel.
+        """
+        order = self._dispatch_order()
+        position = {n: i for i, n in enumerate(order)}
+        ready, waiting, successors = self._ready_queue(order)
+        running = {}  # {task: node}
+        failed = False
+        system_exit = None
+        while ready or running:
+            while ready and not failed:
+                n = order[heapq.heappop(ready)]
+                if n in self.execution_node_handlers:
+                    task = asyncio.ensure_future(self._perform_async(n))
+                    running[task] = n
+                else:
+                    _node_completed(n, ready, waiting, successors, position)
+            if not running:
+                break
+            done, _ = await asyncio.wait(running,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                n = running.pop(task)
+                exc = task.result()
+                if exc is None:
+                    _node_completed(n, ready, waiting, successors, position)
+                elif isinstance(exc, SystemExit):
+                    failed = True
+                    system_exit = exc
+                else:
+                    failed = True
+                    self._record_exception(exc)
+        if system_exit is not None:
+            raise system_exit
+
+    def _record_exception_details(self):
+        exc_type, exc_value, exc_traceback = sys.exc_info()
+        self.exception_type_value_tracebacks_encountered.append((exc_type,
+                                                                 exc_value,
+                                                                 exc_traceback))
+
+    def _record_exception(self, exc):
+        self.exception_type_value_tracebacks_encountered.append((type(exc),
+                                                                 exc,
+                                                                 exc.__traceback__))
+
+    def _call_before_termination_callbacks(self):
+        for cb in reversed(self.call_before_termination_callbacks):
+            try:
+                if self.instrumentation is None:
+                    cb()
+                else:
+                    with self.instrumentation.measure(instrument.CALLBACK,
+                                                      _callback_name(cb)):
+                        cb()
+            except:  # Yes, I really want to capture EVERYTHING.
+                self._record_exception_details()
+                # note that this DOES continue down the chain of callbacks
+
+    async def _call_before_termination_callbacks_async(self):
+        """As _call_before_termination_callbacks, but awaits async callbacks."""
+        for cb in reversed(self.call_before_termination_callbacks):
+            try:
+                if self.instrumentation is None:
+                    result = cb()
+                    if inspect.isawaitable(result):
+                        await result
+                else:
+                    with self.instrumentation.measure(instrument.CALLBACK,
+                                                      _callback_name(cb)):
+                        result = cb()
+                        if inspect.isawaitable(result):
+                            await result
+            except:  # Yes, I really want to capture EVERYTHING.
+                self._record_exception_details()
+
+    def _report_exceptions(self):
+        # Check if there are any exceptions to report
+        if not self.exception_type_value_tracebacks_encountered:
+            # No exceptions to report.
+            return
+
+        # Iterate through each recorded exception
+        L = self.exception_type_value_tracebacks_encountered
+        for i, (exc_type, exc_value, exc_traceback) in enumerate(L, start=1):
+            print(f"Exception {i}:")
+            print(f"Type: {exc_type.__name__ if exc_type else 'None'}")
+            print(f"Value: {exc_value}")
+
+            # Format and print the traceback
+            formatted_traceback = ''.join(traceback.format_tb(exc_traceback))
+            print("Traceback:")
+            print(formatted_traceback)
+            print("-" * 40)  # Separator for readability
+
+
+default = Chassis()
+
+
+def current():
+    """Return the chassis running in this context, or else the default."""
+    return _current.get(default)
+
+
+def __getattr__(name):
+    # the per-run state names (chassis.interfaces, ...) read the current chassis
+    if name in kSTATE_NAMES:
+        return getattr(current(), name)
+    raise AttributeError(name)
 
 
 # main functionality
 
 def run(execution_spec):
-    _init()
-    _populate_major_stages()
-    chassis2024.execution_spec.update(execution_spec)
-    _locate_chassis2024_packages()
-    _kahn()
-    _execute()
-    _call_before_termination_callbacks()
-    _report_exceptions()
+    default.run(execution_spec)
+
+async def run_async(execution_spec):
+    await default.run_async(execution_spec)
 
 def call_before_termination(cb):
-    call_before_termination_callbacks.append(cb)
-
-
-def _init():
-    """Clear all globals."""
-    chassis2024.execution_spec.clear()
-    del chassis2024_package_objs[:]
-    execution_node_handlers.clear()
-    del execution_graph_sequences[:]
-    del execution_node_order_calculated[:]
-    interfaces.clear()
-    del call_before_termination_callbacks[:]
-    del exception_type_value_tracebacks_encountered[:]
-
-
-def _populate_major_stages():
-    _define_execution_sequence(kMAJOR_STAGES)
-
-def _define_execution_sequence(graph_sequence):
-    i = 0
-    for i in range(len(graph_sequence)-1):
-        execution_graph_sequences.append((graph_sequence[i],
-                                          graph_sequence[i+1]))
-
-
-def _locate_chassis2024_packages():
-    for module_name, module_object in sys.modules.items():
-        D = getattr(module_object, CHASSIS2024_SPEC, None)
-        if ((D is not None) and
-            (D is not CHASSIS2024_SPEC)):  # ignore words.py
-            # Remember this module in global memory.
-            chassis2024_package_objs.append(module_object)
-
-            # Now store the graph nodes that it handles.
-            for execution_graph_node in D.get(EXECUTES_GRAPH_NODES, []):
-                if execution_graph_node in execution_node_handlers:
-                    error_info = {PACKAGE: moduleobj,
-                                  EXECUTION_GRAPH_NODE: execution_graph_node}
-                    raise MultiplePackagesHandlingExecutionGraphNode(error_info)
-                else:
-                    execution_node_handlers[execution_graph_node] = module_object
-
-            # And note the graph edges that it requires.
-            for graph_sequence in D.get(EXECUTION_GRAPH_SEQUENCES, []):
-                _define_execution_sequence(graph_sequence)
-            
-            # Now store interfaces that it provides implementations for.
-            for k, v in D.get(INTERFACES, {}).items():
-                if k in interfaces:
-                    error_info = {PACKAGE: moduleobj,
-                                  INTERFACE: k,
-                                  IMPLEMENTATION: v}
-                    raise MultipleDefinitionsOfInterface(error_info)
-                else:
-                    interfaces[k] = v
-
-
-def _kahn():
-    result = kahn.topological_sort(execution_graph_sequences)
-    if result == kahn.CYCLE_DETECTED:
-        raise ExecutionGraphCycleDetected()
-    else:
-        execution_node_order_calculated[:] = result
-
-
-def _execute():
-    # str:execution_graph_node (the name of the execution graph node)
-    try:
-        for execution_graph_node in execution_node_order_calculated:
-            pkg = execution_node_handlers.get(execution_graph_node)
-            if pkg is not None:
-                # It's mandatory that this function exists.
-                # An AttributeError will be raised if it isn't found -- rightly so.
-                fn = getattr(pkg, kPERFORM_EXECUTION_GRAPH_NODE_FN)  # pkg.perform_execution_graph_node("...")
-                fn(execution_graph_node)
-    # TODO: This should be configured through the system.
-    #       When you import chassis2024.argparse,
-    #       the CHASSIS2024_SPEC should include that
-    #       SystemExit is permitted to pass through.
-    #   Similarly, other modules could permit KeyboardInterrupt,
-    #   and such, to pass through.
-    except SystemExit:
-        raise
-    except:  # Yes, I really want to capture EVERYTHING else.
-        _record_exception_details()
-
-
-def _record_exception_details():
-    exc_type, exc_value, exc_traceback = sys.exc_info()
-    exception_type_value_tracebacks_encountered.append((exc_type,
-                                                        exc_value,
-                                                        exc_traceback))
-
-def _call_before_termination_callbacks():
-    for cb in reversed(call_before_termination_callbacks):
-        try:
-            cb()
-        except:  # Yes, I really want to capture EVERYTHING.
-            _record_exception_details()
-            # note that this DOES continue down the chain of callbacks
-
-
-def _report_exceptions():
-    # Check if there are any exceptions to report
-    if not exception_type_value_tracebacks_encountered:
-        # No exceptions to report.
-        return
-
-    # Iterate through each recorded exception
-    L = exception_type_value_tracebacks_encountered
-    for i, (exc_type, exc_value, exc_traceback) in enumerate(L, start=1):
-        print(f"Exception {i}:")
-        print(f"Type: {exc_type.__name__ if exc_type else 'None'}")
-        print(f"Value: {exc_value}")
-
-        # Format and print the traceback
-        formatted_traceback = ''.join(traceback.format_tb(exc_traceback))
-        print("Traceback:")
-        print(formatted_traceback)
-        print("-" * 40)  # Separator for readability
+    current().call_before_termination(cb)
+
+def register(module_object):
+    """Register a chassis2024 package, for REGISTRY discovery.
+
+    Packages call this at import time, once CHASSIS2024_SPEC is defined:
+
+      chassis2024.register(sys.modules[__name__])
+    """
+    registered_packages[module_object.__name__] = module_object
+
+def register_lazy(module_name, manifest):
+    """Declare a package by name, to be imported only once it is needed."""
+    lazy_packages[module_name] = manifest
 
+
+# helpers
+
+def _node_completed(n, ready, waiting, successors, position):
+    for m in successors[n]:
+        waiting[m] -= 1
+        if waiting[m] == 0:
+            heapq.heappush(ready, position[m])
+
+
+def _sequence_edges(D):
+    """Return [(before, after), ...] for a spec's EXECUTION_GRAPH_SEQUENCES."""
+    return [(seq[i], seq[i+1])
+            for seq in D.get(EXECUTION_GRAPH_SEQUENCES, [])
+            for i in range(len(seq)-1)]
+
+def _edge_nodes(edges):
+    """Return the nodes of edges, in order of first appearance."""
+    return list(dict.fromkeys(n for edge in edges for n in edge))
+
+
+def _is_chassis2024_package(module_object):
+    D = getattr(module_object, CHASSIS2024_SPEC, None)
+    return ((D is not None) and
+            (D is not CHASSIS2024_SPEC))  # ignore words.py
+
+
+def _entry_point_modules():
+    """Return the module names of "chassis2024.components" entry points.
+
+    (Read from the installed distributions' metadata once, on first use;
+    discovery imports the modules.)
+    """
+    global _entry_point_module_names
+    if _entry_point_module_names is None:
+        try:
+            import importlib.metadata
+        except ImportError:  # Python 3.7
+            _entry_point_module_names = []
+            return _entry_point_module_names
+        eps = importlib.metadata.entry_points()
+        if hasattr(eps, "select"):
+            eps = eps.select(group=kENTRY_POINT_GROUP)
+        else:
+            eps = eps.get(kENTRY_POINT_GROUP, [])
+        _entry_point_module_names = [ep.value.split(":")[0] for ep in eps]
+    return _entry_point_module_names
+
+
+def _callback_name(cb):
+    module_name = getattr(cb, "__module__", None)
+    qualname = getattr(cb, "__qualname__", None)
+    if module_name and qualname:
+        return module_name + "." + qualname
+    return repr(cb)
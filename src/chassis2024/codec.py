@@ -0,0 +1,206 @@
+# Copyright 2024 Lion Kimbro
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""encodings and compressions for persistence files
+
+A persistence file is written in two steps: the data is encoded to
+bytes by a codec, and the bytes are written out through a compression.
+
+  codecs:
+
+    CODEC_JSON  -- the standard library's json, as it has always been
+                   written (the default)
+    CODEC_FAST_JSON  -- orjson, if it is installed; otherwise, the
+                        standard library's json, without the spaces
+    CODEC_MARSHAL  -- the marshal module's binary format; fast, and
+                      compact, but only for trusted local data, and
+                      only readable by the same version of Python
+    CODEC_PICKLE  -- pickle's binary format; only for trusted local
+                     data (unpickling can run arbitrary code)
+
+  compressions:
+
+    COMPRESSION_NONE  -- (the default)
+    COMPRESSION_ZLIB  -- zlib (deflate); fast
+    COMPRESSION_LZMA  -- lzma (xz); smaller, slower
+
+Compression is streamed, a chunk at a time, to and from the file, so
+that the whole compressed file is never held in memory beside the
+whole uncompressed one.
+
+Files can be converted from one format to another:
+
+  python -m chassis2024.codec data.json data.json.xz --to-compression LZMA
+"""
+
+import json
+import lzma
+import array
+import zlib
+import pickle
+import marshal
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# codecs
+CODEC_JSON = "CODEC_JSON"
+CODEC_FAST_JSON = "CODEC_FAST_JSON"
+CODEC_MARSHAL = "CODEC_MARSHAL"
+CODEC_PICKLE = "CODEC_PICKLE"
+
+# compressions
+COMPRESSION_NONE = "COMPRESSION_NONE"
+COMPRESSION_ZLIB = "COMPRESSION_ZLIB"
+COMPRESSION_LZMA = "COMPRESSION_LZMA"
+
+kCHUNK_SIZE = 1024*1024  # bytes, streamed at a time
+
+
+# encoding
+
+def default(obj):
+    """Encode what JSON can't: array.array (see compact.py), as a list."""
+    if isinstance(obj, array.array):
+        return obj.tolist()
+    raise TypeError("Object of type %s is not JSON serializable" %
+                    type(obj).__name__)
+
+def _encode_json(D):
+    return json.dumps(D, default=default).encode("utf-8")
+
+def _encode_fast_json(D):
+    if orjson is not None:
+        return orjson.dumps(D, default=default,
+                            option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(D, separators=(",", ":"),
+                      default=default).encode("utf-8")
+
+def _decode_fast_json(raw):
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+# (marshal and pickle get a plain dict: marshal won't take a subclass,
+#  and pickle would record the subclass, and its attributes)
+
+def _encode_marshal(D):
+    return marshal.dumps(dict(D))
+
+def _encode_pickle(D):
+    return pickle.dumps(dict(D), protocol=pickle.HIGHEST_PROTOCOL)
+
+kCODECS = {CODEC_JSON: (_encode_json, json.loads),
+           CODEC_FAST_JSON: (_encode_fast_json, _decode_fast_json),
+           CODEC_MARSHAL: (_encode_marshal, marshal.loads),
+           CODEC_PICKLE: (_encode_pickle, pickle.loads)}
+
+def encode(D, codec=CODEC_JSON):
+    """Encode the dictionary D to bytes."""
+    return kCODECS[codec][0](D)
+
+def decode(raw, codec=CODEC_JSON):
+    """Decode bytes to a dictionary."""
+    return kCODECS[codec][1](raw)
+
+
+# compression
+
+def _compressor(compression, level):
+    if compression == COMPRESSION_ZLIB:
+        return zlib.compressobj(-1 if level is None else level)
+    elif compression == COMPRESSION_LZMA:
+        return lzma.LZMACompressor(preset=level)
+    else:
+        raise ValueError(compression)
+
+def _decompressor(compression):
+    if compression == COMPRESSION_ZLIB:
+        return zlib.decompressobj()
+    elif compression == COMPRESSION_LZMA:
+        return lzma.LZMADecompressor()
+    else:
+        raise ValueError(compression)
+
+def write(f, raw, compression=COMPRESSION_NONE, level=None):
+    """Write raw to the binary file f, compressing it on the way."""
+    if compression == COMPRESSION_NONE:
+        f.write(raw)
+        return
+    compressor = _compressor(compression, level)
+    view = memoryview(raw)
+    for i in range(0, len(view), kCHUNK_SIZE):
+        f.write(compressor.compress(view[i:i+kCHUNK_SIZE]))
+    f.write(compressor.flush())
+
+def read(f, compression=COMPRESSION_NONE):
+    """Read all of the binary file f, decompressing it on the way."""
+    if compression == COMPRESSION_NONE:
+        return f.read()
+    decompressor = _decompressor(compression)
+    chunks = []
+    while True:
+        chunk = f.read(kCHUNK_SIZE)
+        if not chunk:
+            break
+        chunks.append(decompressor.decompress(chunk))
+    if compression == COMPRESSION_ZLIB:
+        chunks.append(decompressor.flush())
+    return b"".join(chunks)
+
+def check(codec, compression):
+    """Raise ValueError, if either is unknown."""
+    if codec not in kCODECS:
+        raise ValueError(codec)
+    if compression not in (COMPRESSION_NONE,
+                           COMPRESSION_ZLIB,
+                           COMPRESSION_LZMA):
+        raise ValueError(compression)
+
+
+# conversion
+
+def convert(src_filepath, dst_filepath,
+            src_codec=CODEC_JSON, src_compression=COMPRESSION_NONE,
+            dst_codec=CODEC_JSON, dst_compression=COMPRESSION_NONE,
+            level=None):
+    """Rewrite a persistence file in another format."""
+    check(src_codec, src_compression)
+    check(dst_codec, dst_compression)
+    with open(src_filepath, "rb") as f:
+        D = decode(read(f, src_compression), src_codec)
+    with open(dst_filepath, "wb") as f:
+        write(f, encode(D, dst_codec), dst_compression, level)
+
+
+def main(argv=None):
+    import argparse  # (the standard library's)
+    codecs = [name[len("CODEC_"):] for name in kCODECS]
+    compressions = ["NONE", "ZLIB", "LZMA"]
+    parser = argparse.ArgumentParser(
+        prog="python -m chassis2024.codec",
+        description="convert a persistence file from one format to another")
+    parser.add_argument("src", help="file to read")
+    parser.add_argument("dst", help="file to write")
+    parser.add_argument("--from-codec", choices=codecs, default="JSON")
+    parser.add_argument("--from-compression", choices=compressions,
+                        default="NONE")
+    parser.add_argument("--to-codec", choices=codecs, default="JSON")
+    parser.add_argument("--to-compression", choices=compressions,
+                        default="NONE")
+    parser.add_argument("--level", type=int, default=None,
+                        help="compression level")
+    args = parser.parse_args(argv)
+    convert(args.src, args.dst,
+            "CODEC_" + args.from_codec,
+            "COMPRESSION_" + args.from_compression,
+            "CODEC_" + args.to_codec,
+            "COMPRESSION_" + args.to_compression,
+            args.level)
+
+
+if __name__ == "__main__":
+    main()
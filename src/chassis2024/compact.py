@@ -0,0 +1,127 @@
+# Copyright 2024 Lion Kimbro
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""a more compact in-memory form, for data decoded from JSON
+
+Decoded JSON is made of many small objects: a list of a thousand ints
+is a list of a thousand pointers to a thousand int objects, and each
+occurrence of a repeated string value is a string object of its own.
+compact(D) rewrites the data, in place, so that:
+
+  * equal strings (keys and values) are one object, shared
+  * a list of only ints (that fit in 64 bits) becomes an
+    array.array("q"), and a list of only floats an array.array("d")
+
+It returns a report of what it did, and roughly how many bytes that
+saved:
+
+  {STRINGS: 1234,  # string objects replaced by an equal, shared one
+   ARRAYS: 56,  # lists replaced by arrays
+   BYTES_SAVED: 789012}  # estimated, from sys.getsizeof
+
+An array works like the list it replaced -- indexing, slicing, len(),
+iteration, .append(), and so on -- but holds only numbers of its kind
+(appending a str, or a float to an int array, raises TypeError), and
+doesn't compare equal to a list ([1, 2] != array("q", [1, 2]).)
+
+The JSON codecs write arrays as lists (see codec.default()), so the
+file is written just as it would have been.  expand(value) turns the
+arrays within a value back into lists, for code that needs lists.
+"""
+
+import sys
+import array
+
+
+# report keys
+STRINGS = "STRINGS"
+ARRAYS = "ARRAYS"
+BYTES_SAVED = "BYTES_SAVED"
+
+kINT_MIN = -2**63
+kINT_MAX = 2**63 - 1
+
+# ints that CPython keeps one shared object of, which a list of them
+# doesn't cost extra memory for
+kSMALL_INT_MIN = -5
+kSMALL_INT_MAX = 256
+
+
+def compact(D):
+    """Compact the dictionary D, in place; return a report."""
+    report = {STRINGS: 0, ARRAYS: 0, BYTES_SAVED: 0}
+    strings = {}  # {s: s}, the shared copy of each string
+    _compact_dict(D, strings, report)
+    return report
+
+def _share(s, strings, report):
+    shared = strings.setdefault(s, s)
+    if shared is not s:
+        report[STRINGS] += 1
+        report[BYTES_SAVED] += sys.getsizeof(s)
+    return shared
+
+def _compact_dict(D, strings, report):
+    items = []
+    rekeyed = False
+    for (key, value) in list(dict.items(D)):
+        shared_key = _share(key, strings, report) if type(key) is str else key
+        rekeyed = rekeyed or shared_key is not key
+        items.append((shared_key, _compact(value, strings, report)))
+    if rekeyed:
+        dict.clear(D)  # (so that the keys stay in their order)
+    for (key, value) in items:
+        dict.__setitem__(D, key, value)
+
+def _compact(value, strings, report):
+    t = type(value)
+    if t is str:
+        return _share(value, strings, report)
+    elif t is dict:
+        _compact_dict(value, strings, report)
+        return value
+    elif t is list:
+        return _compact_list(value, strings, report)
+    return value
+
+def _compact_list(L, strings, report):
+    if L:
+        types = {type(x) for x in L}
+        if types == {int} and kINT_MIN <= min(L) and max(L) <= kINT_MAX:
+            A = array.array("q", L)
+            report[BYTES_SAVED] += (sys.getsizeof(L) - sys.getsizeof(A) +
+                                    sum(sys.getsizeof(x) for x in L
+                                        if not (kSMALL_INT_MIN <= x <=
+                                                kSMALL_INT_MAX)))
+            report[ARRAYS] += 1
+            return A
+        elif types == {float}:
+            A = array.array("d", L)
+            report[BYTES_SAVED] += (sys.getsizeof(L) - sys.getsizeof(A) +
+                                    sum(sys.getsizeof(x) for x in L))
+            report[ARRAYS] += 1
+            return A
+    for (i, x) in enumerate(L):
+        L[i] = _compact(x, strings, report)
+    return L
+
+
+def expand(value):
+    """Return value, with every array turned back into a list.
+
+    (Lists and dictionaries are copied only if they contain an array.)
+    """
+    t = type(value)
+    if t is array.array:
+        return value.tolist()
+    elif t is dict:
+        expanded = {key: expand(v) for (key, v) in value.items()}
+        if all(expanded[key] is v for (key, v) in value.items()):
+            return value
+        return expanded
+    elif t is list:
+        expanded = [expand(x) for x in value]
+        if all(e is x for (e, x) in zip(expanded, value)):
+            return value
+        return expanded
+    return value
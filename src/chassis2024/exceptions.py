@@ -11,3 +11,8 @@ class MultipleDefinitionsOfInterface(Chassis2024Exception): pass
 
 class InterfaceUndefined(Chassis2024Exception): pass
 
+class LazyManifestMismatch(Chassis2024Exception): pass
+
+class ChassisAlreadyRunning(Chassis2024Exception): pass
+
+class AwaitableNotAwaited(Chassis2024Exception): pass
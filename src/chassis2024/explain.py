@@ -0,0 +1,236 @@
+# Copyright 2024 Lion Kimbro
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""explain plan: the critical path through the execution graph
+
+Given the execution graph's edges, [(before, after), ...], and a cost
+for each node (in seconds -- measured by instrumentation, or declared),
+explain(edges, costs) works out how long the run must take, however
+many workers perform it:
+
+  {TOTAL: 1.234,  # sum of the costs: the sequential run time
+   LENGTH: 0.512,  # cost of the critical path: the least possible run time
+   SPEEDUP: 2.41,  # TOTAL / LENGTH: the most that parallel execution can give
+   CRITICAL_PATH: ["CLEAR", ..., "UP"],  # the chain that takes LENGTH
+   NODES: {"READ_...": {COST: 0.25,
+                        EARLIEST_START: 0.01,
+                        LATEST_START: 0.2,
+                        SLACK: 0.19},  # how long it could slip, harmlessly
+           ...},
+   REDUNDANT_EDGES: [["A", "C"], ...]}  # implied by other edges
+
+A node with no slack is on a critical path; making anything else faster
+doesn't make the run faster.  Nodes without a cost cost nothing.
+
+A redundant edge (A, C) is one that other edges already imply (say,
+(A, B) and (B, C)); it changes nothing about the schedule, but a
+package declaring it is constraining more than it needs to, and the
+edge will go on constraining the schedule if the path that implies it
+is ever taken away.  They are found by transitive reduction.
+
+costs_from_records(records) sums up instrumentation records (see
+instrument.py) into costs; format_report(report) lays a report out as
+text.
+
+To have a run explain itself, name a file in the execution spec:
+
+  EXECUTION_SPEC = {
+      CHASSIS2024: {
+          EXPLAIN_FILEPATH: "./explain.txt",  # or .json; implies INSTRUMENT
+          NODE_COSTS: {"CONNECT_DB": 0.3}  # optional; declared costs
+      }
+  }
+
+...or from the environment: CHASSIS2024_EXPLAIN_FILEPATH=./explain.txt
+
+Measured costs take precedence over declared ones.  After any run,
+chassis.current().explain(costs) reports on its plan with given costs.
+"""
+
+import os
+import json
+from collections import deque
+
+from . import kahn
+from . import instrument
+
+
+# environment variables
+
+kENV_EXPLAIN_FILEPATH = "CHASSIS2024_EXPLAIN_FILEPATH"
+
+# report keys
+TOTAL = "TOTAL"
+LENGTH = "LENGTH"
+SPEEDUP = "SPEEDUP"
+CRITICAL_PATH = "CRITICAL_PATH"
+NODES = "NODES"
+COST = "COST"
+EARLIEST_START = "EARLIEST_START"
+LATEST_START = "LATEST_START"
+SLACK = "SLACK"
+REDUNDANT_EDGES = "REDUNDANT_EDGES"
+
+
+def costs_from_records(records):
+    """Return {node: seconds} from instrumentation records, by wall time."""
+    costs = {}
+    for r in records:
+        if r[instrument.KIND] == instrument.NODE:
+            costs[r[instrument.NAME]] = (costs.get(r[instrument.NAME], 0.0) +
+                                         r[instrument.WALL])
+    return costs
+
+
+def explain(edges, costs):
+    """Return a report on the critical path through edges, given costs.
+
+    Nodes named in costs but not in edges are included, unconstrained.
+    Raises kahn.CycleDetected if the edges contain a cycle.
+    """
+    nodes, successors, in_degree = kahn.index_graph(edges)
+    index = {n: i for i, n in enumerate(nodes)}
+    for n in costs:
+        if n not in index:
+            index[n] = len(nodes)
+            nodes.append(n)
+            successors.append([])
+            in_degree.append(0)
+    order = _order(nodes, successors, in_degree)
+    cost = [float(costs.get(n, 0.0)) for n in nodes]
+    predecessors = [[] for _ in nodes]
+    for i in order:
+        for j in successors[i]:
+            predecessors[j].append(i)
+
+    # forwards: the earliest each node can start, and what it waits on
+    earliest = [0.0] * len(nodes)
+    waits_on = [None] * len(nodes)
+    for i in order:
+        for j in predecessors[i]:
+            if waits_on[i] is None or earliest[j] + cost[j] > earliest[i]:
+                earliest[i] = earliest[j] + cost[j]
+                waits_on[i] = j
+    length = max([earliest[i] + cost[i] for i in order] or [0.0])
+
+    # backwards: the latest each node can start, without delaying the end
+    latest = [0.0] * len(nodes)
+    for i in reversed(order):
+        finish = min([latest[j] for j in successors[i]] or [length])
+        latest[i] = finish - cost[i]
+
+    path = []
+    if order:
+        # (the last node to finish; of those, the last in order)
+        i = max(reversed(order), key=lambda i: earliest[i] + cost[i])
+        while i is not None:
+            path.append(nodes[i])
+            i = waits_on[i]
+        path.reverse()
+
+    total = sum(cost)
+    return {TOTAL: total,
+            LENGTH: length,
+            SPEEDUP: total / length if length > 0 else 1.0,
+            CRITICAL_PATH: path,
+            NODES: {nodes[i]: {COST: cost[i],
+                               EARLIEST_START: earliest[i],
+                               LATEST_START: latest[i],
+                               SLACK: max(0.0, latest[i] - earliest[i])}
+                    for i in order},
+            REDUNDANT_EDGES: redundant_edges(edges)}
+
+
+def remaining(edges, costs):
+    """Return {node: cost of the longest path from the node, inclusive}.
+
+    This is how much of the run is left, at the least, when the node
+    starts; nodes without a cost cost nothing.
+    """
+    nodes, successors, in_degree = kahn.index_graph(edges)
+    cost = [float(costs.get(n, 0.0)) for n in nodes]
+    tail = [0.0] * len(nodes)
+    for i in reversed(_order(nodes, successors, in_degree)):
+        tail[i] = cost[i] + max([tail[j] for j in successors[i]] or [0.0])
+    return {nodes[i]: tail[i] for i in range(len(nodes))}
+
+
+def redundant_edges(edges):
+    """Return [(before, after), ...]: the edges that other edges imply.
+
+    Removing them all leaves the transitive reduction of the graph,
+    which orders the nodes exactly as the original did.
+    """
+    nodes, successors, in_degree = kahn.index_graph(edges)
+    order = _order(nodes, successors, in_degree)
+    # descendants[i] -- bit j set, if j can be reached from i (not by
+    # i's own edge to j, necessarily, but by any path at all)
+    descendants = [0] * len(nodes)
+    redundant = []
+    for i in reversed(order):
+        implied = 0  # reachable through some successor
+        reach = 0
+        for j in successors[i]:
+            implied |= descendants[j]
+            reach |= descendants[j] | (1 << j)
+        descendants[i] = reach
+        for j in successors[i]:
+            if implied >> j & 1:
+                redundant.append((nodes[i], nodes[j]))
+    return redundant
+
+
+def _order(nodes, successors, in_degree):
+    """Return the node indexes, topologically sorted."""
+    remaining = list(in_degree)
+    queue = deque(i for i in range(len(nodes)) if remaining[i] == 0)
+    order = []
+    while queue:
+        i = queue.popleft()
+        order.append(i)
+        for j in successors[i]:
+            remaining[j] -= 1
+            if remaining[j] == 0:
+                queue.append(j)
+    if len(order) != len(nodes):
+        raise kahn.CycleDetected(kahn._find_cycle(nodes, successors,
+                                                  remaining))
+    return order
+
+
+def format_report(report):
+    """Return the report as text: the critical path, then every node."""
+    lines = ["critical path: %.3f ms, of %.3f ms in all "
+             "(parallel speedup: at most %.2fx)" %
+             (report[LENGTH] * 1e3, report[TOTAL] * 1e3, report[SPEEDUP])]
+    for n in report[CRITICAL_PATH]:
+        lines.append("  %-40s %10.3f ms" % (n, report[NODES][n][COST] * 1e3))
+    lines.append("")
+    lines.append("%-40s %10s %10s %10s" % ("node", "cost ms", "start ms",
+                                           "slack ms"))
+    by_start = sorted(report[NODES].items(),
+                      key=lambda item: item[1][EARLIEST_START])
+    for (n, D) in by_start:
+        lines.append("%-40s %10.3f %10.3f %10.3f" %
+                     (n, D[COST] * 1e3, D[EARLIEST_START] * 1e3,
+                      D[SLACK] * 1e3))
+    if report[REDUNDANT_EDGES]:
+        lines.append("")
+        lines.append("redundant edges (implied by others):")
+        for (u, v) in report[REDUNDANT_EDGES]:
+            lines.append("  %s -> %s" % (u, v))
+    return "\n".join(lines) + "\n"
+
+
+def env_explain_filepath():
+    """Return the environment's explain filepath, or else None."""
+    return os.environ.get(kENV_EXPLAIN_FILEPATH) or None
+
+
+def write_report(report, filepath):
+    """Write the report to filepath: as JSON, if it ends in .json, or text."""
+    with open(filepath, "w") as f:
+        if str(filepath).endswith(".json"):
+            json.dump(report, f, indent=1)
+        else:
+            f.write(format_report(report))
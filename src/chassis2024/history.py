@@ -0,0 +1,93 @@
+# Copyright 2024 Lion Kimbro
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""per-node durations, remembered from run to run
+
+When the execution spec names a HISTORY_FILEPATH, the chassis measures
+how long each execution node takes (see instrument.py), and records it
+in a small JSON file:
+
+  {VERSION: 1,
+   DURATIONS: {"READ_BASICJSONPERSISTENCE": 0.0456, ...}}  # seconds
+
+Each run's measurement is blended with what was recorded before
+(kSMOOTHING of the new, the rest of the old), so that one slow run
+doesn't upset the schedule.  Nodes that weren't performed keep their
+old durations.
+
+On the next run, priorities() turns the durations into, for each node,
+the cost of the longest path remaining from it (the node included), so
+that the chassis can start the slowest chains first -- both in the
+calculated order (kahn.topological_sort's key), and among the nodes
+that are ready at once, when executing in parallel.
+
+With no history, there are no priorities, and the order is exactly
+what it would have been without a HISTORY_FILEPATH.
+"""
+
+import os
+import json
+import pathlib
+
+from . import explain
+
+
+# keys in the history file
+
+VERSION = "VERSION"
+DURATIONS = "DURATIONS"
+
+
+# constants
+
+kVERSION = 1
+kSMOOTHING = 0.5  # weight of the newest measurement
+
+
+# entry
+
+def load(filepath):
+    """Return {node: seconds} recorded in filepath, or {} if there's none."""
+    try:
+        with open(filepath) as f:
+            D = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(D, dict) or D.get(VERSION) != kVERSION:
+        return {}
+    durations = D.get(DURATIONS)
+    if not isinstance(durations, dict):
+        return {}
+    return {n: float(t) for (n, t) in durations.items()
+            if isinstance(t, (int, float))}
+
+def blend(durations, measured):
+    """Return durations, updated with newly measured ones."""
+    blended = dict(durations)
+    for (n, t) in measured.items():
+        if n in blended:
+            blended[n] = kSMOOTHING * t + (1 - kSMOOTHING) * blended[n]
+        else:
+            blended[n] = t
+    return blended
+
+def save(filepath, durations):
+    """Write durations to filepath.  Quietly does nothing on failure."""
+    filepath = pathlib.Path(filepath)
+    tmp = filepath.with_name(filepath.name + ".tmp")
+    try:
+        with open(tmp, "w") as f:
+            json.dump({VERSION: kVERSION,
+                       DURATIONS: durations}, f, indent=1, sort_keys=True)
+        os.replace(tmp, filepath)
+    except (OSError, TypeError, ValueError):
+        pass  # history is an optimization; never fail the run over it
+
+def priorities(edges, durations):
+    """Return {node: seconds of the longest path remaining from it}.
+
+    Returns None if there are no durations (and so no priorities.)
+    """
+    if not durations:
+        return None
+    return explain.remaining(edges, durations)
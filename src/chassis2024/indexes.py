@@ -0,0 +1,260 @@
+# Copyright 2024 Lion Kimbro
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""secondary indexes over a dictionary of records
+
+An Index maps the value found at a field path, within each top-level
+value (a "record"), to the top-level keys of the records that have it:
+
+  D = {"u1": {"name": "ann", "address": {"city": "Oslo"}},
+       "u2": {"name": "bob", "address": {"city": "Oslo"}}}
+
+  by_city = Index(["address", "city"])
+  by_city.build(D)
+  by_city.lookup("Oslo")  # -> ["u1", "u2"], in O(1)
+  by_city.range("A", "P")  # -> keys with "A" <= city < "P", in O(log n)
+
+Only scalar field values (str, int, float, bool, None) are indexed; a
+record without the field, or with something else there, is left out.
+True and 1 are told apart, though 1 and 1.0 are not.
+
+Indexes keeps a set of named indexes up to date with a dictionary that
+keeps a record of changes (tracked.TrackedDict, or TrackedMapping): it
+listens on the dictionary's .on_key_change hook, notes each key that
+changes, and re-indexes those keys at the next lookup.  As with the
+record of changes itself, a change made deep within a value has to be
+reported by touching the key.
+
+Building an index reads every record: under a dictionary that decodes
+values as they're first accessed (lazyjson.LazyJSONDict, or
+shards.ShardedDict), it decodes them all.  So does re-indexing after the dictionary is
+cleared.  Indexes read back from a file (below) aren't built at all.
+
+Indexes can be written to a file, and read back (see .write() and
+.read()), so that they needn't be rebuilt every time the data is read;
+the file records the size and modification time of the data file that
+the indexes describe, and is ignored if it has changed since.
+"""
+
+import os
+import json
+import bisect
+
+
+# index file keys
+kSIZE = "SIZE"  # size of the data file the indexes describe, in bytes
+kMTIME_NS = "MTIME_NS"  # its modification time
+kINDEXES = "INDEXES"  # {name: {PATH: [...], ENTRIES: [[key, value], ...]}}
+kPATH = "PATH"
+kENTRIES = "ENTRIES"
+
+_MISSING = object()  # (the field value of a record without the field)
+
+# (each kind of scalar sorts, and is looked up, apart from the others)
+kRANKS = {type(None): 0, bool: 1, int: 2, float: 2, str: 3}
+
+
+def path_of(spec):
+    """Return a field path, as a tuple, from "field", or [key, key, ...]."""
+    if isinstance(spec, str):
+        return (spec,)
+    return tuple(spec)
+
+def _slot(value):
+    return (kRANKS[type(value)], value)
+
+
+class Index:
+
+    def __init__(self, path):
+        self.path = path_of(path)  # (key, key, ...) within each record
+        self.keys_by_slot = {}  # {(rank, value): {key: None, ...}}
+        self.slot_by_key = {}  # {key: (rank, value)}
+        self.ordered = []  # sorted [(rank, value), ...], of keys_by_slot
+
+    def field(self, record):
+        """Return the value at the path within record, or _MISSING."""
+        value = record
+        for step in self.path:
+            try:
+                value = value[step]
+            except (KeyError, IndexError, TypeError):
+                return _MISSING
+        if type(value) not in kRANKS:
+            return _MISSING
+        return value
+
+    def build(self, D):
+        self._clear()
+        for (key, record) in D.items():
+            value = self.field(record)
+            if value is not _MISSING:
+                self._add(key, value)
+        self.ordered = sorted(self.keys_by_slot)
+
+    def _clear(self):
+        """Empty the index, for refilling; .ordered is None until sorted."""
+        self.keys_by_slot = {}
+        self.slot_by_key = {}
+        self.ordered = None
+
+    def add(self, key, record):
+        """Index record, at top-level key (replacing what was there.)"""
+        self.remove(key)
+        value = self.field(record)
+        if value is not _MISSING:
+            self._add(key, value)
+
+    def _add(self, key, value):
+        slot = _slot(value)
+        keys = self.keys_by_slot.get(slot)
+        if keys is None:
+            keys = self.keys_by_slot[slot] = {}
+            if self.ordered is not None:
+                bisect.insort(self.ordered, slot)
+        keys[key] = None
+        self.slot_by_key[key] = slot
+
+    def remove(self, key):
+        slot = self.slot_by_key.pop(key, None)
+        if slot is not None:
+            keys = self.keys_by_slot[slot]
+            del keys[key]
+            if not keys:
+                del self.keys_by_slot[slot]
+                del self.ordered[bisect.bisect_left(self.ordered, slot)]
+
+    # lookups
+
+    def lookup(self, value):
+        """Return the keys of the records whose field equals value."""
+        if type(value) not in kRANKS:
+            return []
+        return list(self.keys_by_slot.get(_slot(value), ()))
+
+    def range(self, low=None, high=None):
+        """Return the keys of the records with low <= field < high.
+
+        Either bound may be None, for no bound; the bounds given must be
+        of one kind (strings, or numbers, ...), and only fields of that
+        kind are returned.  Keys come in order of their field values.
+        """
+        bounds = [bound for bound in (low, high) if bound is not None]
+        if not bounds:
+            return list(self.slot_by_key)
+        rank = kRANKS[type(bounds[0])]
+        start = bisect.bisect_left(self.ordered, _slot(low)
+                                   if low is not None else (rank,))
+        end = bisect.bisect_left(self.ordered, _slot(high)
+                                 if high is not None else (rank + 1,))
+        return [key for slot in self.ordered[start:end]
+                for key in self.keys_by_slot[slot]]
+
+    def __len__(self):
+        return len(self.slot_by_key)
+
+    # persistence
+
+    def entries(self):
+        return [[key, slot[1]] for (key, slot) in self.slot_by_key.items()]
+
+    def load(self, entries):
+        self._clear()
+        for (key, value) in entries:
+            self._add(key, value)
+        self.ordered = sorted(self.keys_by_slot)
+
+
+class Indexes:
+    """Named indexes, kept up to date with a tracked dictionary."""
+
+    def __init__(self, specs):
+        """specs is {name: field path}."""
+        self.indexes = {name: Index(path) for (name, path) in specs.items()}
+        self.data = None  # the dictionary indexed
+        self.pending = set()  # {key, ...} changed since last indexed
+        self.rebuild = False  # whether everything is to be re-indexed
+        self.loaded = set()  # {name, ...} of indexes read from a file
+
+    def watch(self, D):
+        """Index D (unless read() has), and follow its changes from now on.
+
+        Building an index decodes every value of D; see above.
+        """
+        self.data = D
+        D.on_key_change = self.changed
+        for (name, index) in self.indexes.items():
+            if name not in self.loaded:
+                index.build(D)
+
+    def changed(self, key):
+        """Note that key has changed (or, if None, that all have.)"""
+        if key is None:
+            self.rebuild = True
+            self.pending = set()
+        else:
+            self.pending.add(key)
+
+    def sync(self):
+        """Re-index the keys changed since the last time."""
+        D = self.data
+        if self.rebuild:
+            self.rebuild = False
+            self.pending = set()
+            for index in self.indexes.values():
+                index.build(D)
+            return
+        pending, self.pending = self.pending, set()
+        for key in pending:
+            record = D.get(key, _MISSING)
+            for index in self.indexes.values():
+                if record is _MISSING:
+                    index.remove(key)
+                else:
+                    index.add(key, record)
+
+    def __getitem__(self, name):
+        """Return the index of that name, up to date."""
+        if self.pending or self.rebuild:
+            self.sync()
+        return self.indexes[name]
+
+    # index files
+
+    def write(self, index_filepath, filepath):
+        """Record the indexes, as describing filepath, as it now is.
+
+        Failure to write is ignored; the index file is only a shortcut.
+        """
+        self.sync()
+        st = os.stat(filepath)
+        D = {kSIZE: st.st_size,
+             kMTIME_NS: st.st_mtime_ns,
+             kINDEXES: {name: {kPATH: list(index.path),
+                               kENTRIES: index.entries()}
+                        for (name, index) in self.indexes.items()}}
+        try:
+            with open(index_filepath, "w", encoding="utf-8") as f:
+                json.dump(D, f)
+        except (OSError, TypeError, ValueError):
+            pass
+
+    def read(self, index_filepath, filepath):
+        """Load the indexes recorded for filepath, if it hasn't changed.
+
+        Indexes that aren't in the file (or whose paths differ) are
+        left empty, for .watch() to build.
+        """
+        try:
+            with open(index_filepath, encoding="utf-8") as f:
+                D = json.load(f)
+            st = os.stat(filepath)
+        except (OSError, ValueError):
+            return
+        if (D.get(kSIZE), D.get(kMTIME_NS)) != (st.st_size, st.st_mtime_ns):
+            return
+        for (name, index) in self.indexes.items():
+            recorded = D[kINDEXES].get(name)
+            if recorded is not None and tuple(recorded[kPATH]) == index.path:
+                index.load(recorded[kENTRIES])
+                self.loaded.add(name)
@@ -0,0 +1,130 @@
+# Copyright 2024 Lion Kimbro
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""timing instrumentation for execution nodes and termination callbacks
+
+When instrumentation is turned on, chassis2024 measures the wall time
+and the CPU time (of the thread doing the work) spent performing each
+execution node, and in each call_before_termination callback.
+
+Turn it on in the execution spec:
+
+  EXECUTION_SPEC = {
+      CHASSIS2024: {
+          INSTRUMENT: True,
+          TRACE_FILEPATH: "./trace.json"  # optional; implies INSTRUMENT
+      }
+  }
+
+...or from the environment, without touching the program:
+
+  CHASSIS2024_INSTRUMENT=1
+  CHASSIS2024_TRACE_FILEPATH=./trace.json
+
+After the run, the measurements are in chassis2024.chassis.instrumentation
+(a Recorder), as .records:
+
+  [{NAME: "READ_BASICJSONPERSISTENCE",
+    KIND: NODE,  # or CALLBACK
+    START: 0.0123,  # seconds since the run began
+    WALL: 0.0456,  # seconds
+    CPU: 0.0401,  # seconds
+    THREAD: 140245...},  # threading.get_ident()
+   ...]
+
+If a TRACE_FILEPATH was given, they are also written there in Chrome's
+trace-event JSON format, which chrome://tracing and Perfetto can load.
+
+For coroutine nodes (under run_async), CPU time is that of the event
+loop's thread during the node, and so includes other tasks that ran
+while the node was waiting.
+"""
+
+import os
+import json
+import time
+import threading
+
+
+# record keys
+
+NAME = "NAME"
+KIND = "KIND"
+START = "START"
+WALL = "WALL"
+CPU = "CPU"
+THREAD = "THREAD"
+
+# record kinds
+
+NODE = "NODE"
+CALLBACK = "CALLBACK"
+
+# environment variables
+
+kENV_INSTRUMENT = "CHASSIS2024_INSTRUMENT"
+kENV_TRACE_FILEPATH = "CHASSIS2024_TRACE_FILEPATH"
+
+
+class Recorder:
+    """Collects timing records; safe to use from several threads."""
+
+    def __init__(self):
+        self.records = []
+        self.origin = time.perf_counter()
+
+    def measure(self, kind, name):
+        """Return a context manager that records the time spent within it."""
+        return _Measurement(self, kind, name)
+
+    def chrome_trace(self):
+        """Return the records as a Chrome trace-event JSON object."""
+        pid = os.getpid()
+        events = [{"name": str(r[NAME]),
+                   "cat": r[KIND],
+                   "ph": "X",
+                   "ts": r[START] * 1e6,
+                   "dur": r[WALL] * 1e6,
+                   "pid": pid,
+                   "tid": r[THREAD],
+                   "args": {"cpu_ms": r[CPU] * 1e3}}
+                  for r in self.records]
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write_chrome_trace(self, filepath):
+        with open(filepath, "w") as f:
+            json.dump(self.chrome_trace(), f)
+
+
+class _Measurement:
+
+    def __init__(self, recorder, kind, name):
+        self.recorder = recorder
+        self.kind = kind
+        self.name = name
+
+    def __enter__(self):
+        self.cpu = time.thread_time()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        wall = time.perf_counter() - self.start
+        cpu = time.thread_time() - self.cpu
+        # list.append is atomic; no lock needed
+        self.recorder.records.append({NAME: self.name,
+                                      KIND: self.kind,
+                                      START: self.start - self.recorder.origin,
+                                      WALL: wall,
+                                      CPU: cpu,
+                                      THREAD: threading.get_ident()})
+        return False
+
+
+def env_instrument():
+    """Return True if the environment asks for instrumentation."""
+    return os.environ.get(kENV_INSTRUMENT, "") not in ("", "0")
+
+def env_trace_filepath():
+    """Return the environment's trace filepath, or else None."""
+    return os.environ.get(kENV_TRACE_FILEPATH) or None
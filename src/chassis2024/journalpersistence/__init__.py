@@ -0,0 +1,460 @@
+# Copyright 2024 Lion Kimbro
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""a JSON snapshot, plus an append-only journal of changes to it
+
+
+STAGES:
+------------------------------------------------------------------------
+
+  <CLEAR>
+  + *CLEAR_JOURNALPERSISTENCE  -- Nulls data
+  <RESET>
+  + *RESET_JOURNALPERSISTENCE  -- Nulls data
+  <ARGPARSE>
+  + *READ_JOURNALPERSISTENCE  -- reads snapshot, and replays journal
+    READ_PERSISTENCE
+  <ACTIVATE>
+
+  (key):  <BUILT-IN EXECUTION NODE>
+          + CREATED EXECUTION NODE
+          *IMPLEMENTED_EXECUTION_NODE
+             (executed via this module's
+              .perform_execution_graph_node(n) implementation)
+
+
+INTERFACES IMPLEMENTED:
+------------------------------------------------------------------------
+
+  Interface "PERSISTENCE_DATA":
+
+    .data()  -- returns the dictionary of loaded persistence data
+                (a chassis2024.tracked.TrackedDict)
+    .save()  -- appends the changes made since the last save to the
+                journal (compacting, if the journal has grown too long)
+    .dirty()  -- returns whether the data has changed since it was
+                 loaded or last saved
+    .compact()  -- writes a fresh snapshot, and empties the journal
+    .save_at_exit(False)  -- turns off exit-time persistence data saving
+    .save_at_exit(True)  -- turns back on exit-time persistence data saving
+    .save_at_exit()  -- returns whether exit-time persistence data saving is
+                        active or not (default is [True]: yes, saving,
+                        though this is configurable in the execution spec.)
+
+
+INTERFACES CONSUMED:
+------------------------------------------------------------------------
+
+  Interface "ARGPARSE"
+
+    .args.persistence_file_filepath  -- checked for a specification of the
+                                        snapshot file's filepath
+                                        (overrides execution-spec specified
+                                         value)
+
+
+CONFIGURATION PROCEDURES:
+------------------------------------------------------------------------
+
+  This is a drop-in replacement for chassis2024.basicjsonpersistence;
+  use one or the other, not both.  It is configured the same way, by
+  way of the execution spec, with a few additional keys.
+
+  (example:)
+  ----------------------------------------------------------------------
+  ...
+  import chassis2024.journalpersistence
+  ...
+  from chassis2024.journalpersistence.words import *
+  ...
+
+  EXECUTION_SPEC = {
+      JOURNALPERSISTENCE: {
+          SAVE_AT_EXIT: True,
+          CREATE_FOLDER: True,
+          FILEPATH: "./data/echo_persistence_data.json",
+          FSYNC: FSYNC_ALWAYS,
+          COMPACT_THRESHOLD: 16*1024*1024
+      }
+  }
+  ----------------------------------------------------------------------
+
+  The snapshot is kept at FILEPATH, and is an ordinary JSON file (so
+  basicjsonpersistence can read it, after a compaction.)  The journal
+  is kept beside it, at FILEPATH + ".journal".
+
+  FSYNC says how hard to try to get each save onto the disk:
+
+    FSYNC_ALWAYS  -- (default) every save is fsync'ed before .save()
+                     returns; a save that returned survives a power
+                     outage
+    FSYNC_ON_COMPACT  -- only snapshots are fsync'ed; a crash may lose
+                         the last few saves, but never corrupts the data
+    FSYNC_NEVER  -- nothing is fsync'ed; the operating system decides
+
+  COMPACT_THRESHOLD is the size, in bytes, past which the journal is
+  folded into a new snapshot at the end of a save.
+
+  The ARGPARSE arrangements are exactly those of basicjsonpersistence:
+  chassis2024.journalpersistence.argparse_configure(parser) adds a
+  "-f"/"--persistence-filepath" option, storing to the argparse dest
+  "persistence_file_filepath".
+
+
+USE PROCEDURES:
+------------------------------------------------------------------------
+
+  Access the data via the .data() method on the interface.
+
+  (by way of example:)
+  ----------------------------------------------------------------------
+  D = chassis2024.interface(PERSISTENCE_DATA, required=True).data()
+  ----------------------------------------------------------------------
+
+  Assigning or deleting a top-level key is recorded, and at the next
+  save, one journal line is appended, listing each changed key -- so
+  the cost of a save follows the size of the change, not the size of
+  the data.
+
+  Changes made deep within a value can't be seen by the dictionary, and
+  must be reported by touching the key:
+
+  ----------------------------------------------------------------------
+  D["scores"].append(10)
+  D.touch("scores")
+  ----------------------------------------------------------------------
+
+  Each save is appended as a single line, in a single write.  If the
+  process dies in the middle of one, the torn last line of the journal
+  is discarded when the data is next read, and the data is as it was
+  at the prior save: a save is applied whole, or not at all.
+  Compaction first appends any unsaved changes to the journal, then
+  writes the new snapshot to a temporary file, and renames it over the
+  old one, and only then empties the journal; replaying a journal over
+  a snapshot that already contains all of it changes nothing, so a
+  crash at any point of a compaction loses nothing.
+
+  Exit-time saving is on by default, and can be toggled, just as with
+  basicjsonpersistence:
+
+  ----------------------------------------------------------------------
+  chassis2024.interface(PERSISTENCE_DATA, required=True).save_at_exit(False)
+  ----------------------------------------------------------------------
+"""
+
+
+import os
+import sys
+import json
+import pathlib
+
+import chassis2024
+from chassis2024.words import *
+from chassis2024.tracked import TrackedDict
+
+from ..words import *
+from .words import *
+
+
+CHASSIS2024_SPEC = {
+    EXECUTES_GRAPH_NODES: [CLEAR_JOURNALPERSISTENCE,
+                           RESET_JOURNALPERSISTENCE,
+                           READ_JOURNALPERSISTENCE],
+    EXECUTION_GRAPH_SEQUENCES: [(CLEAR,
+                                 CLEAR_JOURNALPERSISTENCE,  # *
+                                 RESET,
+                                 RESET_JOURNALPERSISTENCE,  # *
+                                 ARGPARSE,
+                                 READ_JOURNALPERSISTENCE,  # *
+                                 READ_PERSISTENCE,
+                                 ACTIVATE)],
+    INTERFACES: {PERSISTENCE_DATA: sys.modules[__name__]}
+}
+
+chassis2024.register(sys.modules[__name__])
+
+
+# constants
+
+kDEFAULT_PERSISTENCE_FILEPATH = "./persistent_data.json"
+
+kJOURNAL_SUFFIX = ".journal"
+
+# do NOT create folders, by default (execution spec key: CREATE_FOLDER)
+kDEFAULT_CREATE_FOLDER_POLICY = False
+
+kDEFAULT_SAVE_AT_EXIT = True
+
+kDEFAULT_FSYNC = FSYNC_ALWAYS
+
+kDEFAULT_COMPACT_THRESHOLD = 16*1024*1024  # bytes of journal
+
+kARGPARSE_PERSISTENCE_FILE_FILEPATH = "persistence_file_filepath"
+
+# journal records (one line per save: a JSON array of these operations)
+kSET = "set"  # ["set", key, value]
+kDEL = "del"  # ["del", key]
+kCLEAR = "clear"  # ["clear"]
+
+
+# state (one per chassis; see chassis.Chassis.component_state)
+
+class _State:
+    def __init__(self):
+        self.data = None  # the data (will be a dictionary) kept in RAM
+        self.save_at_exit = None  # whether to save at exit, or not [bool]
+        self.filepath = None  # filepath to the snapshot file [pathlib.Path]
+        self.initial_cwd = None  # initial CWD [pathlib.Path]
+        self.fsync = None  # FSYNC_ALWAYS, FSYNC_ON_COMPACT, or FSYNC_NEVER
+        self.compact_threshold = None  # journal size that compacts [int]
+        self.journal_size = None  # bytes of valid journal on disk [int]
+
+def _state():
+    return chassis2024.chassis.current().component_state(__name__, _State)
+
+
+# convert a string path to a pathlib.Path
+
+def _str_to_path(str_path):
+    """Convert string path specification to a pathlib.Path.
+    
+    Two critical considerations are:
+    * ~/ is expanded to the user's home directory, cross-platform.
+    * Relative paths are resolved relative to the execution's original
+      working directory (which was recorded during the
+      CLEAR_JOURNALPERSISTENCE execution node.)
+    """
+    p = pathlib.Path(str_path).expanduser()
+    if not p.is_absolute():
+        return _state().initial_cwd / p
+    else:
+        return p
+
+def _journal_filepath():
+    filepath = _state().filepath
+    return filepath.with_name(filepath.name + kJOURNAL_SUFFIX)
+
+
+# read execution_spec
+
+def _execution_spec_section():
+    """Return the execution spec's JOURNALPERSISTENCE, or else None."""
+    return chassis2024.execution_spec.get(JOURNALPERSISTENCE, None)
+
+def _execution_spec_create_folder():
+    """Return the CREATE_FOLDER value from the execution spec, or else None"""
+    return (_execution_spec_section() or {}).get(CREATE_FOLDER)
+
+def _execution_spec_persistence_file_filepath():
+    """Return execution spec's filepath as a pathlib.Path, or else None"""
+    filepath = (_execution_spec_section() or {}).get(FILEPATH)
+    return _str_to_path(filepath) if filepath else None
+
+def _execution_spec_save_at_exit():
+    """Return execution spec's SAVE_AT_EXIT, or else None."""
+    return (_execution_spec_section() or {}).get(SAVE_AT_EXIT)
+
+def _execution_spec_fsync():
+    """Return execution spec's FSYNC, or else the default."""
+    return (_execution_spec_section() or {}).get(FSYNC) or kDEFAULT_FSYNC
+
+def _execution_spec_compact_threshold():
+    """Return execution spec's COMPACT_THRESHOLD, or else the default."""
+    threshold = (_execution_spec_section() or {}).get(COMPACT_THRESHOLD)
+    return kDEFAULT_COMPACT_THRESHOLD if threshold is None else threshold
+
+
+# ARGPARSE module cooperation
+
+def argparse_configure(parser, shortkey="-f", longkey="--persistence-filepath"):
+    group = parser.add_argument_group("Persistent Data",
+                                      "Configuring persistent data access")
+    group.add_argument(shortkey, longkey,
+                       dest=kARGPARSE_PERSISTENCE_FILE_FILEPATH,
+                       metavar="file",
+                       help="path to persistence file",
+                       default=(_execution_spec_persistence_file_filepath() or
+                                kDEFAULT_PERSISTENCE_FILEPATH))
+
+def _commandline_persistence_file_filepath():
+    """If ARGPARSE component is in use, read the persistence filepath."""
+    parser = chassis2024.interface(ARGPARSE)
+    if parser is None:
+        return None
+    else:
+        p = getattr(parser.args, kARGPARSE_PERSISTENCE_FILE_FILEPATH, None)
+        return _str_to_path(p) if p else None
+
+
+# creating parent folders for the filepath, if required
+
+def _create_folder_policy():
+    """First, check the execution spec.  If not specified, return default."""
+    policy = _execution_spec_create_folder()
+    if policy is None:
+        return kDEFAULT_CREATE_FOLDER_POLICY
+    else:
+        return policy  # True or False
+
+def _create_folder():
+    filepath = _state().filepath
+    if not filepath.parent.exists():
+        filepath.parent.mkdir(parents=True)
+
+
+# entry
+
+def perform_execution_graph_node(n):
+    S = _state()
+    if n == CLEAR_JOURNALPERSISTENCE:
+        S.data = None
+        S.save_at_exit = None
+        S.filepath = None
+        S.initial_cwd = pathlib.Path.cwd()
+        
+    elif n == RESET_JOURNALPERSISTENCE:
+        S.data = None
+        S.filepath = None
+        val = _execution_spec_save_at_exit()
+        S.save_at_exit = kDEFAULT_SAVE_AT_EXIT if val is None else val
+        S.fsync = _execution_spec_fsync()
+        if S.fsync not in (FSYNC_ALWAYS, FSYNC_ON_COMPACT, FSYNC_NEVER):
+            raise ValueError(S.fsync)
+        S.compact_threshold = _execution_spec_compact_threshold()
+
+    elif n == READ_JOURNALPERSISTENCE:
+        # First, make sure that while closing down, that the data is saved.
+        chassis2024.chassis.call_before_termination(_do_final_save)
+
+        S.data = TrackedDict()
+        S.filepath = _str_to_path(kDEFAULT_PERSISTENCE_FILEPATH)
+        S.filepath = _execution_spec_persistence_file_filepath() or S.filepath
+        S.filepath = _commandline_persistence_file_filepath() or S.filepath
+
+        # Read the snapshot, then replay the journal over it.
+        if S.filepath.exists():
+            with open(S.filepath, encoding="utf-8") as f:
+                dict.update(S.data, json.load(f))
+        S.journal_size = _replay(S.data)
+        S.data.reset_changes()
+
+def _replay(D):
+    """Apply the journal's records to D; return the valid journal's size.
+
+    A torn last line (from a crash in the middle of a save) is cut off
+    the journal, so that the next save appends after the last good one.
+    """
+    journal_filepath = _journal_filepath()
+    if not journal_filepath.exists():
+        return 0
+    with open(journal_filepath, "rb") as f:
+        raw = f.read()
+    end = raw.rfind(b"\n") + 1  # everything past here is torn
+    for line in raw[:end].splitlines():
+        for op in json.loads(line.decode("utf-8")):
+            if op[0] == kSET:
+                dict.__setitem__(D, op[1], op[2])
+            elif op[0] == kDEL:
+                dict.pop(D, op[1], None)
+            elif op[0] == kCLEAR:
+                dict.clear(D)
+            else:
+                raise ValueError(op[0])
+    if end < len(raw):
+        os.truncate(journal_filepath, end)
+    return end
+
+def _do_final_save():
+    if _state().save_at_exit:
+        save()
+
+
+# writing
+
+def _record(D):
+    """Return the journal line for D's changes since the last save."""
+    ops = []
+    if D.cleared:
+        ops.append([kCLEAR])
+    for key in D.changed:
+        if key in D:
+            ops.append([kSET, key, D[key]])
+        else:
+            ops.append([kDEL, key])
+    return (json.dumps(ops) + "\n").encode("utf-8")
+
+def _append(fsync):
+    """Append the changes since the last save (if any) to the journal."""
+    S = _state()
+    if not S.data.dirty():
+        return
+    if _create_folder_policy():
+        _create_folder()
+    raw = _record(S.data)
+    with open(_journal_filepath(), "ab") as f:
+        f.write(raw)
+        f.flush()
+        if fsync:
+            os.fsync(f.fileno())
+    S.journal_size += len(raw)
+    S.data.reset_changes()
+
+def _fsync_folder(folderpath):
+    """Make a rename within folderpath durable (where the OS allows it.)"""
+    try:
+        fd = os.open(folderpath, os.O_RDONLY)
+    except OSError:
+        return  # (Windows can't open folders)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+# interface PERSISTENCE_DATA
+
+def data():
+    return _state().data
+
+def save():
+    S = _state()
+    _append(S.fsync == FSYNC_ALWAYS)
+    if S.journal_size > S.compact_threshold:
+        compact()
+
+def compact():
+    S = _state()
+    # The journal must hold everything the snapshot will, before the
+    # snapshot replaces the old one: a crash before the journal is
+    # emptied replays all of it, over the new snapshot.
+    _append(S.fsync != FSYNC_NEVER)
+    if _create_folder_policy():
+        _create_folder()
+    tmp_filepath = S.filepath.with_name(S.filepath.name + ".tmp")
+    with open(tmp_filepath, "w", encoding="utf-8") as f:
+        json.dump(S.data, f)
+        f.flush()
+        if S.fsync != FSYNC_NEVER:
+            os.fsync(f.fileno())
+    os.replace(tmp_filepath, S.filepath)
+    if S.fsync != FSYNC_NEVER:
+        _fsync_folder(S.filepath.parent)
+    # Only now is it safe to let go of the journal.
+    with open(_journal_filepath(), "wb"):
+        pass
+    S.journal_size = 0
+    S.data.reset_changes()
+
+def dirty():
+    return _state().data.dirty()
+
+def save_at_exit(set_to=None):
+    S = _state()
+    if set_to is None:
+        return S.save_at_exit
+    elif set_to == True:
+        S.save_at_exit = True
+    elif set_to == False:
+        S.save_at_exit = False
+    else:
+        raise ValueError(set_to)
@@ -0,0 +1,27 @@
+# Copyright 2024 Lion Kimbro
+# SPDX-License-Identifier: BSD-3-Clause
+
+
+# execution nodes
+CLEAR_JOURNALPERSISTENCE = "CLEAR_JOURNALPERSISTENCE"
+RESET_JOURNALPERSISTENCE = "RESET_JOURNALPERSISTENCE"
+READ_JOURNALPERSISTENCE = "READ_JOURNALPERSISTENCE"
+READ_PERSISTENCE = "READ_PERSISTENCE"  # generic, shared
+
+
+# interfaces
+PERSISTENCE_DATA = "PERSISTENCE_DATA"
+
+
+# execution_spec info
+JOURNALPERSISTENCE = "JOURNALPERSISTENCE"  # primary key
+SAVE_AT_EXIT = "SAVE_AT_EXIT"  # True/False
+CREATE_FOLDER = "CREATE_FOLDER"  # True/False
+FILEPATH = "FILEPATH"  # "....json" snapshot filename (journal: + ".journal")
+FSYNC = "FSYNC"  # FSYNC_ALWAYS/FSYNC_ON_COMPACT/FSYNC_NEVER
+COMPACT_THRESHOLD = "COMPACT_THRESHOLD"  # int: journal bytes that trigger compaction
+
+# FSYNC values
+FSYNC_ALWAYS = "FSYNC_ALWAYS"  # fsync every save, and every compaction
+FSYNC_ON_COMPACT = "FSYNC_ON_COMPACT"  # fsync only when writing a snapshot
+FSYNC_NEVER = "FSYNC_NEVER"  # leave it to the operating system
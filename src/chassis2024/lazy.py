@@ -0,0 +1,75 @@
+# Copyright 2024 Lion Kimbro
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""lazily imported packages
+
+A package can be declared by module name, with a manifest that
+describes its participation without importing it:
+
+  chassis2024.register_lazy("myprogram.gui", {
+      EXECUTES_GRAPH_NODES: [CONNECT_GUI],
+      EXECUTION_GRAPH_SEQUENCES: [(CONNECT, CONNECT_GUI, ACTIVATE)],
+      INTERFACES: [GUI]  # just the names of the interfaces
+  })
+
+The manifest takes the place of the package's CHASSIS2024_SPEC, until
+the module is actually imported: either when one of its execution
+nodes is performed, or when chassis2024.interface(...) first asks for
+one of its interfaces.  At that point, the module's own CHASSIS2024_SPEC
+must agree with the manifest, or LazyManifestMismatch is raised.
+"""
+
+import importlib
+
+from .words import *
+from .exceptions import *
+
+
+class LazyPackage:
+    """Stands in for a package that hasn't been imported yet."""
+
+    def __init__(self, module_name, manifest):
+        self.__name__ = module_name
+        self.CHASSIS2024_SPEC = {
+            EXECUTES_GRAPH_NODES: list(manifest.get(EXECUTES_GRAPH_NODES, [])),
+            EXECUTION_GRAPH_SEQUENCES: list(manifest.get(EXECUTION_GRAPH_SEQUENCES, [])),
+            INTERFACES: {k: LazyInterface(self, k)
+                         for k in manifest.get(INTERFACES, [])}
+        }
+
+    def __repr__(self):
+        return "<lazy package %r>" % self.__name__
+
+    def module(self):
+        """Import (if need be) and return the actual module."""
+        return importlib.import_module(self.__name__)
+
+    def perform_execution_graph_node(self, n):
+        module = self.module()
+        D = getattr(module, CHASSIS2024_SPEC, {})
+        if n not in D.get(EXECUTES_GRAPH_NODES, []):
+            raise LazyManifestMismatch({PACKAGE: module,
+                                        EXECUTION_GRAPH_NODE: n})
+        return module.perform_execution_graph_node(n)
+
+
+class LazyInterface:
+    """Stands in for an interface implemented by a LazyPackage."""
+
+    def __init__(self, package, interface_name):
+        self.package = package
+        self.interface_name = interface_name
+
+    def __repr__(self):
+        return "<lazy interface %r of %r>" % (self.interface_name,
+                                              self.package.__name__)
+
+    def resolve(self):
+        """Import the package, and return the actual implementation."""
+        module = self.package.module()
+        D = getattr(module, CHASSIS2024_SPEC, {})
+        implementations = D.get(INTERFACES, {})
+        if self.interface_name not in implementations:
+            raise LazyManifestMismatch({PACKAGE: module,
+                                        INTERFACE: self.interface_name})
+        return implementations[self.interface_name]
@@ -0,0 +1,280 @@
+# Copyright 2024 Lion Kimbro
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""a JSON object, decoded one top-level key at a time
+
+LazyJSONDict reads a JSON object out of a buffer (typically, an mmap of
+the file), but only indexes it: for each top-level key, it records
+where the value's bytes begin and end.  A value is decoded the first
+time it is accessed.  Encoding the dictionary back out copies the
+bytes of values that were never accessed (or that still equal what
+was read) straight through, so a large file that a program touches in
+only two places is neither fully decoded when read, nor fully
+re-encoded when written.
+
+Scanning a file for its keys is, byte for byte, about as slow as
+decoding it, so the index can be kept in a small file of its own
+(see write_index() and read_index()); while that file is current, the
+data file itself isn't read at all until a value is needed.
+
+It keeps the same record of changes that tracked.TrackedDict keeps
+(.changed, .cleared, .dirty(), .reset_changes(), .touch(key), and the
+.on_change hook), but it is a tracked.TrackedMapping, not a dict:
+json.dumps(D) won't accept it directly (json.dumps(dict(D)) will, at
+the cost of decoding everything.)
+"""
+
+import os
+import re
+import json
+
+from .tracked import TrackedMapping
+
+
+# index file keys
+kSIZE = "SIZE"  # size of the indexed file, in bytes
+kMTIME_NS = "MTIME_NS"  # its modification time
+kENTRIES = "ENTRIES"  # [[key, start, end], ...]
+
+_WHITESPACE = re.compile(rb"[ \t\n\r]*")
+_STRING = re.compile(rb'"[^"\\]*(?:\\.[^"\\]*)*"', re.DOTALL)
+_SCALAR = re.compile(rb"[^,}\] \t\n\r]+")
+# (within a container: everything up to the next bracket, or next string
+#  that has brackets or escapes in it)
+_CONTENTS = re.compile(rb'(?:[^"\[\]{}]+|"[^"\\\[\]{}]*")*')
+
+kOPENERS = (b"{", b"[")
+kCLOSERS = (b"}", b"]")
+
+
+# indexing
+
+def index(buffer):
+    """Return [(key, start, end), ...] for a JSON object's top-level values.
+
+    The buffer is scanned, not parsed: it is only checked as far as it
+    takes to find where each value begins and ends.  (The values are
+    checked when they are decoded.)
+    """
+    entries = []
+    pos = _skip(buffer, 0)
+    if buffer[pos:pos+1] != b"{":
+        raise ValueError("expected a JSON object at offset %d" % pos)
+    pos = _skip(buffer, pos+1)
+    if buffer[pos:pos+1] == b"}":
+        return entries
+    while True:
+        m = _STRING.match(buffer, pos)
+        if m is None:
+            raise ValueError("expected a key at offset %d" % pos)
+        key = json.loads(m.group())
+        pos = _skip(buffer, m.end())
+        if buffer[pos:pos+1] != b":":
+            raise ValueError("expected ':' at offset %d" % pos)
+        start = _skip(buffer, pos+1)
+        end = _value_end(buffer, start)
+        entries.append((key, start, end))
+        pos = _skip(buffer, end)
+        c = buffer[pos:pos+1]
+        if c == b"}":
+            return entries
+        elif c != b",":
+            raise ValueError("expected ',' or '}' at offset %d" % pos)
+        pos = _skip(buffer, pos+1)
+
+def _skip(buffer, pos):
+    return _WHITESPACE.match(buffer, pos).end()
+
+def _value_end(buffer, start):
+    c = buffer[start:start+1]
+    if c == b'"':
+        m = _STRING.match(buffer, start)
+    elif c in kOPENERS:
+        return _container_end(buffer, start)
+    else:
+        m = _SCALAR.match(buffer, start)
+    if m is None:
+        raise ValueError("expected a value at offset %d" % start)
+    return m.end()
+
+def _container_end(buffer, start):
+    depth = 0
+    pos = start
+    while True:
+        pos = _CONTENTS.match(buffer, pos).end()
+        c = buffer[pos:pos+1]
+        if c == b'"':
+            m = _STRING.match(buffer, pos)
+            if m is None:
+                break
+            pos = m.end()
+        elif c in kOPENERS:
+            depth += 1
+            pos += 1
+        elif c in kCLOSERS:
+            depth -= 1
+            pos += 1
+            if depth == 0:
+                return pos
+        else:
+            break
+    raise ValueError("unterminated value at offset %d" % start)
+
+
+# index files
+
+def write_index(index_filepath, filepath, entries):
+    """Record entries as the index of filepath, as it now is.
+
+    Failure to write is ignored; the index is only ever a shortcut.
+    """
+    st = os.stat(filepath)
+    D = {kSIZE: st.st_size,
+         kMTIME_NS: st.st_mtime_ns,
+         kENTRIES: [list(entry) for entry in entries]}
+    try:
+        with open(index_filepath, "w", encoding="utf-8") as f:
+            json.dump(D, f)
+    except OSError:
+        pass
+
+def read_index(index_filepath, filepath):
+    """Return filepath's entries from index_filepath, or None if not current."""
+    try:
+        with open(index_filepath, encoding="utf-8") as f:
+            D = json.load(f)
+        st = os.stat(filepath)
+    except (OSError, ValueError):
+        return None
+    if (D.get(kSIZE), D.get(kMTIME_NS)) != (st.st_size, st.st_mtime_ns):
+        return None
+    return [tuple(entry) for entry in D[kENTRIES]]
+
+
+# the dictionary
+
+class _Raw:
+    """A value not yet decoded: buffer[start:end]"""
+    __slots__ = ("start", "end")
+
+    def __init__(self, start, end):
+        self.start = start
+        self.end = end
+
+
+class LazyJSONDict(TrackedMapping):
+
+    def __init__(self, buffer=None, entries=None):
+        """Index buffer (unless its index is given, as entries.)"""
+        TrackedMapping.__init__(self)
+        self.buffer = buffer  # the undecoded JSON [bytes-like, or None]
+        self.spans = {}  # {key: (start, end)} of each value in the buffer
+        if buffer is not None:
+            if entries is None:
+                entries = index(buffer)
+            for (key, start, end) in entries:
+                self.entries[key] = _Raw(start, end)
+                self.spans[key] = (start, end)
+
+    def _unloaded(self, value):
+        return isinstance(value, _Raw)
+
+    def _load(self, key, value):
+        value = json.loads(self.buffer[value.start:value.end])
+        self.entries[key] = value
+        return value
+
+    def index(self):
+        """Return [(key, start, end), ...] for the values in the buffer."""
+        return [(key, start, end)
+                for (key, (start, end)) in self.spans.items()]
+
+    def decoded(self):
+        """Return the keys whose values have been decoded (or assigned.)"""
+        return self.loaded()
+
+    def unchanged(self):
+        """Return True if encoding would reproduce the buffer's contents.
+
+        (Only values that have been decoded are compared; the rest
+         can't have changed.)
+        """
+        if list(self.entries) != list(self.spans):
+            return False
+        return all(self._original(key, value) is not None
+                   for (key, value) in list(self.entries.items())
+                   if not isinstance(value, _Raw))
+
+    def __repr__(self):
+        return "<LazyJSONDict: %d keys, %d decoded>" % (len(self.entries),
+                                                         len(self.decoded()))
+
+    # encoding
+
+    def encode(self):
+        """Return (raw, spans): the JSON bytes, and where each value went.
+
+        spans is {key: (start, end)}, locating each value within raw;
+        hand it to .rebase() once raw has been written out.
+        """
+        chunks = [b"{"]
+        spans = {}
+        offset = 1
+        for (key, value) in list(self.entries.items()):
+            if len(chunks) > 1:
+                chunks.append(b", ")
+                offset += 2
+            prefix = _encode_key(key) + b": "
+            value_bytes = self._original(key, value)
+            if value_bytes is None:
+                value_bytes = json.dumps(value).encode("utf-8")
+            offset += len(prefix)
+            spans[key] = (offset, offset + len(value_bytes))
+            offset += len(value_bytes)
+            chunks.append(prefix)
+            chunks.append(value_bytes)
+        chunks.append(b"}")
+        return b"".join(chunks), spans
+
+    def _original(self, key, value):
+        """Return the bytes value was read from, if it still equals them."""
+        if isinstance(value, _Raw):
+            return bytes(self.buffer[value.start:value.end])
+        span = self.spans.get(key)
+        if span is not None:
+            original = bytes(self.buffer[span[0]:span[1]])
+            if _same(json.loads(original), value):
+                return original
+        return None
+
+    def rebase(self, buffer, spans):
+        """Point undecoded values into a new buffer (see .encode().)
+
+        (Hold .lock from before the old buffer is released, until this
+         returns, if other threads may be reading values.)
+        """
+        self.buffer = buffer
+        self.spans = spans
+        for (key, (start, end)) in spans.items():
+            if isinstance(self.entries.get(key), _Raw):
+                self.entries[key] = _Raw(start, end)
+
+
+def _same(a, b):
+    """Return whether a and b are equal, and of the same types throughout.
+
+    (== alone won't do: True == 1 and 2.0 == 2, but they encode
+     differently.)
+    """
+    if type(a) is not type(b):
+        return False
+    if isinstance(a, dict):
+        return (a.keys() == b.keys() and
+                all(_same(a[key], b[key]) for key in a))
+    if isinstance(a, list):
+        return len(a) == len(b) and all(map(_same, a, b))
+    return a == b
+
+def _encode_key(key):
+    # (json's own rules for non-string keys: 1 -> "1", True -> "true", ...)
+    return json.dumps({key: 0})[1:-4].encode("utf-8")
@@ -0,0 +1,88 @@
+# Copyright 2024 Lion Kimbro
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""cached execution orders
+
+Before it can begin executing, chassis2024 finds the participating
+packages, assembles the execution graph from their CHASSIS2024_SPECs,
+and sorts it.  The sort is the one step whose result can be kept: save()
+writes the calculated order to a small JSON file, and load() returns it
+on a later run, in place of sorting again.
+
+A cached order is only used while it still holds: the same packages
+must participate, and the order must contain exactly the graph's nodes,
+and satisfy every one of its edges.  Checking that costs one dictionary
+lookup per edge, which is a good deal cheaper than sorting.  (A change
+to the specs that leaves the cached order valid -- removing an edge,
+say -- keeps the cached order, rather than the order a fresh sort
+would give.)
+
+Finding the packages and assembling the graph still happen on every
+run, so handlers and interfaces are always current, and packages
+declared lazily (see lazy.py) aren't imported to check the cache.
+"""
+
+import os
+import json
+import pathlib
+import operator
+
+
+# keys in the plan file
+
+VERSION = "VERSION"
+PACKAGES = "PACKAGES"
+ORDER = "ORDER"
+
+
+# constants
+
+kVERSION = 3
+
+_BEFORE = operator.itemgetter(0)
+_AFTER = operator.itemgetter(1)
+
+
+# entry
+
+def save(filepath, packages, order):
+    """Write the order to filepath.  Quietly does nothing if uncacheable."""
+    if not all(isinstance(n, str) for n in order):
+        return
+    plan = {VERSION: kVERSION,
+            PACKAGES: [m.__name__ for m in packages],
+            ORDER: list(order)}
+    filepath = pathlib.Path(filepath)
+    tmp = filepath.with_name(filepath.name + ".tmp")
+    try:
+        with open(tmp, "w") as f:
+            json.dump(plan, f)
+        os.replace(tmp, filepath)
+    except OSError:
+        pass  # a plan cache is an optimization; never fail the run over it
+
+def load(filepath, packages, edges):
+    """Return the cached order for packages and edges, or else None."""
+    try:
+        with open(filepath) as f:
+            plan = json.load(f)
+        if (plan.get(VERSION) != kVERSION or
+            plan.get(PACKAGES) != [m.__name__ for m in packages]):
+            return None
+        order = plan[ORDER]
+        position = {n: i for (i, n) in enumerate(order)}
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):
+        return None
+    return order if _valid(position, len(order), edges) else None
+
+def _valid(position, length, edges):
+    """Return whether position orders exactly edges' nodes, satisfying them."""
+    if len(position) != length:
+        return False  # (a node listed twice)
+    try:
+        befores = list(map(position.__getitem__, map(_BEFORE, edges)))
+        afters = list(map(position.__getitem__, map(_AFTER, edges)))
+    except (KeyError, TypeError, IndexError):
+        return False
+    return (not any(map(operator.ge, befores, afters)) and
+            len(set(befores).union(afters)) == length)
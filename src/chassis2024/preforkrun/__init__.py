@@ -0,0 +1,383 @@
+# Copyright 2024 Lion Kimbro
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""pre-fork runner -- sets up once, then runs RUN in forked workers
+
+
+STAGES:
+------------------------------------------------------------------------
+
+  <CLEAR>
+  <RESET>
+  + *RESET_PREFORKRUN  -- reads the configuration
+  <ARGPARSE>
+  <CONNECT>
+  <ACTIVATE>
+  *UP  -- forks the workers, and supervises them until they're done
+
+  (key):  <BUILT-IN EXECUTION NODE>
+          + CREATED EXECUTION NODE
+          *IMPLEMENTED_EXECUTION_NODE
+             (executed via this module's
+              .perform_execution_graph_node(n) implementation)
+
+
+INTERFACES IMPLEMENTED:
+------------------------------------------------------------------------
+
+  Interface "PREFORK":
+
+    .worker_number()  -- returns the worker's number (0, 1, ...), within
+                         a worker; None, in the parent process
+    .call_after_fork(cb)  -- calls cb() in each worker, as it starts
+                             (to re-open a connection, or re-seed a
+                              random number generator, say)
+    .call_before_worker_termination(cb)  -- calls cb() in each worker,
+                                            as it exits
+
+
+INTERFACES CONSUMED:
+------------------------------------------------------------------------
+
+  Interface "RUN"
+
+    .run()  -- called in each worker
+
+
+CONFIGURATION PROCEDURES:
+------------------------------------------------------------------------
+
+  This is a drop-in replacement for chassis2024.basicrun; use one or
+  the other, not both.  It is for POSIX systems (it uses os.fork.)
+
+  (example:)
+  ----------------------------------------------------------------------
+  ...
+  import chassis2024.preforkrun
+  ...
+  from chassis2024.preforkrun.words import *
+  ...
+
+  EXECUTION_SPEC = {
+      PREFORKRUN: {
+          WORKERS: 4,
+          RESTART: True,
+          MAX_RESTARTS: 10,
+          SHUTDOWN_TIMEOUT: 10.0
+      }
+  }
+  ----------------------------------------------------------------------
+
+  Every execution node before UP -- reading persistence data,
+  connecting, activating -- runs once, in the parent process.  At UP,
+  the parent forks WORKERS worker processes, and each one calls
+  .run() on interface RUN.  The workers share the parent's memory, as
+  it was at the fork, copy-on-write: data that the workers only read
+  is never copied.  (CPython's reference counting does write to the
+  objects that a worker touches, so the pages that hold them are
+  copied, as they're used.)
+
+  WORKERS defaults to the number of CPUs; with WORKERS 0, RUN is run
+  in the parent process, just as basicrun would (handy for debugging.)
+
+  A worker whose .run() returns is done, and isn't replaced.  A worker
+  that fails -- raises an exception, exits with a non-zero status, or
+  is killed by a signal -- is replaced by a fresh fork, with the same
+  worker number, as long as RESTART is True, and no more than
+  MAX_RESTARTS workers have been replaced so far.  When every worker
+  is done, UP completes; if any worker's last run failed, UP raises
+  ChildProcessError.
+
+  On SIGTERM or SIGINT, the parent stops replacing workers, sends each
+  worker SIGTERM, and waits up to SHUTDOWN_TIMEOUT seconds for them to
+  exit, before killing what remains with SIGKILL.  In a worker, SIGTERM
+  raises SystemExit, so that the worker's termination callbacks run.
+  (Signal handling is only arranged when UP runs on the main thread.)
+
+
+USE PROCEDURES:
+------------------------------------------------------------------------
+
+  call_before_termination callbacks are coordinated, so that each one
+  runs in exactly one kind of process:
+
+  * callbacks registered before UP (by persistence components, say)
+    run in the parent, once the workers are all done -- never in the
+    workers, so that, for example, the workers don't each save the
+    persistence data over one another
+
+  * callbacks registered in a worker (with
+    chassis2024.chassis.call_before_termination, during .run()) run in
+    that worker, as it exits
+
+  * callbacks given to PREFORK's .call_before_worker_termination(cb),
+    whenever that's called, run in every worker, as it exits
+
+  (by way of example:)
+  ----------------------------------------------------------------------
+  P = chassis2024.interface(PREFORK, required=True)
+  P.call_after_fork(reconnect)
+  P.call_before_worker_termination(flush_worker_log)
+  ----------------------------------------------------------------------
+
+  Changes a worker makes to persistence data stay in that worker; the
+  parent saves its own copy.  Share state between workers by other
+  means (a database, say.)
+"""
+
+
+import os
+import sys
+import time
+import signal
+import threading
+import traceback
+
+import chassis2024
+from chassis2024.words import *
+
+from .words import *
+
+
+CHASSIS2024_SPEC = {
+    EXECUTES_GRAPH_NODES: [RESET_PREFORKRUN, UP],
+    EXECUTION_GRAPH_SEQUENCES: [(RESET, RESET_PREFORKRUN, ARGPARSE)],
+    INTERFACES: {PREFORK: sys.modules[__name__]}
+}
+
+chassis2024.register(sys.modules[__name__])
+
+
+# constants
+
+kDEFAULT_RESTART = True
+kDEFAULT_MAX_RESTARTS = 10
+kDEFAULT_SHUTDOWN_TIMEOUT = 10.0  # seconds
+
+kPOLL_INTERVAL = 0.05  # seconds between checks on the workers
+
+kSIGNALS = (signal.SIGTERM, signal.SIGINT)
+
+
+# state (one per chassis; see chassis.Chassis.component_state)
+
+class _State:
+    def __init__(self):
+        self.workers = None  # number of workers to fork [int]
+        self.restart = None  # whether to replace failed workers [bool]
+        self.max_restarts = None  # most replacements [int]
+        self.shutdown_timeout = None  # seconds workers get to stop [float]
+        self.worker_number = None  # this worker's number, in a worker [int]
+        self.after_fork = []  # [fn() -> None, ...], called in each worker
+        self.worker_callbacks = []  # [fn() -> None, ...], at worker exit
+        self.pids = {}  # {pid: worker number}, in the parent
+        self.stopping = False  # whether the parent has been told to stop
+
+def _state():
+    return chassis2024.chassis.current().component_state(__name__, _State)
+
+
+# read execution_spec
+
+def _execution_spec_section():
+    """Return the execution spec's PREFORKRUN, or else None."""
+    return chassis2024.execution_spec.get(PREFORKRUN, None)
+
+def _execution_spec_workers():
+    """Return execution spec's WORKERS, or else the number of CPUs."""
+    workers = (_execution_spec_section() or {}).get(WORKERS)
+    return (os.cpu_count() or 1) if workers is None else workers
+
+def _execution_spec_restart():
+    """Return execution spec's RESTART, or else the default."""
+    restart = (_execution_spec_section() or {}).get(RESTART)
+    return kDEFAULT_RESTART if restart is None else restart
+
+def _execution_spec_max_restarts():
+    """Return execution spec's MAX_RESTARTS, or else the default."""
+    max_restarts = (_execution_spec_section() or {}).get(MAX_RESTARTS)
+    return kDEFAULT_MAX_RESTARTS if max_restarts is None else max_restarts
+
+def _execution_spec_shutdown_timeout():
+    """Return execution spec's SHUTDOWN_TIMEOUT, or else the default."""
+    timeout = (_execution_spec_section() or {}).get(SHUTDOWN_TIMEOUT)
+    return kDEFAULT_SHUTDOWN_TIMEOUT if timeout is None else timeout
+
+
+# entry
+
+def perform_execution_graph_node(n):
+    S = _state()
+    if n == RESET_PREFORKRUN:
+        S.workers = _execution_spec_workers()
+        S.restart = _execution_spec_restart()
+        S.max_restarts = _execution_spec_max_restarts()
+        S.shutdown_timeout = _execution_spec_shutdown_timeout()
+        S.worker_number = None
+        S.after_fork = []
+        S.worker_callbacks = []
+        S.pids = {}
+        S.stopping = False
+        if not (isinstance(S.workers, int) and S.workers >= 0):
+            raise ValueError(S.workers)
+        if not (isinstance(S.max_restarts, int) and S.max_restarts >= 0):
+            raise ValueError(S.max_restarts)
+        if S.workers and not hasattr(os, "fork"):
+            raise ValueError("WORKERS requires os.fork(); use WORKERS 0")
+
+    elif n == UP:
+        if S.workers == 0:
+            chassis2024.interface(RUN, required=True).run()
+        else:
+            _run_workers()
+
+
+# the parent
+
+def _run_workers():
+    S = _state()
+    failures = {}  # {worker number: exit code}, of each worker's last run
+    restarts = 0
+    previous_handlers = _install_parent_signal_handlers()
+    try:
+        for number in range(S.workers):
+            _fork_worker(number)
+        deadline = None
+        while S.pids:
+            for pid in list(S.pids):
+                (done, status) = os.waitpid(pid, os.WNOHANG)
+                if done == 0:
+                    continue
+                number = S.pids.pop(pid)
+                code = _exit_code(status)
+                if code == 0:
+                    failures.pop(number, None)
+                    continue
+                failures[number] = code
+                if (S.restart and not S.stopping and
+                    restarts < S.max_restarts):
+                    restarts += 1
+                    _fork_worker(number)
+            if S.stopping and deadline is None:
+                deadline = time.monotonic() + S.shutdown_timeout
+            if deadline is not None and time.monotonic() > deadline:
+                _signal_workers(signal.SIGKILL)
+                deadline = float("inf")  # (only once)
+            if S.pids:
+                time.sleep(kPOLL_INTERVAL)
+    finally:
+        _restore_signal_handlers(previous_handlers)
+        if S.pids:  # (something went wrong in the parent itself)
+            _signal_workers(signal.SIGKILL)
+            for pid in list(S.pids):
+                os.waitpid(pid, 0)
+            S.pids = {}
+    if failures and not S.stopping:
+        raise ChildProcessError("worker(s) failed: " +
+                                ", ".join("%d (status %d)" % item
+                                          for item in sorted(failures.items())))
+
+def _fork_worker(number):
+    S = _state()
+    # (so that buffered output isn't written twice, by parent and child)
+    sys.stdout.flush()
+    sys.stderr.flush()
+    pid = os.fork()
+    if pid == 0:
+        _worker(number)  # (never returns)
+    S.pids[pid] = number
+
+def _signal_workers(signum):
+    for pid in list(_state().pids):
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            pass
+
+def _exit_code(status):
+    """Return a waitpid status as an exit code (-signal, if killed.)"""
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+def _install_parent_signal_handlers():
+    """Arrange to stop on SIGTERM/SIGINT; return the previous handlers."""
+    if threading.current_thread() is not threading.main_thread():
+        return {}
+    S = _state()
+    def stop(signum, frame):
+        S.stopping = True
+        _signal_workers(signal.SIGTERM)
+    return {signum: signal.signal(signum, stop) for signum in kSIGNALS}
+
+def _restore_signal_handlers(previous_handlers):
+    for (signum, handler) in previous_handlers.items():
+        signal.signal(signum, handler)
+
+
+# the workers
+
+def _worker(number):
+    """Run RUN, in a freshly forked worker; then exit, never returning."""
+    S = _state()
+    chassis = chassis2024.chassis.current()
+    S.worker_number = number
+    S.pids = {}
+    # callbacks registered before the fork belong to the parent
+    first_callback = len(chassis.call_before_termination_callbacks)
+    status = 1
+    try:
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, _raise_system_exit)
+            signal.signal(signal.SIGINT, signal.default_int_handler)
+        for cb in S.after_fork:
+            cb()
+        chassis2024.interface(RUN, required=True).run()
+        status = 0
+    except SystemExit as e:
+        status = _system_exit_status(e)
+    except KeyboardInterrupt:
+        status = 128 + signal.SIGINT
+    except BaseException:
+        traceback.print_exc()
+    finally:
+        try:
+            if threading.current_thread() is threading.main_thread():
+                for signum in kSIGNALS:
+                    signal.signal(signum, signal.SIG_IGN)
+            callbacks = (S.worker_callbacks +
+                         chassis.call_before_termination_callbacks[
+                             first_callback:])
+            for cb in reversed(callbacks):
+                try:
+                    cb()
+                except BaseException:
+                    traceback.print_exc()
+                    status = status or 1
+            sys.stdout.flush()
+            sys.stderr.flush()
+        finally:
+            os._exit(status)
+
+def _raise_system_exit(signum, frame):
+    raise SystemExit(0)
+
+def _system_exit_status(e):
+    if e.code is None:
+        return 0
+    elif isinstance(e.code, int):
+        return e.code
+    print(e.code, file=sys.stderr)
+    return 1
+
+
+# interface PREFORK
+
+def worker_number():
+    return _state().worker_number
+
+def call_after_fork(cb):
+    _state().after_fork.append(cb)
+
+def call_before_worker_termination(cb):
+    _state().worker_callbacks.append(cb)
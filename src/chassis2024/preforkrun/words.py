@@ -0,0 +1,18 @@
+# Copyright 2024 Lion Kimbro
+# SPDX-License-Identifier: BSD-3-Clause
+
+
+# execution nodes
+RESET_PREFORKRUN = "RESET_PREFORKRUN"
+
+
+# interfaces
+PREFORK = "PREFORK"
+
+
+# execution_spec info
+PREFORKRUN = "PREFORKRUN"  # primary key
+WORKERS = "WORKERS"  # int: worker processes (default: os.cpu_count(); 0: none)
+RESTART = "RESTART"  # True/False: replace workers that fail (default: True)
+MAX_RESTARTS = "MAX_RESTARTS"  # int: most replacements, in all (default: 10)
+SHUTDOWN_TIMEOUT = "SHUTDOWN_TIMEOUT"  # seconds workers get to stop (default: 10)
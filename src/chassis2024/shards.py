@@ -0,0 +1,190 @@
+# Copyright 2024 Lion Kimbro
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""persistence data, kept in a folder of shard files
+
+Instead of one file, the data can be kept in a folder, as a number of
+shard files, each holding a dictionary of some of the top-level keys,
+and a manifest:
+
+  <folder>/
+    manifest.json
+    b-0.shard
+    b-1.shard
+    ...
+
+The keys are divided among the shards in one of two ways:
+
+  SHARD_PER_KEY  -- each key has a shard of its own
+                    (named after a hash of the key)
+  an int, n  -- the keys are divided among n buckets, by hash
+
+A save then only needs to write the shards whose keys have changed.
+
+The manifest records how the keys were divided, how the shards are
+encoded (see codec.py), and which keys are in which shard, so that the
+shards can be loaded on demand (see ShardedDict.)  It is only rewritten
+when keys come or go (see reassign()), or the format changes; and then
+after the shards it lists, so a save interrupted part way leaves a
+manifest that still describes complete shard files.  (Should a shard
+still lack a key that the manifest lists, the key is dropped as the
+shard is loaded.)
+
+When the format changes, every shard is written anew under a new name
+(b-0-<tag>.shard, where the tag is a hash of the format; see
+format_tag()), beside the old shards, rather than over them: until the
+new manifest replaces the old one, the old manifest still describes
+the old shards, in the old format.  The manifest records the tag.
+"""
+
+import json
+import zlib
+import hashlib
+
+from . import codec
+from .tracked import TrackedMapping
+
+
+SHARD_PER_KEY = "SHARD_PER_KEY"
+
+kMANIFEST_FILENAME = "manifest.json"
+
+# manifest keys
+kVERSION = "VERSION"
+kSHARDS = "SHARDS"  # SHARD_PER_KEY, or the number of buckets
+kCODEC = "CODEC"
+kCOMPRESSION = "COMPRESSION"
+kFILES = "FILES"  # {filename: [key, ...]}
+kTAG = "TAG"  # the shard filenames' tag ("" for none)
+
+kMANIFEST_VERSION = 1
+
+
+def check(shards):
+    """Raise ValueError, if shards isn't SHARD_PER_KEY, or a positive int."""
+    if shards != SHARD_PER_KEY and not (isinstance(shards, int) and
+                                        shards > 0):
+        raise ValueError(shards)
+
+def format_tag(shards, codec_name, compression):
+    """Return the filename tag for shards written in the given format."""
+    return hashlib.sha256(repr((shards, codec_name, compression))
+                          .encode("utf-8")).hexdigest()[:8]
+
+def filename(key, shards, tag=""):
+    """Return the name of the shard file that holds key."""
+    key_bytes = repr(key).encode("utf-8")
+    suffix = "-" + tag if tag else ""
+    if shards == SHARD_PER_KEY:
+        return "k-%s%s.shard" % (hashlib.sha256(key_bytes).hexdigest()[:24],
+                                 suffix)
+    else:
+        # (crc32, not hash(): the same in every process)
+        return "b-%d%s.shard" % (zlib.crc32(key_bytes) % shards, suffix)
+
+def assign(keys, shards, tag=""):
+    """Return {filename: [key, ...]}, dividing keys among shard files."""
+    files = {}
+    for key in keys:
+        files.setdefault(filename(key, shards, tag), []).append(key)
+    return files
+
+def reassign(files, shards, keys, data, tag=""):
+    """Return {filename: [key, ...]} for the files whose keys have changed.
+
+    files is {filename: [key, ...]}, as assigned before; keys are the
+    keys that may have been added to, or deleted from, data since.  A
+    file left without keys maps to [].  files itself isn't changed.
+
+    (The cost follows the number of keys, and the size of the files
+     they fall in, not the size of the data.)
+    """
+    touched = {}  # {filename: {key: None, ...}}
+    for key in keys:
+        name = filename(key, shards, tag)
+        if name not in touched:
+            touched[name] = dict.fromkeys(files.get(name, ()))
+        if key in data:
+            touched[name][key] = None
+        else:
+            touched[name].pop(key, None)
+    return {name: list(D) for (name, D) in touched.items()
+            if list(D) != list(files.get(name, ()))}
+
+
+# manifest
+
+def manifest(shards, codec_name, compression, files, tag=""):
+    return {kVERSION: kMANIFEST_VERSION,
+            kSHARDS: shards,
+            kCODEC: codec_name,
+            kCOMPRESSION: compression,
+            kFILES: {name: list(keys) for (name, keys) in files.items()},
+            kTAG: tag}
+
+def read_manifest(folderpath):
+    """Return the folder's manifest, or None if there isn't one."""
+    try:
+        with open(folderpath / kMANIFEST_FILENAME, encoding="utf-8") as f:
+            D = json.load(f)
+    except FileNotFoundError:
+        return None
+    if D.get(kVERSION) != kMANIFEST_VERSION:
+        raise ValueError("unknown shard manifest version: %r" %
+                         D.get(kVERSION))
+    return D
+
+
+# shards
+
+def read_shard(filepath, codec_name, compression):
+    """Return (dictionary, raw bytes) of a shard file."""
+    with open(filepath, "rb") as f:
+        raw = codec.read(f, compression)
+    return codec.decode(raw, codec_name), raw
+
+
+class _Unloaded:
+    """Stands in for a value whose shard hasn't been loaded."""
+
+    def __init__(self, filename, keys):
+        self.filename = filename
+        self.keys = keys  # [key, ...] that the manifest lists in the shard
+
+
+class ShardedDict(TrackedMapping):
+    """A mapping whose values are loaded a shard at a time, on demand."""
+
+    def __init__(self, files, load):
+        """files is {filename: [key, ...]}; load(filename) -> dictionary."""
+        TrackedMapping.__init__(self)
+        self.load = load
+        for (name, keys) in files.items():
+            stand_in = _Unloaded(name, list(keys))
+            for key in keys:
+                self.entries[key] = stand_in
+
+    def _unloaded(self, value):
+        return isinstance(value, _Unloaded)
+
+    def _load(self, key, value):
+        # (all of the shard's values, that haven't been replaced since)
+        D = self.load(value.filename)
+        for k in value.keys:
+            if self.entries.get(k) is value:
+                if k in D:
+                    self.entries[k] = D[k]
+                else:
+                    # (listed, but not in the shard: a save was cut short)
+                    del self.entries[k]
+                    self._change(k)
+        return self.entries[key]  # (KeyError, if it was dropped)
+
+    def unloaded_files(self):
+        """Return the names of the shards with values not yet loaded."""
+        return {value.filename for value in list(self.entries.values())
+                if isinstance(value, _Unloaded)}
+
+    def __repr__(self):
+        return "<ShardedDict: %d keys, %d loaded>" % (len(self.entries),
+                                                       len(self.loaded()))
@@ -0,0 +1,235 @@
+# Copyright 2024 Lion Kimbro
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""snapshots of the data, so that writing them out needn't block
+
+Saving has two halves: taking a snapshot of the data, which has to
+happen while the data holds still, and writing the snapshot out
+(compressing, writing, fsync'ing, renaming), which doesn't.  Two ways
+of splitting them are here:
+
+  KeySnapshot + BackgroundWriter  -- copy-on-write, per top-level key
+
+    A KeySnapshot keeps each top-level value's encoding, from one
+    snapshot to the next, and re-encodes only the keys that have
+    changed since (as reported by a tracked.TrackedDict.)  A snapshot
+    is then a list of already-encoded byte strings -- immutable, and
+    shared with the next snapshot wherever nothing changed -- which a
+    BackgroundWriter joins, and writes out, on a thread of its own.
+    Only the JSON codecs can be assembled this way.
+
+  ForkWriter  -- a fork()'ed process is the snapshot
+
+    The operating system copies the process's memory, page by page,
+    as it is written to; the child process encodes and writes the data,
+    as it was at the fork, and exits.  Any codec works, and nothing at
+    all is encoded in the parent, but it is for POSIX systems only, and
+    (as with any fork) threads other than the forking one don't exist
+    in the child.
+"""
+
+import os
+import json
+import threading
+import traceback
+import contextvars
+
+from . import codec
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# codecs that a KeySnapshot can assemble, and their separators
+kKEY_CODECS = {codec.CODEC_JSON: (", ", ": "),
+               codec.CODEC_FAST_JSON: (",", ":")}
+
+
+def _encode_item(key, value, codec_name):
+    """Return the encoding of "key: value", as it appears in the object."""
+    (item_separator, key_separator) = kKEY_CODECS[codec_name]
+    # (json's own rules for non-string keys: 1 -> "1", True -> "true", ...)
+    prefix = json.dumps({key: 0}, separators=(item_separator,
+                                              key_separator))[1:-2]
+    if codec_name == codec.CODEC_FAST_JSON and orjson is not None:
+        value_bytes = orjson.dumps(value, default=codec.default,
+                                   option=orjson.OPT_NON_STR_KEYS)
+    else:
+        value_bytes = json.dumps(value, separators=(item_separator,
+                                                    key_separator),
+                                 default=codec.default).encode("utf-8")
+    return prefix.encode("utf-8") + value_bytes
+
+
+class KeySnapshot:
+    """The encoding of each top-level value, kept from save to save."""
+
+    def __init__(self, codec_name):
+        if codec_name not in kKEY_CODECS:
+            raise ValueError("can't snapshot by key with %s" % codec_name)
+        self.codec_name = codec_name
+        self.items = {}  # {key: encoded "key: value" [bytes]}
+
+    def take(self, D, changed=None):
+        """Return a snapshot of D: a list of encoded items.
+
+        changed is the set of keys changed since the last snapshot, or
+        None if any of them may have (and all are to be re-encoded.)
+        """
+        items = {}
+        for (key, value) in D.items():
+            item = None if changed is None else self.items.get(key)
+            if item is None or key in changed:
+                item = _encode_item(key, value, self.codec_name)
+            items[key] = item
+        self.items = items
+        return list(items.values())
+
+    def join(self, snapshot):
+        """Return the encoded object, from a snapshot's list of items."""
+        item_separator = kKEY_CODECS[self.codec_name][0].encode("utf-8")
+        return b"{" + item_separator.join(snapshot) + b"}"
+
+
+class BackgroundWriter:
+    """Runs write jobs, one at a time, on a thread of its own.
+
+    A job that hasn't started yet is replaced by the next one submitted
+    (a newer snapshot supersedes an older one.)  .flush() waits for the
+    jobs submitted so far, and re-raises the first exception a job
+    raised, if any.
+    """
+
+    def __init__(self):
+        self.pending = None  # fn(), the next job to run
+        self.running = False  # whether a job is running
+        self.stopping = False
+        self.exception = None  # first exception raised by a job
+        self.condition = threading.Condition()
+        self.thread = None
+
+    def submit(self, job):
+        with self.condition:
+            self.pending = job
+            if self.thread is None:
+                # (copy the context, so that the job sees the same chassis)
+                context = contextvars.copy_context()
+                self.thread = threading.Thread(target=context.run,
+                                               args=(self._run,),
+                                               name="chassis2024-writer",
+                                               daemon=True)
+                self.thread.start()
+            self.condition.notify_all()
+
+    def flush(self):
+        """Wait for the jobs submitted so far; re-raise a job's error."""
+        with self.condition:
+            while self.pending is not None or self.running:
+                self.condition.wait()
+            if self.exception is not None:
+                exception, self.exception = self.exception, None
+                raise exception
+
+    def stop(self):
+        """Finish the jobs submitted, and stop the thread."""
+        try:
+            self.flush()
+        finally:
+            with self.condition:
+                self.stopping = True
+                self.condition.notify_all()
+            if self.thread is not None:
+                self.thread.join()
+                self.thread = None
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while self.pending is None and not self.stopping:
+                    self.condition.wait()
+                if self.pending is None:
+                    return
+                job, self.pending = self.pending, None
+                self.running = True
+            try:
+                job()
+            except Exception as e:
+                if self.exception is None:
+                    self.exception = e
+            finally:
+                with self.condition:
+                    self.running = False
+                    self.condition.notify_all()
+
+
+class ForkWriter:
+    """Runs write jobs in fork()'ed child processes, one at a time.
+
+    A job runs in the child, on the memory as it was at the fork, and
+    returns bytes (or None); once the child has exited, done(result)
+    is called in the parent.  Submitting a job waits for the previous
+    child, if it is still running.  .flush() waits for the child, and
+    raises ChildProcessError, if any job has failed since the last.
+    """
+
+    def __init__(self):
+        self.pid = None  # the child's process id
+        self.fd = None  # the read end of the pipe from the child
+        self.done = None  # fn(result), called in the parent
+        self.exception = None  # first failure, since the last flush
+
+    def submit(self, job, done):
+        self._reap(0)
+        (r, w) = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            # (the child: never return, never run the parent's cleanups)
+            status = 1
+            try:
+                os.close(r)
+                result = job()
+                with os.fdopen(w, "wb") as f:
+                    f.write(result or b"")
+                status = 0
+            except BaseException:
+                traceback.print_exc()
+            finally:
+                os._exit(status)
+        os.close(w)
+        self.pid = pid
+        self.fd = r
+        self.done = done
+
+    def poll(self):
+        """Collect the child, if it has exited, without waiting."""
+        self._reap(os.WNOHANG)
+
+    def flush(self):
+        """Wait for the child; raise ChildProcessError, if a job failed."""
+        self._reap(0)
+        if self.exception is not None:
+            exception, self.exception = self.exception, None
+            raise exception
+
+    def stop(self):
+        self.flush()
+
+    def _reap(self, options):
+        if self.pid is None:
+            return
+        (pid, status) = os.waitpid(self.pid, options)
+        if pid == 0:
+            return  # (still running)
+        with os.fdopen(self.fd, "rb") as f:
+            result = f.read()
+        pid, self.pid, self.fd = self.pid, None, None
+        if status != 0:
+            if self.exception is None:
+                self.exception = ChildProcessError(
+                    "snapshot writer process %d failed (status %d)" %
+                    (pid, status))
+            self.done(None)
+        else:
+            self.done(result)
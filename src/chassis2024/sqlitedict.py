@@ -0,0 +1,224 @@
+# Copyright 2024 Lion Kimbro
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""a dictionary kept in a SQLite table, read and written a row at a time
+
+SQLiteDict is a mapping over a table of (key, value) rows, each value
+encoded as JSON.  A value is read from the table the first time it is
+accessed, and kept, so memory follows the keys that the program
+actually uses, rather than the size of the file.
+
+Changes are held in memory, and recorded as a tracked.TrackedDict
+records them (.changed, .cleared, .dirty(), .reset_changes(),
+.touch(key), and the .on_change hook), until .commit() writes them all
+to the table in one transaction.
+
+With a cache_size, at most that many values are kept, beyond those
+with uncommitted changes; the least recently used are let go first.
+A value changed in place must then be touched before it is let go --
+in practice, before many other keys are accessed.
+
+Keys must be strings (they are the table's primary key.)
+"""
+
+import json
+import sqlite3
+import threading
+import collections
+import collections.abc
+
+
+kTABLE = "data"
+
+_CREATE = ("CREATE TABLE IF NOT EXISTS %s "
+           "(key TEXT PRIMARY KEY NOT NULL, value TEXT NOT NULL)" % kTABLE)
+
+
+def connect(filepath):
+    """Open (creating, if need be) the SQLite file at filepath."""
+    # (isolation_level=None: transactions are begun explicitly, by commit)
+    connection = sqlite3.connect(str(filepath),
+                                 isolation_level=None,
+                                 check_same_thread=False)
+    connection.execute(_CREATE)
+    return connection
+
+
+class _Absent:
+    """Stands in (in .cache) for a key known not to be in the table."""
+
+_ABSENT = _Absent()
+
+
+class SQLiteDict(collections.abc.MutableMapping):
+
+    def __init__(self, connection=None, cache_size=None):
+        """connection is an open sqlite3 connection (see connect()), or None.
+
+        With no connection, the table is taken to be empty; pass one to
+        .commit(), to write the changes.
+        """
+        self.connection = connection
+        self.cache_size = cache_size  # values kept, beyond changed ones
+        self.cache = collections.OrderedDict()  # {key: value, or _ABSENT}
+        self.changed = set()  # {key, ...} changed since reset_changes()
+        self.cleared = False  # whether clear() was called since then
+        self.on_change = None  # fn(), called after each change
+        self.lock = threading.RLock()  # (held while using the connection)
+
+    # change tracking (as in tracked.TrackedDict)
+
+    def dirty(self):
+        """Return True if anything has changed since reset_changes()."""
+        return bool(self.changed or self.cleared)
+
+    def reset_changes(self):
+        """Forget all recorded changes (typically, just after a save.)"""
+        self.changed = set()
+        self.cleared = False
+        self._trim()
+
+    def touch(self, key):
+        """Record that the value at key has changed (from within.)"""
+        if key not in self.cache:
+            self.cache[key] = self._select(key)
+        self._change(key)
+
+    def _change(self, key):
+        self.changed.add(key)
+        if self.on_change is not None:
+            self.on_change()
+
+    # the table
+
+    def _select(self, key):
+        """Return the value in the table at key, or _ABSENT."""
+        if self.connection is None or self.cleared:
+            return _ABSENT
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT value FROM %s WHERE key = ?" % kTABLE,
+                (key,)).fetchone()
+        return _ABSENT if row is None else json.loads(row[0])
+
+    def _table_keys(self):
+        if self.connection is None or self.cleared:
+            return []
+        with self.lock:
+            return [key for (key,) in self.connection.execute(
+                "SELECT key FROM %s ORDER BY rowid" % kTABLE)]
+
+    def _lookup(self, key):
+        """Return the value at key (or _ABSENT), caching it."""
+        value = self.cache.get(key, None)
+        if value is None and key not in self.cache:
+            value = self._select(key)
+            self.cache[key] = value
+            self._trim()
+        else:
+            self.cache.move_to_end(key)
+        return value
+
+    def _trim(self):
+        """Let go of the least recently used unchanged values, if too many."""
+        if self.cache_size is None:
+            return
+        excess = len(self.cache) - len(self.changed) - self.cache_size
+        for key in list(self.cache):
+            if excess <= 0:
+                break
+            if key not in self.changed:
+                del self.cache[key]
+                excess -= 1
+
+    def commit(self, connection=None):
+        """Write the changes to the table, as one transaction.
+
+        The changes are encoded first, so that a value that can't be
+        encoded leaves the table, and the record of changes, as they
+        were.  The record of changes is reset once the transaction has
+        committed.
+        """
+        with self.lock:
+            if connection is not None:
+                self.connection = connection
+            rows = []
+            deletes = []
+            for key in self.changed:
+                value = self.cache.get(key, _ABSENT)
+                if value is _ABSENT:
+                    deletes.append((key,))
+                else:
+                    rows.append((key, json.dumps(value)))
+            c = self.connection
+            c.execute("BEGIN IMMEDIATE")
+            try:
+                if self.cleared:
+                    c.execute("DELETE FROM %s" % kTABLE)
+                c.executemany("DELETE FROM %s WHERE key = ?" % kTABLE,
+                              deletes)
+                c.executemany("INSERT OR REPLACE INTO %s (key, value) "
+                              "VALUES (?, ?)" % kTABLE, rows)
+                c.execute("COMMIT")
+            except BaseException:
+                c.execute("ROLLBACK")
+                raise
+            self.reset_changes()
+
+    def close(self):
+        with self.lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+
+    # mapping
+
+    def __getitem__(self, key):
+        value = self._lookup(key)
+        if value is _ABSENT:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        if not isinstance(key, str):
+            raise TypeError("keys must be str, not %s" % type(key).__name__)
+        self.cache[key] = value
+        self.cache.move_to_end(key)
+        self._change(key)
+
+    def __delitem__(self, key):
+        if self._lookup(key) is _ABSENT:
+            raise KeyError(key)
+        self.cache[key] = _ABSENT
+        self._change(key)
+
+    def __contains__(self, key):
+        return self._lookup(key) is not _ABSENT
+
+    def __iter__(self):
+        # (the table's keys, less those deleted since, then those added)
+        seen = set()
+        for key in self._table_keys():
+            seen.add(key)
+            if self.cache.get(key) is not _ABSENT:
+                yield key
+        for key in list(self.changed):
+            if key not in seen and self.cache.get(key, _ABSENT) is not _ABSENT:
+                yield key
+
+    def __len__(self):
+        if self.connection is not None and not self.dirty():
+            with self.lock:
+                return self.connection.execute(
+                    "SELECT COUNT(*) FROM %s" % kTABLE).fetchone()[0]
+        return sum(1 for key in self)
+
+    def clear(self):
+        self.cache.clear()
+        self.changed = set()
+        self.cleared = True
+        if self.on_change is not None:
+            self.on_change()
+
+    def __repr__(self):
+        return "<SQLiteDict: %d values in memory>" % len(self.cache)
@@ -0,0 +1,348 @@
+# Copyright 2024 Lion Kimbro
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""persistence data kept in a SQLite file, read a key at a time
+
+
+STAGES:
+------------------------------------------------------------------------
+
+  <CLEAR>
+  + *CLEAR_SQLITEPERSISTENCE  -- Nulls data
+  <RESET>
+  + *RESET_SQLITEPERSISTENCE  -- Nulls data
+  <ARGPARSE>
+  + *READ_SQLITEPERSISTENCE  -- opens the SQLite file
+    READ_PERSISTENCE
+  <ACTIVATE>
+
+  (key):  <BUILT-IN EXECUTION NODE>
+          + CREATED EXECUTION NODE
+          *IMPLEMENTED_EXECUTION_NODE
+             (executed via this module's
+              .perform_execution_graph_node(n) implementation)
+
+
+INTERFACES IMPLEMENTED:
+------------------------------------------------------------------------
+
+  Interface "PERSISTENCE_DATA":
+
+    .data()  -- returns the mapping of persistence data
+                (a chassis2024.sqlitedict.SQLiteDict)
+    .save()  -- writes the changes made since the last save, as one
+                transaction
+    .dirty()  -- returns whether the data has changed since it was
+                 loaded or last saved
+    .save_at_exit(False)  -- turns off exit-time persistence data saving
+    .save_at_exit(True)  -- turns back on exit-time persistence data saving
+    .save_at_exit()  -- returns whether exit-time persistence data saving is
+                        active or not (default is [True]: yes, saving,
+                        though this is configurable in the execution spec.)
+
+
+INTERFACES CONSUMED:
+------------------------------------------------------------------------
+
+  Interface "ARGPARSE"
+
+    .args.persistence_file_filepath  -- checked for a specification of the
+                                        SQLite file's filepath
+                                        (overrides execution-spec specified
+                                         value)
+
+
+CONFIGURATION PROCEDURES:
+------------------------------------------------------------------------
+
+  This is a drop-in replacement for chassis2024.basicjsonpersistence;
+  use one or the other, not both.  It is configured the same way, by
+  way of the execution spec, with one additional key.
+
+  (example:)
+  ----------------------------------------------------------------------
+  ...
+  import chassis2024.sqlitepersistence
+  ...
+  from chassis2024.sqlitepersistence.words import *
+  ...
+
+  EXECUTION_SPEC = {
+      SQLITEPERSISTENCE: {
+          SAVE_AT_EXIT: True,
+          CREATE_FOLDER: True,
+          FILEPATH: "./data/echo_persistence_data.sqlite3",
+          CACHE_SIZE: 10000
+      }
+  }
+  ----------------------------------------------------------------------
+
+  The data is kept at FILEPATH, in a SQLite table named "data", with
+  one row per top-level key, and the value encoded as JSON.  The file
+  is created at the first save.
+
+  CACHE_SIZE bounds how many values are kept in memory (beyond those
+  changed since the last save); the default, None, keeps every value
+  that has been read.
+
+  The ARGPARSE arrangements are exactly those of basicjsonpersistence:
+  chassis2024.sqlitepersistence.argparse_configure(parser) adds a
+  "-f"/"--persistence-filepath" option, storing to the argparse dest
+  "persistence_file_filepath".
+
+
+USE PROCEDURES:
+------------------------------------------------------------------------
+
+  Access the data via the .data() method on the interface.
+
+  (by way of example:)
+  ----------------------------------------------------------------------
+  D = chassis2024.interface(PERSISTENCE_DATA, required=True).data()
+  ----------------------------------------------------------------------
+
+  The mapping isn't a dict, but works like one: a value is read from
+  the file the first time its key is accessed, so memory follows the
+  part of the data that the program uses, not the size of the file.
+  Keys must be strings.
+
+  Assigning or deleting a top-level key is recorded, and at the next
+  save, the changed rows are written, in one transaction.  Changes made
+  deep within a value can't be seen by the mapping, and must be
+  reported by touching the key:
+
+  ----------------------------------------------------------------------
+  D["scores"].append(10)
+  D.touch("scores")
+  ----------------------------------------------------------------------
+
+  With CACHE_SIZE set, touch the key promptly: a value that hasn't
+  been touched may be let go (and its change with it) once enough
+  other keys have been read.
+
+  Exit-time saving is on by default, and can be toggled, just as with
+  basicjsonpersistence:
+
+  ----------------------------------------------------------------------
+  chassis2024.interface(PERSISTENCE_DATA, required=True).save_at_exit(False)
+  ----------------------------------------------------------------------
+"""
+
+
+import sys
+import pathlib
+
+import chassis2024
+from chassis2024.words import *
+from chassis2024 import sqlitedict
+from chassis2024.sqlitedict import SQLiteDict
+
+from ..words import *
+from .words import *
+
+
+CHASSIS2024_SPEC = {
+    EXECUTES_GRAPH_NODES: [CLEAR_SQLITEPERSISTENCE,
+                           RESET_SQLITEPERSISTENCE,
+                           READ_SQLITEPERSISTENCE],
+    EXECUTION_GRAPH_SEQUENCES: [(CLEAR,
+                                 CLEAR_SQLITEPERSISTENCE,  # *
+                                 RESET,
+                                 RESET_SQLITEPERSISTENCE,  # *
+                                 ARGPARSE,
+                                 READ_SQLITEPERSISTENCE,  # *
+                                 READ_PERSISTENCE,
+                                 ACTIVATE)],
+    INTERFACES: {PERSISTENCE_DATA: sys.modules[__name__]}
+}
+
+chassis2024.register(sys.modules[__name__])
+
+
+# constants
+
+kDEFAULT_PERSISTENCE_FILEPATH = "./persistent_data.sqlite3"
+
+# do NOT create folders, by default (execution spec key: CREATE_FOLDER)
+kDEFAULT_CREATE_FOLDER_POLICY = False
+
+kDEFAULT_SAVE_AT_EXIT = True
+
+kDEFAULT_CACHE_SIZE = None  # keep every value read
+
+kARGPARSE_PERSISTENCE_FILE_FILEPATH = "persistence_file_filepath"
+
+
+# state (one per chassis; see chassis.Chassis.component_state)
+
+class _State:
+    def __init__(self):
+        self.data = None  # the data [SQLiteDict]
+        self.save_at_exit = None  # whether to save at exit, or not [bool]
+        self.filepath = None  # filepath to the SQLite file [pathlib.Path]
+        self.initial_cwd = None  # initial CWD [pathlib.Path]
+        self.cache_size = None  # most unchanged values kept [int, or None]
+
+def _state():
+    return chassis2024.chassis.current().component_state(__name__, _State)
+
+
+# convert a string path to a pathlib.Path
+
+def _str_to_path(str_path):
+    """Convert string path specification to a pathlib.Path.
+
+    Two critical considerations are:
+    * ~/ is expanded to the user's home directory, cross-platform.
+    * Relative paths are resolved relative to the execution's original
+      working directory (which was recorded during the
+      CLEAR_SQLITEPERSISTENCE execution node.)
+    """
+    p = pathlib.Path(str_path).expanduser()
+    if not p.is_absolute():
+        return _state().initial_cwd / p
+    else:
+        return p
+
+
+# read execution_spec
+
+def _execution_spec_section():
+    """Return the execution spec's SQLITEPERSISTENCE, or else None."""
+    return chassis2024.execution_spec.get(SQLITEPERSISTENCE, None)
+
+def _execution_spec_create_folder():
+    """Return the CREATE_FOLDER value from the execution spec, or else None"""
+    return (_execution_spec_section() or {}).get(CREATE_FOLDER)
+
+def _execution_spec_persistence_file_filepath():
+    """Return execution spec's filepath as a pathlib.Path, or else None"""
+    filepath = (_execution_spec_section() or {}).get(FILEPATH)
+    return _str_to_path(filepath) if filepath else None
+
+def _execution_spec_save_at_exit():
+    """Return execution spec's SAVE_AT_EXIT, or else None."""
+    return (_execution_spec_section() or {}).get(SAVE_AT_EXIT)
+
+def _execution_spec_cache_size():
+    """Return execution spec's CACHE_SIZE, or else the default."""
+    cache_size = (_execution_spec_section() or {}).get(CACHE_SIZE)
+    return kDEFAULT_CACHE_SIZE if cache_size is None else cache_size
+
+
+# ARGPARSE module cooperation
+
+def argparse_configure(parser, shortkey="-f", longkey="--persistence-filepath"):
+    group = parser.add_argument_group("Persistent Data",
+                                      "Configuring persistent data access")
+    group.add_argument(shortkey, longkey,
+                       dest=kARGPARSE_PERSISTENCE_FILE_FILEPATH,
+                       metavar="file",
+                       help="path to persistence file",
+                       default=(_execution_spec_persistence_file_filepath() or
+                                kDEFAULT_PERSISTENCE_FILEPATH))
+
+def _commandline_persistence_file_filepath():
+    """If ARGPARSE component is in use, read the persistence filepath."""
+    parser = chassis2024.interface(ARGPARSE)
+    if parser is None:
+        return None
+    else:
+        p = getattr(parser.args, kARGPARSE_PERSISTENCE_FILE_FILEPATH, None)
+        return _str_to_path(p) if p else None
+
+
+# creating parent folders for the filepath, if required
+
+def _create_folder_policy():
+    """First, check the execution spec.  If not specified, return default."""
+    policy = _execution_spec_create_folder()
+    if policy is None:
+        return kDEFAULT_CREATE_FOLDER_POLICY
+    else:
+        return policy  # True or False
+
+def _create_folder():
+    filepath = _state().filepath
+    if not filepath.parent.exists():
+        filepath.parent.mkdir(parents=True)
+
+
+# entry
+
+def perform_execution_graph_node(n):
+    S = _state()
+    if n == CLEAR_SQLITEPERSISTENCE:
+        _close()
+        S.data = None
+        S.save_at_exit = None
+        S.filepath = None
+        S.initial_cwd = pathlib.Path.cwd()
+
+    elif n == RESET_SQLITEPERSISTENCE:
+        _close()
+        S.data = None
+        S.filepath = None
+        val = _execution_spec_save_at_exit()
+        S.save_at_exit = kDEFAULT_SAVE_AT_EXIT if val is None else val
+        S.cache_size = _execution_spec_cache_size()
+        if S.cache_size is not None and not (isinstance(S.cache_size, int)
+                                             and S.cache_size >= 0):
+            raise ValueError(S.cache_size)
+
+    elif n == READ_SQLITEPERSISTENCE:
+        # First, make sure that while closing down, that the data is saved.
+        chassis2024.chassis.call_before_termination(_do_final_save)
+
+        S.filepath = _str_to_path(kDEFAULT_PERSISTENCE_FILEPATH)
+        S.filepath = _execution_spec_persistence_file_filepath() or S.filepath
+        S.filepath = _commandline_persistence_file_filepath() or S.filepath
+
+        # Only open the file if it exists; the first save creates it.
+        connection = None
+        if S.filepath.exists():
+            connection = sqlitedict.connect(S.filepath)
+        S.data = SQLiteDict(connection, S.cache_size)
+
+def _close():
+    S = _state()
+    if S.data is not None:
+        S.data.close()
+
+def _do_final_save():
+    try:
+        if _state().save_at_exit:
+            save()
+    finally:
+        _close()
+
+
+# interface PERSISTENCE_DATA
+
+def data():
+    return _state().data
+
+def save():
+    S = _state()
+    if not S.data.dirty():
+        return
+    connection = None
+    if S.data.connection is None:
+        if _create_folder_policy():
+            _create_folder()
+        connection = sqlitedict.connect(S.filepath)
+    S.data.commit(connection)
+
+def dirty():
+    return _state().data.dirty()
+
+def save_at_exit(set_to=None):
+    S = _state()
+    if set_to is None:
+        return S.save_at_exit
+    elif set_to == True:
+        S.save_at_exit = True
+    elif set_to == False:
+        S.save_at_exit = False
+    else:
+        raise ValueError(set_to)
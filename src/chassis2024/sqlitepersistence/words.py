@@ -0,0 +1,21 @@
+# Copyright 2024 Lion Kimbro
+# SPDX-License-Identifier: BSD-3-Clause
+
+
+# execution nodes
+CLEAR_SQLITEPERSISTENCE = "CLEAR_SQLITEPERSISTENCE"
+RESET_SQLITEPERSISTENCE = "RESET_SQLITEPERSISTENCE"
+READ_SQLITEPERSISTENCE = "READ_SQLITEPERSISTENCE"
+READ_PERSISTENCE = "READ_PERSISTENCE"  # generic, shared
+
+
+# interfaces
+PERSISTENCE_DATA = "PERSISTENCE_DATA"
+
+
+# execution_spec info
+SQLITEPERSISTENCE = "SQLITEPERSISTENCE"  # primary key
+SAVE_AT_EXIT = "SAVE_AT_EXIT"  # True/False
+CREATE_FOLDER = "CREATE_FOLDER"  # True/False
+FILEPATH = "FILEPATH"  # "....sqlite3" filename
+CACHE_SIZE = "CACHE_SIZE"  # None, or int: most unchanged values kept in RAM
@@ -0,0 +1,195 @@
+# Copyright 2024 Lion Kimbro
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""a dictionary that remembers which of its keys have changed
+
+TrackedDict is a dict (json.dump, isinstance, and everything else that
+works on a dict, work on it), that records every top-level key that is
+assigned, deleted, or otherwise changed.  Persistence components use it
+to know whether (and what) they need to write.
+
+Only changes made through the dictionary itself are seen.  A change
+deep inside a value --
+
+  D["scores"].append(10)
+
+-- is invisible to it, and must be reported by touching the key:
+
+  D.touch("scores")
+
+If .on_change is set, it is called (with no arguments) after every
+change, touches included; autosave.Autosaver.notify is made for it.
+If .on_key_change is set, it is called with the key that changed (or
+None, when the dictionary is cleared); indexes.Indexes listens on it.
+
+TrackedMapping keeps the same record, for mappings that aren't dicts,
+because they load their values on demand (see lazyjson.LazyJSONDict,
+and shards.ShardedDict.)
+"""
+
+import threading
+import collections.abc
+
+
+class TrackedDict(dict):
+
+    def __init__(self, *args, **kwargs):
+        dict.__init__(self, *args, **kwargs)
+        self.changed = set()  # {key, ...} changed since reset_changes()
+        self.cleared = False  # whether clear() was called since then
+        self.on_change = None  # fn(), called after each change
+        self.on_key_change = None  # fn(key), or fn(None) when cleared
+
+    def dirty(self):
+        """Return True if anything has changed since reset_changes()."""
+        return bool(self.changed or self.cleared)
+
+    def reset_changes(self):
+        """Forget all recorded changes (typically, just after a save.)"""
+        self.changed = set()
+        self.cleared = False
+
+    def touch(self, key):
+        """Record that the value at key has changed (from within.)"""
+        self._change(key)
+
+    def _change(self, key):
+        self.changed.add(key)
+        if self.on_key_change is not None:
+            self.on_key_change(key)
+        if self.on_change is not None:
+            self.on_change()
+
+    # mutation
+
+    def __setitem__(self, key, value):
+        dict.__setitem__(self, key, value)
+        self._change(key)
+
+    def __delitem__(self, key):
+        dict.__delitem__(self, key)
+        self._change(key)
+
+    def pop(self, key, *default):
+        present = key in self
+        value = dict.pop(self, key, *default)
+        if present:
+            self._change(key)
+        return value
+
+    def popitem(self):
+        key, value = dict.popitem(self)
+        self._change(key)
+        return key, value
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return dict.__getitem__(self, key)
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def clear(self):
+        dict.clear(self)
+        self.changed = set()
+        self.cleared = True
+        if self.on_key_change is not None:
+            self.on_key_change(None)
+        if self.on_change is not None:
+            self.on_change()
+
+
+class TrackedMapping(collections.abc.MutableMapping):
+    """A mapping whose values are loaded on demand, recording changes.
+
+    Values are kept in .entries, {key: value}, where a value that isn't
+    loaded yet is a stand-in, recognized by ._unloaded(value); the first
+    access calls ._load(key, value), which replaces the stand-in (and
+    maybe others) in .entries, and returns the loaded value.
+    """
+
+    def __init__(self):
+        self.entries = {}  # {key: value, or a stand-in for one not loaded}
+        self.changed = set()  # {key, ...} changed since reset_changes()
+        self.cleared = False  # whether clear() was called since then
+        self.on_change = None  # fn(), called after each change
+        self.on_key_change = None  # fn(key), or fn(None) when cleared
+        # (held while loading, so another thread can't move the source
+        #  of the values midway, while saving)
+        self.lock = threading.RLock()
+
+    def _unloaded(self, value):
+        raise NotImplementedError
+
+    def _load(self, key, value):
+        raise NotImplementedError
+
+    def loaded(self):
+        """Return the keys whose values have been loaded (or assigned.)"""
+        return [key for (key, value) in list(self.entries.items())
+                if not self._unloaded(value)]
+
+    # change tracking (as in TrackedDict)
+
+    def dirty(self):
+        """Return True if anything has changed since reset_changes()."""
+        return bool(self.changed or self.cleared)
+
+    def reset_changes(self):
+        """Forget all recorded changes (typically, just after a save.)"""
+        self.changed = set()
+        self.cleared = False
+
+    def touch(self, key):
+        """Record that the value at key has changed (from within.)"""
+        self._change(key)
+
+    def _change(self, key):
+        self.changed.add(key)
+        if self.on_key_change is not None:
+            self.on_key_change(key)
+        if self.on_change is not None:
+            self.on_change()
+
+    # mapping
+
+    def __getitem__(self, key):
+        value = self.entries[key]
+        if self._unloaded(value):
+            with self.lock:
+                value = self.entries[key]
+                if self._unloaded(value):
+                    value = self._load(key, value)
+        return value
+
+    def __setitem__(self, key, value):
+        self.entries[key] = value
+        self._change(key)
+
+    def __delitem__(self, key):
+        del self.entries[key]
+        self._change(key)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def clear(self):
+        self.entries.clear()
+        self.changed = set()
+        self.cleared = True
+        if self.on_key_change is not None:
+            self.on_key_change(None)
+        if self.on_change is not None:
+            self.on_change()
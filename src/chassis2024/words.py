@@ -26,6 +26,22 @@ RUN = "RUN"  # basicrun: .run()
 ARGPARSE = "ARGPARSE"  # argparse: .parser, .args
 PERSISTENCE_DATA = "PERSISTENCE_DATA"  # basicjsonpersistence: .data, .save()
 
+# EXECUTION SPEC (for chassis2024 itself)
+CHASSIS2024 = "CHASSIS2024"  # primary key
+PARALLEL_WORKERS = "PARALLEL_WORKERS"  # int: thread pool size (default: sequential)
+PLAN_CACHE_FILEPATH = "PLAN_CACHE_FILEPATH"  # "....json" cached execution order
+INSTRUMENT = "INSTRUMENT"  # True/False: time nodes & callbacks (see instrument.py)
+TRACE_FILEPATH = "TRACE_FILEPATH"  # "....json" Chrome trace output (implies INSTRUMENT)
+EXPLAIN_FILEPATH = "EXPLAIN_FILEPATH"  # "....json"/"....txt" critical path report (implies INSTRUMENT)
+HISTORY_FILEPATH = "HISTORY_FILEPATH"  # "....json" node durations, to schedule slow chains first (implies INSTRUMENT)
+NODE_COSTS = "NODE_COSTS"  # {node: seconds} declared costs, for explain (see explain.py)
+DISCOVERY = "DISCOVERY"  # [SCAN/REGISTRY/ENTRY_POINTS, ...] (default: [SCAN])
+
+# DISCOVERY sources
+SCAN = "SCAN"  # every module in sys.modules
+REGISTRY = "REGISTRY"  # modules passed to chassis2024.register(...), and __main__
+ENTRY_POINTS = "ENTRY_POINTS"  # modules named by "chassis2024.components" entry points (imported)
+
 # MAJOR STAGES
 CLEAR = "CLEAR"
 RESET = "RESET"
@@ -42,4 +58,6 @@ EXECUTION_GRAPH_NODE = "EXECUTION_GRAPH_NODE"
 PACKAGE = "PACKAGE"
 INTERFACE = "INTERFACE"
 IMPLEMENTATION = "IMPLEMENTATION"
+# ExecutionGraphCycleDetected
+CYCLE = "CYCLE"
 
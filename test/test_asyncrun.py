@@ -0,0 +1,146 @@
+import sys
+import types
+import asyncio
+import importlib
+import threading
+import unittest
+
+import chassis2024
+from chassis2024 import chassis
+from chassis2024.words import *
+from chassis2024.asyncrun.words import *
+
+
+kMODULE_NAME = "chassis2024.asyncrun"
+
+# importing the words imported (and registered) the component; each test
+# imports it afresh, so that other tests' runs don't pick it up
+del sys.modules[kMODULE_NAME]
+chassis.registered_packages.pop(kMODULE_NAME, None)
+
+
+class TestAsyncRun(unittest.TestCase):
+    """Runs chassis2024.asyncrun, plus a RUN component."""
+
+    def setUp(self):
+        self.asyncrun = importlib.import_module(kMODULE_NAME)
+        self.app = types.ModuleType("_test_app")
+        self.app.CHASSIS2024_SPEC = {INTERFACES: {RUN: self.app}}
+        self.app.run = self.run_app
+        sys.modules["_test_app"] = self.app
+        self.events = []
+
+    def tearDown(self):
+        del sys.modules["_test_app"]
+        # so that other tests' runs don't pick up the component
+        del sys.modules[kMODULE_NAME]
+        chassis.registered_packages.pop(kMODULE_NAME, None)
+
+    def run_app(self):
+        chassis.call_before_termination(lambda: self.events.append("exit"))
+        return self.at_run(chassis2024.interface(ASYNC_TASKS, required=True))
+
+    def run_chassis(self, at_run, **kwargs):
+        self.at_run = at_run
+        D = {SHUTDOWN_TIMEOUT: 5.0, RESTART_DELAY: 0}
+        D.update(kwargs)
+        chassis2024.run({ASYNCRUN: D})
+        return chassis.exception_type_value_tracebacks_encountered
+
+    def test_bounded_concurrency(self):
+        running = []
+        async def work(i):
+            running.append(i)
+            self.events.append(len(running))
+            await asyncio.sleep(0.01)
+            running.remove(i)
+        async def at_run(P):
+            for i in range(6):
+                P.spawn(work, i)
+        self.assertEqual(self.run_chassis(at_run, MAX_CONCURRENCY=2), [])
+        self.assertEqual(len(self.events), 7)
+        self.assertLessEqual(max(self.events[:-1]), 2)
+        self.assertEqual(self.events[-1], "exit")
+
+    def test_stop_drains_before_termination(self):
+        async def forever():
+            try:
+                await asyncio.sleep(60)
+            finally:
+                await asyncio.sleep(0)
+                self.events.append("drained")
+        async def at_run(P):
+            P.spawn(forever)
+            asyncio.get_running_loop().call_later(0.05, P.stop)
+            await P.wait_stop()
+            self.events.append("stopping")
+        self.assertEqual(self.run_chassis(at_run), [])
+        self.assertEqual(sorted(self.events[:2]), ["drained", "stopping"])
+        self.assertEqual(self.events[2:], ["exit"])
+
+    def test_stubborn_task_abandoned(self):
+        async def stubborn():
+            while True:
+                try:
+                    await asyncio.sleep(60)
+                except asyncio.CancelledError:
+                    pass  # (ignores it)
+        async def at_run(P):
+            P.spawn(stubborn)
+            asyncio.get_running_loop().call_later(0.05, P.stop)
+        # (on a thread, so that a hang fails the test, not the suite)
+        t = threading.Thread(
+            target=lambda: self.run_chassis(at_run, SHUTDOWN_TIMEOUT=0.2),
+            daemon=True)
+        t.start()
+        t.join(5.0)
+        self.assertFalse(t.is_alive())
+        self.assertEqual(self.events, ["exit"])
+
+    def test_restart(self):
+        attempts = []
+        async def flaky():
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise RuntimeError("not yet")
+        async def at_run(P):
+            P.spawn(flaky, restart=True)
+        self.assertEqual(self.run_chassis(at_run), [])
+        self.assertEqual(len(attempts), 3)
+
+    def test_failure_reported(self):
+        async def broken():
+            raise RuntimeError("broken")
+        async def at_run(P):
+            P.spawn(broken)
+        exceptions = self.run_chassis(at_run)
+        self.assertEqual(len(exceptions), 1)
+        self.assertIs(exceptions[0][0], RuntimeError)
+
+    def test_plain_run(self):
+        # (a RUN written for basicrun works unchanged)
+        self.assertEqual(self.run_chassis(
+            lambda P: self.events.append("ran")), [])
+        self.assertEqual(self.events, ["ran", "exit"])
+
+    def test_under_run_async(self):
+        async def at_run(P):
+            self.events.append(asyncio.get_running_loop())
+        async def main():
+            await chassis2024.run_async({ASYNCRUN: {}})
+            return asyncio.get_running_loop()
+        self.at_run = at_run
+        loop = asyncio.run(main())
+        self.assertEqual(chassis.exception_type_value_tracebacks_encountered,
+                         [])
+        self.assertEqual(self.events, [loop, "exit"])
+
+    def test_run_within_event_loop(self):
+        # (UP's coroutine can't be awaited by plain run(); it's an error)
+        async def main():
+            self.run_chassis(lambda P: self.events.append("ran"))
+        asyncio.run(main())
+        exceptions = chassis.exception_type_value_tracebacks_encountered
+        self.assertEqual(len(exceptions), 1)
+        self.assertIs(exceptions[0][0], chassis2024.AwaitableNotAwaited)
+        self.assertEqual(self.events, [])  # (RUN never started)
@@ -0,0 +1,720 @@
+import sys
+import os
+import json
+import array
+import time
+import types
+import pathlib
+import tempfile
+import importlib
+import threading
+import unittest
+
+import chassis2024
+from chassis2024 import chassis
+from chassis2024 import shards
+from chassis2024 import compact
+from chassis2024 import indexes
+from chassis2024 import snapshot
+from chassis2024.words import *
+from chassis2024.basicjsonpersistence.words import *
+
+
+kMODULE_NAME = "chassis2024.basicjsonpersistence"
+
+# importing the words imported (and registered) the component; each test
+# imports it afresh, so that other tests' runs don't pick it up
+del sys.modules[kMODULE_NAME]
+chassis.registered_packages.pop(kMODULE_NAME, None)
+
+
+class PersistenceTestCase(unittest.TestCase):
+    """Runs chassis2024.basicjsonpersistence, plus a small UP component."""
+
+    def setUp(self):
+        self.persistence = importlib.import_module(kMODULE_NAME)
+        self.dirpath = pathlib.Path(tempfile.mkdtemp())
+        self.filepath = self.dirpath / "data.json"
+        self.up = types.ModuleType("_test_up")
+        self.up.CHASSIS2024_SPEC = {EXECUTES_GRAPH_NODES: [UP]}
+        self.up.perform_execution_graph_node = self.perform_up
+        sys.modules["_test_up"] = self.up
+        self.at_up = lambda D: None
+
+    def tearDown(self):
+        del sys.modules["_test_up"]
+        # so that other tests' runs don't pick up the component
+        del sys.modules[kMODULE_NAME]
+        chassis.registered_packages.pop(kMODULE_NAME, None)
+
+    def perform_up(self, n):
+        self.at_up(chassis2024.interface(PERSISTENCE_DATA, required=True))
+
+    def spec(self, **kwargs):
+        D = {FILEPATH: str(self.filepath)}
+        D.update(kwargs)
+        return {BASICJSONPERSISTENCE: D}
+
+    def run_chassis(self, at_up, **kwargs):
+        self.at_up = at_up
+        chassis2024.run(self.spec(**kwargs))
+        self.assertEqual(chassis.exception_type_value_tracebacks_encountered,
+                         [])
+
+    def read(self):
+        return json.loads(self.filepath.read_text())
+
+
+class TestBasicJSONPersistence(PersistenceTestCase):
+
+    def test_round_trip(self):
+        self.run_chassis(lambda P: P.data().update(a=1, b=[1, 2]))
+        self.assertEqual(self.read(), {"a": 1, "b": [1, 2]})
+        seen = []
+        self.run_chassis(lambda P: seen.append(dict(P.data())))
+        self.assertEqual(seen, [{"a": 1, "b": [1, 2]}])
+
+    def test_save_at_exit_off(self):
+        self.run_chassis(lambda P: P.data().update(a=1),
+                         SAVE_AT_EXIT=False)
+        self.assertFalse(self.filepath.exists())
+
+
+class TestChangeDetection(PersistenceTestCase):
+
+    def test_unchanged_data_not_rewritten(self):
+        for mode in ("HASH", "TRACKED"):
+            dirty = []
+            def at_up(P):
+                dirty.append(P.dirty())
+                P.data()["a"] = 1  # same value
+                if mode == "HASH":
+                    dirty.append(P.dirty())
+            self.filepath.write_text('{"a": 1}')
+            mtime_ns = self.filepath.stat().st_mtime_ns
+            self.run_chassis(at_up, CHANGE_DETECTION=mode)
+            self.assertEqual(self.filepath.stat().st_mtime_ns, mtime_ns)
+            self.assertFalse(any(dirty))
+
+    def test_read_records_no_changes(self):
+        from chassis2024 import tracked
+        kDATA = {"k%d" % i: i for i in range(100)}
+        self.filepath.write_text(json.dumps(kDATA))
+        sharded = self.dirpath / "sharded"
+        self.run_chassis(lambda P: P.data().update(kDATA),
+                         FILEPATH=str(sharded), SHARDS=4)
+        recorded = []
+        change = tracked.TrackedDict._change
+        def counting_change(D, key):
+            recorded.append(key)
+            change(D, key)
+        tracked.TrackedDict._change = counting_change
+        try:
+            for extra in ({}, {"FILEPATH": str(sharded), "SHARDS": 4}):
+                def at_up(P):
+                    self.assertEqual(len(P.data()), 100)
+                    self.assertFalse(P.data().changed)
+                self.run_chassis(at_up, CHANGE_DETECTION="TRACKED", **extra)
+        finally:
+            tracked.TrackedDict._change = change
+        self.assertEqual(recorded, [])  # (not even to be reset after)
+
+    def test_tracked_touch(self):
+        self.run_chassis(lambda P: P.data().update(L=[1]),
+                         CHANGE_DETECTION="TRACKED")
+        def at_up(P):
+            P.data()["L"].append(2)
+            self.assertFalse(P.dirty())
+            P.data().touch("L")
+            self.assertTrue(P.dirty())
+        self.run_chassis(at_up, CHANGE_DETECTION="TRACKED")
+        self.assertEqual(self.read(), {"L": [1, 2]})
+
+
+class TestChassisInstances(PersistenceTestCase):
+
+    def test_independent_instances_in_threads(self):
+        barrier = threading.Barrier(4)
+        results = {}
+        def at_up(P):
+            name = chassis2024.execution_spec[BASICJSONPERSISTENCE][FILEPATH]
+            barrier.wait()
+            P.data()["name"] = name
+            barrier.wait()
+            results[name] = dict(P.data())
+        self.at_up = at_up
+        def work(filepath):
+            chassis2024.Chassis().run(self.spec(FILEPATH=str(filepath)))
+        filepaths = [str(self.dirpath / ("data%d.json" % i)) for i in range(4)]
+        threads = [threading.Thread(target=work, args=(filepath,))
+                   for filepath in filepaths]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(results, {f: {"name": f} for f in filepaths})
+        for f in filepaths:
+            self.assertEqual(json.loads(pathlib.Path(f).read_text()),
+                             {"name": f})
+
+
+class TestLazyLoad(PersistenceTestCase):
+
+    kTEXT = ('{"a": {"s": "}\\"]{", "n": [1,  2]},\n'
+             ' "b" :[ [], {} ] , "c": -1.5e3, "d": null}')
+
+    def test_index(self):
+        from chassis2024.lazyjson import index
+        buffer = self.kTEXT.encode("utf-8")
+        D = {key: json.loads(buffer[start:end])
+             for (key, start, end) in index(buffer)}
+        self.assertEqual(D, json.loads(self.kTEXT))
+        self.assertEqual(index(b" { } "), [])
+        with self.assertRaises(ValueError):
+            index(b'{"a": [1, 2}')
+
+    def test_decoded_on_access_and_written_raw(self):
+        self.filepath.write_text(self.kTEXT)
+        def at_up(P):
+            D = P.data()
+            self.assertEqual(D.decoded(), [])
+            self.assertEqual(D["c"], -1500.0)
+            self.assertEqual(D.decoded(), ["c"])
+            D["e"] = "new"
+            del D["d"]
+        self.run_chassis(at_up, LAZY_LOAD=True)
+        text = self.filepath.read_text()
+        self.assertIn('"a": {"s": "}\\"]{", "n": [1,  2]}', text)  # as-is
+        self.assertEqual(json.loads(text), {"a": {"s": '}"]{', "n": [1, 2]},
+                                            "b": [[], {}], "c": -1500.0,
+                                            "e": "new"})
+
+    def test_saves_within_a_run(self):
+        self.filepath.write_text(self.kTEXT)
+        def at_up(P):
+            D = P.data()
+            for i in range(3):
+                D["i"] = i
+                P.save()
+                self.assertFalse(P.dirty())
+            self.assertEqual(D["b"], [[], {}])  # read from the new file
+        self.run_chassis(at_up, LAZY_LOAD=True)
+        self.assertEqual(self.read()["i"], 2)
+
+    def test_unchanged_data_not_rewritten(self):
+        self.filepath.write_text(self.kTEXT)
+        mtime_ns = self.filepath.stat().st_mtime_ns
+        self.run_chassis(lambda P: P.data()["a"], LAZY_LOAD=True)
+        self.assertEqual(self.filepath.stat().st_mtime_ns, mtime_ns)
+
+    def test_changed_type_rewritten(self):
+        # (True == 1, and 2.0 == 2, but they aren't the same JSON)
+        self.filepath.write_text('{"a": 1, "b": [1, 2], "c": 0, "d": 1}')
+        def at_up(P):
+            D = P.data()
+            D.update(a=True, b=[True, 2.0], c=False, d=1)
+            self.assertFalse(D.unchanged())
+        self.run_chassis(at_up, LAZY_LOAD=True, CHANGE_DETECTION="TRACKED")
+        self.assertEqual(self.filepath.read_text(),
+                         '{"a": true, "b": [true, 2.0], "c": false, "d": 1}')
+
+    def test_index_file(self):
+        from chassis2024.lazyjson import read_index
+        self.filepath.write_text(self.kTEXT)
+        index_filepath = self.dirpath / "data.json.index"
+        self.run_chassis(lambda P: None, LAZY_LOAD=True)
+        entries = read_index(index_filepath, self.filepath)
+        self.assertEqual([key for (key, start, end) in entries],
+                         ["a", "b", "c", "d"])
+        self.run_chassis(lambda P: P.data().update(c=0), LAZY_LOAD=True)
+        self.assertEqual(read_index(index_filepath, self.filepath)[2][0], "c")
+        self.filepath.write_text('{"z": 1}')  # changed behind its back
+        self.assertIsNone(read_index(index_filepath, self.filepath))
+        seen = []
+        self.run_chassis(lambda P: seen.append(dict(P.data())),
+                         LAZY_LOAD=True)
+        self.assertEqual(seen, [{"z": 1}])
+
+    def test_no_file(self):
+        self.run_chassis(lambda P: P.data().update(a=1), LAZY_LOAD=True)
+        self.assertEqual(self.read(), {"a": 1})
+
+
+class TestAutosave(PersistenceTestCase):
+
+    def test_coalesces_bursts(self):
+        from chassis2024.autosave import Autosaver
+        saves = []
+        autosaver = Autosaver(lambda: saves.append(1), 0.05, 1.0)
+        autosaver.start()
+        for i in range(100):
+            autosaver.notify()
+        time.sleep(0.3)
+        autosaver.stop()
+        self.assertEqual(saves, [1])
+
+    def test_max_delay(self):
+        from chassis2024.autosave import Autosaver
+        saves = []
+        autosaver = Autosaver(lambda: saves.append(1), 0.1, 0.15)
+        autosaver.start()
+        for i in range(25):  # (never quiet for 0.1s)
+            autosaver.notify()
+            time.sleep(0.02)
+        autosaver.stop()
+        self.assertGreaterEqual(len(saves), 2)
+
+    def test_background_failure_raised_at_stop(self):
+        from chassis2024.autosave import Autosaver
+        def save():
+            raise OSError("disk full")
+        autosaver = Autosaver(save, 0.01, 1.0)
+        autosaver.start()
+        autosaver.notify()
+        time.sleep(0.2)
+        with self.assertRaises(OSError):
+            autosaver.stop()
+
+    def test_saves_in_background(self):
+        def at_up(P):
+            P.data()["a"] = 1
+            deadline = time.monotonic() + 5.0
+            while not self.filepath.exists() and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(self.read(), {"a": 1})
+        self.run_chassis(at_up, AUTOSAVE=True, AUTOSAVE_DEBOUNCE=0.01,
+                         SAVE_AT_EXIT=False)
+
+    def test_flushed_at_termination(self):
+        self.run_chassis(lambda P: P.data().update(a=1),
+                         AUTOSAVE=True, AUTOSAVE_DEBOUNCE=60.0)
+        self.assertEqual(self.read(), {"a": 1})
+
+
+class TestSnapshots(PersistenceTestCase):
+
+    def test_key_snapshot_encodes_as_codec(self):
+        from chassis2024 import codec
+        D = {"a": [1, {"b": None}], 2: "two", "c": 1.5}
+        for codec_name in ("CODEC_JSON", "CODEC_FAST_JSON"):
+            K = snapshot.KeySnapshot(codec_name)
+            self.assertEqual(K.join(K.take(D)), codec.encode(D, codec_name))
+            self.assertEqual(K.join(K.take({})), b"{}")
+
+    def test_key_snapshot_reuses_unchanged(self):
+        K = snapshot.KeySnapshot("CODEC_JSON")
+        first = K.take({"a": [1], "b": [2]})
+        second = K.take({"a": [1, 1], "b": [2]}, changed={"a"})
+        self.assertIs(first[1], second[1])
+        self.assertEqual(K.join(second), b'{"a": [1, 1], "b": [2]}')
+
+    def check_snapshot(self, mode):
+        def at_up(P):
+            P.data()["a"] = 1
+            P.save()
+            P.data()["a"] = 2  # (after the snapshot; not in this save)
+            P.flush()
+            self.assertEqual(self.read(), {"a": 1})
+            self.assertTrue(P.dirty())
+        self.run_chassis(at_up, SNAPSHOT=mode, CHANGE_DETECTION="TRACKED")
+        self.assertEqual(self.read(), {"a": 2})
+
+    def test_keys(self):
+        self.check_snapshot("SNAPSHOT_KEYS")
+
+    @unittest.skipUnless(hasattr(os, "fork"), "requires os.fork()")
+    def test_fork(self):
+        self.check_snapshot("SNAPSHOT_FORK")
+
+    def test_background_failure_raised_at_flush(self):
+        self.filepath = self.dirpath / "missing" / "data.json"
+        def at_up(P):
+            P.data()["a"] = 1
+            P.save()  # (returns; the write fails in the background)
+            with self.assertRaises(OSError):
+                P.flush()
+            P.save_at_exit(False)
+        self.run_chassis(at_up, SNAPSHOT="SNAPSHOT_KEYS")
+
+    def test_not_with_lazy_load(self):
+        chassis2024.run(self.spec(SNAPSHOT="SNAPSHOT_KEYS", LAZY_LOAD=True))
+        [(exc_type, exc, tb)] = \
+            chassis.exception_type_value_tracebacks_encountered
+        self.assertIs(exc_type, ValueError)
+
+
+class TestCompact(PersistenceTestCase):
+
+    kDATA = {"records": [{"kind": "point", "xy": [i, i+1]}
+                         for i in range(500)],
+             "weights": [0.5, 1.5],
+             "mixed": [1, 2.5, "three"],
+             "big": [2**70]}
+
+    def test_compact(self):
+        D = json.loads(json.dumps(self.kDATA))
+        report = compact.compact(D)
+        self.assertIs(D["records"][0]["kind"], D["records"][1]["kind"])
+        self.assertEqual(D["records"][7]["xy"], array.array("q", [7, 8]))
+        self.assertEqual(D["weights"], array.array("d", [0.5, 1.5]))
+        self.assertEqual(D["mixed"], [1, 2.5, "three"])
+        self.assertEqual(D["big"], [2**70])
+        self.assertEqual(report[compact.ARRAYS], 501)
+        self.assertEqual(report[compact.STRINGS], 499)
+        self.assertGreater(report[compact.BYTES_SAVED], 0)
+        self.assertEqual(compact.expand(D), self.kDATA)
+
+    def test_round_trip_unchanged(self):
+        self.filepath.write_text(json.dumps(self.kDATA))
+        before = self.filepath.stat().st_mtime_ns
+        reports = []
+        def at_up(P):
+            self.assertIsInstance(P.data()["weights"], array.array)
+            reports.append(P.memory_report())
+            self.assertFalse(P.dirty())
+        self.run_chassis(at_up, COMPACT=True)
+        self.assertEqual(self.filepath.stat().st_mtime_ns, before)
+        self.assertGreater(reports[0][compact.BYTES_SAVED], 0)
+        def at_up(P):
+            P.data()["records"][3]["xy"].append(5)
+        self.run_chassis(at_up, COMPACT=True, SNAPSHOT="SNAPSHOT_KEYS")
+        self.assertEqual(self.read()["records"][3]["xy"], [3, 4, 5])
+
+
+class TestIndexes(PersistenceTestCase):
+
+    kDATA = {"u1": {"name": "ann", "age": 31, "address": {"city": "Oslo"}},
+             "u2": {"name": "bob", "age": 25, "address": {"city": "Oslo"}},
+             "u3": {"name": "cy", "age": 40, "address": {"city": "Rome"}},
+             "u4": {"name": "di"},
+             "notes": "not a record"}
+    kINDEXES = {"by_city": ["address", "city"], "by_age": "age"}
+
+    def test_lookup_and_range(self):
+        I = indexes.Index(["address", "city"])
+        I.build(self.kDATA)
+        self.assertEqual(I.lookup("Oslo"), ["u1", "u2"])
+        self.assertEqual(I.lookup("Paris"), [])
+        self.assertEqual(len(I), 3)
+        I = indexes.Index("age")
+        I.build(dict(self.kDATA, u5={"age": True}, u6={"age": 30.5}))
+        self.assertEqual(I.range(26, 40), ["u6", "u1"])
+        self.assertEqual(I.range(low=31), ["u1", "u3"])
+        self.assertEqual(I.lookup(1), [])
+        self.assertEqual(I.lookup(True), ["u5"])
+
+    def test_range_follows_changes(self):
+        I = indexes.Index("age")
+        I.build(self.kDATA)
+        I.add("u7", {"age": 28})
+        I.add("u2", {"age": 50})  # (25 goes, 50 comes)
+        I.remove("u3")
+        I.add("u8", {"age": "old"})
+        self.assertEqual(I.ordered, sorted(I.keys_by_slot))
+        self.assertEqual(I.range(0), ["u7", "u1", "u2"])
+        self.assertEqual(I.range("a"), ["u8"])
+
+    def test_kept_up_to_date(self):
+        self.filepath.write_text(json.dumps(self.kDATA))
+        def at_up(P):
+            D = P.data()
+            by_city = P.index("by_city")
+            self.assertEqual(by_city.lookup("Oslo"), ["u1", "u2"])
+            D["u5"] = {"address": {"city": "Oslo"}}
+            del D["u1"]
+            D["u3"]["address"]["city"] = "Oslo"
+            D.touch("u3")
+            self.assertEqual(sorted(P.index("by_city").lookup("Oslo")),
+                             ["u2", "u3", "u5"])
+            self.assertEqual(P.index("by_city").lookup("Rome"), [])
+            D.clear()
+            self.assertEqual(P.index("by_age").range(), [])
+            with self.assertRaises(KeyError):
+                P.index("by_name")
+        self.run_chassis(at_up, INDEXES=self.kINDEXES, SAVE_AT_EXIT=False)
+
+    def test_persisted(self):
+        self.filepath.write_text(json.dumps(self.kDATA))
+        self.run_chassis(lambda P: None, INDEXES=self.kINDEXES,
+                         PERSIST_INDEXES=True)
+        indexes_filepath = self.dirpath / "data.json.indexes"
+        self.assertTrue(indexes_filepath.exists())
+        built = []
+        build = indexes.Index.build
+        def counting_build(index, D):
+            built.append(index.path)
+            build(index, D)
+        indexes.Index.build = counting_build
+        try:
+            seen = []
+            def at_up(P):
+                seen.append(P.index("by_age").range(30))
+            self.run_chassis(at_up, INDEXES=self.kINDEXES,
+                             PERSIST_INDEXES=True)
+            self.assertEqual(seen, [["u1", "u3"]])
+            self.assertEqual(built, [])  # (read from the file)
+            encode = self.persistence.codec.encode
+            encoded = []
+            def counting_encode(D, *args):
+                encoded.append(D)
+                return encode(D, *args)
+            self.persistence.codec.encode = counting_encode
+            try:
+                self.run_chassis(lambda P: None, INDEXES=self.kINDEXES,
+                                 PERSIST_INDEXES=True)
+            finally:
+                self.persistence.codec.encode = encode
+            self.assertEqual(len(encoded), 1)  # (the save's, only)
+            self.filepath.write_text(json.dumps({"u9": {"age": 99}}))
+            self.run_chassis(at_up, INDEXES=self.kINDEXES,
+                             PERSIST_INDEXES=True)
+            self.assertEqual(seen[-1], ["u9"])  # (the file had changed)
+            self.assertEqual(len(built), 2)
+        finally:
+            indexes.Index.build = build
+
+
+class TestCodecs(PersistenceTestCase):
+
+    kDATA = {"a": 1, "b": [1.5, "two", None, True], "c": {"d": "é"}}
+
+    def test_round_trips(self):
+        for codec in ("CODEC_JSON", "CODEC_FAST_JSON",
+                      "CODEC_MARSHAL", "CODEC_PICKLE"):
+            for compression in ("COMPRESSION_NONE", "COMPRESSION_ZLIB",
+                                "COMPRESSION_LZMA"):
+                if self.filepath.exists():
+                    self.filepath.unlink()
+                self.run_chassis(lambda P: P.data().update(self.kDATA),
+                                 CODEC=codec, COMPRESSION=compression)
+                seen = []
+                self.run_chassis(lambda P: seen.append(dict(P.data())),
+                                 CODEC=codec, COMPRESSION=compression)
+                self.assertEqual(seen, [self.kDATA], (codec, compression))
+
+    def test_default_format_unchanged(self):
+        self.run_chassis(lambda P: P.data().update(a=1, b=[1, 2]))
+        self.assertEqual(self.filepath.read_text(), '{"a": 1, "b": [1, 2]}')
+
+    def test_convert(self):
+        from chassis2024 import codec
+        self.run_chassis(lambda P: P.data().update(self.kDATA))
+        xz_filepath = self.dirpath / "data.pickle.xz"
+        codec.main([str(self.filepath), str(xz_filepath),
+                    "--to-codec", "PICKLE", "--to-compression", "LZMA"])
+        seen = []
+        self.run_chassis(lambda P: seen.append(dict(P.data())),
+                         FILEPATH=str(xz_filepath), CODEC="CODEC_PICKLE",
+                         COMPRESSION="COMPRESSION_LZMA")
+        self.assertEqual(seen, [self.kDATA])
+        back_filepath = self.dirpath / "back.json"
+        codec.convert(xz_filepath, back_filepath,
+                      src_codec="CODEC_PICKLE",
+                      src_compression="COMPRESSION_LZMA")
+        self.assertEqual(json.loads(back_filepath.read_text()), self.kDATA)
+
+    def test_lazy_load_needs_plain_json(self):
+        chassis2024.run(self.spec(LAZY_LOAD=True,
+                                  COMPRESSION="COMPRESSION_ZLIB"))
+        [(exc_type, exc, tb)] = \
+            chassis.exception_type_value_tracebacks_encountered
+        self.assertIs(exc_type, ValueError)
+
+
+kWORKER = r"""
+import sys
+import chassis2024
+import chassis2024.basicjsonpersistence
+from chassis2024.words import *
+from chassis2024.basicjsonpersistence.words import *
+
+filepath, name = sys.argv[1:]
+
+def run():
+    P = chassis2024.interface(PERSISTENCE_DATA, required=True)
+    for i in range(20):
+        P.data()[name] = i
+        P.data()["shared"] = P.data().get("shared", 0) + 1  # (conflicts)
+        P.save()
+
+this = sys.modules[__name__]
+this.CHASSIS2024_SPEC = {EXECUTES_GRAPH_NODES: [UP]}
+this.perform_execution_graph_node = lambda n: run()
+chassis2024.run({BASICJSONPERSISTENCE: {FILEPATH: filepath, MERGE: True}})
+"""
+
+
+class TestSharing(PersistenceTestCase):
+
+    def test_merge_others_saves(self):
+        self.filepath.write_text('{"mine": 0, "theirs": 0, "both": 0, '
+                                 '"gone": 0}')
+        def at_up(P):
+            D = P.data()
+            # another process saves, meanwhile
+            self.filepath.write_text('{"mine": 0, "theirs": 1, "both": 1, '
+                                     '"new": 1}')
+            D["mine"] = 2
+            D["both"] = 2
+            P.save()
+            self.assertEqual(dict(D), {"mine": 2, "theirs": 1, "both": 2,
+                                       "new": 1})
+        self.run_chassis(at_up, MERGE=True)
+        self.assertEqual(self.read(), {"mine": 2, "theirs": 1, "both": 2,
+                                       "new": 1})
+
+    def test_last_writer_wins_without_merge(self):
+        self.filepath.write_text('{"a": 0}')
+        def at_up(P):
+            self.filepath.write_text('{"a": 0, "b": 1}')
+            P.data()["a"] = 2
+        self.run_chassis(at_up, LOCKING=True)
+        self.assertEqual(self.read(), {"a": 2})
+        self.assertEqual([p.name for p in self.dirpath.iterdir()
+                          if p.name.endswith(".tmp")], [])
+
+    def test_fsync_only_when_asked(self):
+        synced = []
+        fsync = os.fsync
+        os.fsync = lambda fd: synced.append(fd)
+        try:
+            for (kwargs, expected) in (({}, 0),
+                                       ({"FSYNC": True}, 1),
+                                       ({"LOCKING": True}, 1)):
+                del synced[:]
+                self.run_chassis(lambda P: P.data().update(kwargs=kwargs),
+                                 **kwargs)
+                self.assertEqual(len(synced), expected, kwargs)
+        finally:
+            os.fsync = fsync
+
+    def test_processes(self):
+        import subprocess
+        names = ["p%d" % i for i in range(4)]
+        workers = [subprocess.Popen([sys.executable, "-c", kWORKER,
+                                     str(self.filepath), name])
+                   for name in names]
+        for worker in workers:
+            self.assertEqual(worker.wait(), 0)
+        D = self.read()
+        self.assertEqual({name: D[name] for name in names},
+                         {name: 19 for name in names})
+
+
+class TestShards(PersistenceTestCase):
+
+    kDATA = {"k%d" % i: [i] for i in range(20)}
+
+    def shard_mtimes(self):
+        return {p.name: p.stat().st_mtime_ns
+                for p in self.filepath.iterdir() if p.suffix == ".shard"}
+
+    def load(self, **kwargs):
+        seen = []
+        self.run_chassis(lambda P: seen.append(dict(P.data())),
+                         SAVE_AT_EXIT=False, **kwargs)
+        return seen[0]
+
+    def test_only_changed_shards_written(self):
+        for mode in ("HASH", "TRACKED"):
+            self.filepath = self.dirpath / mode
+            self.run_chassis(lambda P: P.data().update(self.kDATA),
+                             SHARDS=4, CHANGE_DETECTION=mode)
+            before = self.shard_mtimes()
+            self.assertEqual(len(before), 4)
+            self.run_chassis(lambda P: P.data().update(k3=[3, 3]),
+                             SHARDS=4, CHANGE_DETECTION=mode)
+            after = self.shard_mtimes()
+            self.assertEqual(len([name for name in before
+                                  if before[name] != after[name]]), 1)
+            expected = dict(self.kDATA, k3=[3, 3])
+            self.assertEqual(self.load(SHARDS=4), expected)
+
+    def test_shard_per_key(self):
+        self.run_chassis(lambda P: P.data().update(self.kDATA),
+                         SHARDS="SHARD_PER_KEY")
+        self.assertEqual(len(self.shard_mtimes()), 20)
+        self.run_chassis(lambda P: P.data().pop("k7"),
+                         SHARDS="SHARD_PER_KEY")
+        self.assertEqual(len(self.shard_mtimes()), 19)
+        expected = dict(self.kDATA)
+        del expected["k7"]
+        self.assertEqual(self.load(SHARDS="SHARD_PER_KEY"), expected)
+
+    def test_lazy_shards(self):
+        self.run_chassis(lambda P: P.data().update(self.kDATA),
+                         SHARDS="SHARD_PER_KEY", CODEC="CODEC_PICKLE",
+                         COMPRESSION="COMPRESSION_ZLIB")
+        before = self.shard_mtimes()
+        def at_up(P):
+            D = P.data()
+            self.assertEqual(D.loaded(), [])
+            D["k1"].append(1)
+            self.assertEqual(D.loaded(), ["k1"])
+        self.run_chassis(at_up, SHARDS="SHARD_PER_KEY", LAZY_LOAD=True,
+                         CODEC="CODEC_PICKLE", COMPRESSION="COMPRESSION_ZLIB")
+        after = self.shard_mtimes()
+        self.assertEqual([name for name in before
+                          if before[name] != after[name]],
+                         [shards.filename("k1", "SHARD_PER_KEY")])
+        self.assertEqual(self.load(SHARDS="SHARD_PER_KEY",
+                                   CODEC="CODEC_PICKLE",
+                                   COMPRESSION="COMPRESSION_ZLIB")["k1"],
+                         [1, 1])
+
+    def test_reshard(self):
+        self.run_chassis(lambda P: P.data().update(self.kDATA), SHARDS=3)
+        self.assertEqual(self.load(SHARDS=5), self.kDATA)
+        self.run_chassis(lambda P: None, SHARDS=5)
+        tag = shards.format_tag(5, "CODEC_JSON", "COMPRESSION_NONE")
+        self.assertEqual(sorted(self.shard_mtimes()),
+                         ["b-%d-%s.shard" % (i, tag) for i in range(5)])
+        self.assertEqual(self.load(SHARDS=5), self.kDATA)
+
+    def test_format_change_cut_short(self):
+        self.run_chassis(lambda P: P.data().update(self.kDATA), SHARDS=4)
+        manifest = shards.manifest
+        def crash(*args):
+            raise RuntimeError("cut short, before the manifest")
+        shards.manifest = crash  # (after the shards are written)
+        try:
+            self.at_up = lambda P: None
+            chassis2024.run(self.spec(SHARDS=4, CODEC="CODEC_PICKLE"))
+        finally:
+            shards.manifest = manifest
+        exceptions = chassis.exception_type_value_tracebacks_encountered
+        self.assertEqual([e[0] for e in exceptions], [RuntimeError])
+        self.assertEqual(len(self.shard_mtimes()), 8)  # (old, and new)
+        self.assertEqual(self.load(SHARDS=4), self.kDATA)
+        self.run_chassis(lambda P: None, SHARDS=4, CODEC="CODEC_PICKLE")
+        self.assertEqual(len(self.shard_mtimes()), 4)
+        self.assertEqual(self.load(SHARDS=4, CODEC="CODEC_PICKLE"),
+                         self.kDATA)
+        self.run_chassis(lambda P: None, SHARDS=4)  # (and back again)
+        self.assertEqual(len(self.shard_mtimes()), 4)
+        self.assertEqual(self.load(SHARDS=4), self.kDATA)
+
+    def test_manifest_only_rewritten_when_keys_move(self):
+        for mode in ("HASH", "TRACKED"):
+            self.filepath = self.dirpath / mode
+            manifest = self.filepath / shards.kMANIFEST_FILENAME
+            self.run_chassis(lambda P: P.data().update(self.kDATA),
+                             SHARDS="SHARD_PER_KEY", CHANGE_DETECTION=mode)
+            mtime_ns = manifest.stat().st_mtime_ns
+            self.run_chassis(lambda P: P.data().update(k3=[3, 3]),
+                             SHARDS="SHARD_PER_KEY", CHANGE_DETECTION=mode)
+            self.assertEqual(manifest.stat().st_mtime_ns, mtime_ns)
+            self.run_chassis(lambda P: P.data().update(new=1),
+                             SHARDS="SHARD_PER_KEY", CHANGE_DETECTION=mode)
+            self.assertNotEqual(manifest.stat().st_mtime_ns, mtime_ns)
+            self.assertEqual(self.load(SHARDS="SHARD_PER_KEY"),
+                             dict(self.kDATA, k3=[3, 3], new=1))
+
+    def test_key_missing_from_shard(self):
+        # (as if a save was cut short, between a shard and the manifest)
+        D = shards.ShardedDict({"b-0.shard": ["a", "b"]},
+                               lambda name: {"a": 1})
+        with self.assertRaises(KeyError):
+            D["b"]
+        self.assertEqual(dict(D), {"a": 1})
+        self.assertEqual(D.changed, {"b"})
@@ -0,0 +1,447 @@
+import sys
+import time
+import types
+import threading
+import unittest
+
+import chassis2024
+from chassis2024 import chassis
+from chassis2024.words import *
+
+
+def make_component(name, spec, perform=None):
+    """Install a module named name, with the given spec, in sys.modules."""
+    module = types.ModuleType(name)
+    module.CHASSIS2024_SPEC = spec
+    if perform is not None:
+        module.perform_execution_graph_node = perform
+    sys.modules[name] = module
+    return module
+
+
+class ChassisTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.installed = []
+        self.performed = []
+        self.lock = threading.Lock()
+
+    def tearDown(self):
+        for name in self.installed:
+            del sys.modules[name]
+
+    def component(self, name, nodes, sequences=(), interfaces=None,
+                  delay=0, fail=()):
+        def perform(n):
+            time.sleep(delay)
+            if n in fail:
+                raise RuntimeError(n)
+            with self.lock:
+                self.performed.append(n)
+        self.installed.append(name)
+        return make_component(name, {EXECUTES_GRAPH_NODES: nodes,
+                                     EXECUTION_GRAPH_SEQUENCES: list(sequences),
+                                     INTERFACES: interfaces or {}},
+                              perform)
+
+
+class TestSequential(ChassisTestCase):
+
+    def test_order(self):
+        self.component("_test_a", ["A1", "A2"],
+                       [(CLEAR, "A1", RESET, "A2", ARGPARSE)])
+        chassis2024.run({})
+        self.assertEqual(self.performed, ["A1", "A2"])
+
+    def test_cycle(self):
+        self.component("_test_a", [], [(CONNECT, "X", RESET)])
+        with self.assertRaises(chassis2024.ExecutionGraphCycleDetected) as cm:
+            chassis2024.run({})
+        cycle = cm.exception.args[0][CYCLE]
+        self.assertEqual(cycle[0], cycle[-1])
+        self.assertIn("X", cycle)
+
+
+class TestParallel(ChassisTestCase):
+
+    def test_independent_nodes_overlap(self):
+        nodes = ["C%d" % i for i in range(4)]
+        self.component("_test_a", nodes,
+                       [(CONNECT, n, ACTIVATE) for n in nodes] +
+                       [(ACTIVATE, "LAST", UP)],
+                       delay=0.2)
+        self.component("_test_b", ["LAST"])
+        t = time.perf_counter()
+        chassis2024.run({CHASSIS2024: {PARALLEL_WORKERS: 4}})
+        self.assertLess(time.perf_counter() - t, 0.6)
+        self.assertEqual(sorted(self.performed[:4]), nodes)
+        self.assertEqual(self.performed[4], "LAST")
+
+    def test_exceptions_recorded(self):
+        self.component("_test_a", ["P", "Q", "R"],
+                       [(CONNECT, "P", ACTIVATE), (CONNECT, "Q", ACTIVATE),
+                        (ACTIVATE, "R")],
+                       fail=("P", "Q"))
+        chassis.run({CHASSIS2024: {PARALLEL_WORKERS: 2}})
+        self.assertNotIn("R", self.performed)
+        encountered = chassis.exception_type_value_tracebacks_encountered
+        self.assertEqual(sorted(str(v) for t, v, tb in encountered),
+                         ["P", "Q"])
+
+
+class TestAsync(ChassisTestCase):
+
+    def test_concurrent_coroutine_handlers(self):
+        import asyncio
+        async def perform(n):
+            await asyncio.sleep(0.2)
+            self.performed.append(n)
+            if n == "C0":
+                chassis.call_before_termination(terminate)
+        async def terminate():
+            await asyncio.sleep(0)
+            self.performed.append("TERMINATED")
+        nodes = ["C%d" % i for i in range(4)]
+        self.installed.append("_test_a")
+        make_component("_test_a",
+                       {EXECUTES_GRAPH_NODES: nodes + ["LAST"],
+                        EXECUTION_GRAPH_SEQUENCES:
+                            [(CONNECT, n, ACTIVATE) for n in nodes] +
+                            [(ACTIVATE, "LAST", UP)]},
+                       perform)
+        t = time.perf_counter()
+        asyncio.run(chassis2024.run_async({}))
+        self.assertLess(time.perf_counter() - t, 0.6)
+        self.assertEqual(sorted(self.performed[:4]), nodes)
+        self.assertEqual(self.performed[4:], ["LAST", "TERMINATED"])
+
+
+class TestPlanCache(ChassisTestCase):
+
+    def test_plan_cache(self):
+        import tempfile, pathlib
+        from chassis2024 import plancache
+        filepath = pathlib.Path(tempfile.mkdtemp()) / "plan.json"
+        spec = {CHASSIS2024: {PLAN_CACHE_FILEPATH: str(filepath)}}
+        a = self.component("_test_a", ["A1"], [(RESET, "A1", ARGPARSE)],
+                           interfaces={"IFACE_A": None})
+        a.CHASSIS2024_SPEC[INTERFACES]["IFACE_A"] = a
+        chassis2024.run(spec)
+        self.assertTrue(filepath.exists())
+        c = chassis2024.Chassis()
+        c._kahn = lambda: self.fail("the order wasn't taken from the cache")
+        c.run(spec)
+        self.assertEqual(self.performed, ["A1", "A1"])
+        self.assertIs(c.interface("IFACE_A"), a)
+        edges = c.execution_graph_sequences
+
+        # an order that no longer satisfies the graph isn't used
+        self.assertIsNone(plancache.load(filepath, [a],
+                                         edges + [("A1", RESET)]))
+        self.assertIsNone(plancache.load(filepath, [a],
+                                         edges + [(UP, "A2")]))
+        a.CHASSIS2024_SPEC[EXECUTION_GRAPH_SEQUENCES].append(
+            (CONNECT, "A1", ACTIVATE))
+        with self.assertRaises(chassis2024.ExecutionGraphCycleDetected):
+            chassis2024.run(spec)
+
+
+class TestDiscovery(ChassisTestCase):
+
+    def test_registry(self):
+        self.component("_test_a", ["A1"], [(RESET, "A1", ARGPARSE)])
+        b = self.component("_test_b", ["B1"], [(RESET, "B1", ARGPARSE)])
+        chassis2024.register(b)
+        try:
+            chassis2024.run({CHASSIS2024: {DISCOVERY: [REGISTRY]}})
+            self.assertEqual(self.performed, ["B1"])
+            chassis2024.run({CHASSIS2024: {DISCOVERY: [REGISTRY, SCAN]}})
+            self.assertEqual(self.performed, ["B1", "B1", "A1"])
+        finally:
+            del chassis.registered_packages["_test_b"]
+
+    @unittest.skipIf(sys.version_info < (3, 8), "needs importlib.metadata")
+    def test_entry_points(self):
+        import tempfile, pathlib
+        dirpath = pathlib.Path(tempfile.mkdtemp())
+        (dirpath / "_test_ep.py").write_text(
+            "from chassis2024.words import *\n"
+            "CHASSIS2024_SPEC = {EXECUTES_GRAPH_NODES: ['E1'],\n"
+            "    EXECUTION_GRAPH_SEQUENCES: [(RESET, 'E1', ARGPARSE)]}\n"
+            "performed = []\n"
+            "def perform_execution_graph_node(n):\n"
+            "    performed.append(n)\n")
+        dist_info = dirpath / "test_ep-1.0.dist-info"
+        dist_info.mkdir()
+        (dist_info / "METADATA").write_text(
+            "Metadata-Version: 2.1\nName: test-ep\nVersion: 1.0\n")
+        (dist_info / "entry_points.txt").write_text(
+            "[chassis2024.components]\nep = _test_ep\n")
+        sys.path.insert(0, str(dirpath))
+        chassis._entry_point_module_names = None
+        try:
+            chassis2024.run({CHASSIS2024: {DISCOVERY: [ENTRY_POINTS]}})
+            self.assertEqual(sys.modules["_test_ep"].performed, ["E1"])
+        finally:
+            sys.path.remove(str(dirpath))
+            sys.modules.pop("_test_ep", None)
+            chassis._entry_point_module_names = None
+
+
+class TestLazy(ChassisTestCase):
+
+    def setUp(self):
+        import tempfile, pathlib
+        ChassisTestCase.setUp(self)
+        self.dirpath = pathlib.Path(tempfile.mkdtemp())
+        (self.dirpath / "_test_lazy.py").write_text(
+            "import sys\n"
+            "from chassis2024.words import *\n"
+            "CHASSIS2024_SPEC = {\n"
+            "    EXECUTES_GRAPH_NODES: ['L1'],\n"
+            "    EXECUTION_GRAPH_SEQUENCES: [(CONNECT, 'L1', ACTIVATE)],\n"
+            "    INTERFACES: {'LAZY': sys.modules[__name__]}\n"
+            "}\n"
+            "performed = []\n"
+            "def perform_execution_graph_node(n):\n"
+            "    performed.append(n)\n")
+        sys.path.insert(0, str(self.dirpath))
+        chassis.register_lazy("_test_lazy",
+                              {EXECUTES_GRAPH_NODES: ["L1"],
+                               EXECUTION_GRAPH_SEQUENCES:
+                                   [(CONNECT, "L1", ACTIVATE)],
+                               INTERFACES: ["LAZY"]})
+
+    def tearDown(self):
+        ChassisTestCase.tearDown(self)
+        sys.path.remove(str(self.dirpath))
+        sys.modules.pop("_test_lazy", None)
+        del chassis.lazy_packages["_test_lazy"]
+
+    def test_imported_when_node_performed(self):
+        self.component("_test_a", ["A1"], [(RESET, "A1", ARGPARSE)])
+        chassis2024.run({CHASSIS2024: {DISCOVERY: []}})
+        self.assertEqual(self.performed, [])
+        self.assertEqual(sys.modules["_test_lazy"].performed, ["L1"])
+        self.assertIs(chassis2024.interface("LAZY"),
+                      sys.modules["_test_lazy"])
+
+    def test_plan_cache(self):
+        import tempfile, pathlib
+        filepath = pathlib.Path(tempfile.mkdtemp()) / "plan.json"
+        spec = {CHASSIS2024: {DISCOVERY: [],
+                              PLAN_CACHE_FILEPATH: str(filepath)}}
+        chassis2024.run(spec)
+        self.assertTrue(filepath.exists())
+        del sys.modules["_test_lazy"]  # (as in a new process)
+        c = chassis2024.Chassis()
+        c._kahn = lambda: self.fail("the order wasn't taken from the cache")
+        c.run(spec)
+        self.assertEqual(c.exception_type_value_tracebacks_encountered, [])
+        self.assertEqual(sys.modules["_test_lazy"].performed, ["L1"])
+        self.assertIs(c.interface("LAZY"), sys.modules["_test_lazy"])
+
+    def test_imported_when_interface_requested(self):
+        def perform(n):
+            self.performed.append("_test_lazy" in sys.modules)
+            chassis2024.interface("LAZY", required=True)
+            self.performed.append("_test_lazy" in sys.modules)
+        self.installed.append("_test_a")
+        make_component("_test_a", {EXECUTES_GRAPH_NODES: ["A1"],
+                                   EXECUTION_GRAPH_SEQUENCES:
+                                       [(RESET, "A1", ARGPARSE)]},
+                       perform)
+        chassis2024.run({})
+        self.assertEqual(self.performed, [False, True])
+
+
+class TestInstrumentation(ChassisTestCase):
+
+    def test_records_and_trace(self):
+        import json, tempfile, pathlib
+        from chassis2024 import instrument
+        filepath = pathlib.Path(tempfile.mkdtemp()) / "trace.json"
+        def perform(n):
+            chassis.call_before_termination(lambda: None)
+        self.installed.append("_test_a")
+        make_component("_test_a", {EXECUTES_GRAPH_NODES: ["A1"],
+                                   EXECUTION_GRAPH_SEQUENCES:
+                                       [(RESET, "A1", ARGPARSE)]},
+                       perform)
+        chassis2024.run({CHASSIS2024: {TRACE_FILEPATH: str(filepath)}})
+        records = chassis.instrumentation.records
+        self.assertEqual([(r[instrument.KIND], r[instrument.NAME])
+                          for r in records][0],
+                         (instrument.NODE, "A1"))
+        self.assertEqual(records[1][instrument.KIND], instrument.CALLBACK)
+        events = json.loads(filepath.read_text())["traceEvents"]
+        self.assertEqual([e["name"] for e in events][0], "A1")
+
+    def test_off_by_default(self):
+        chassis2024.run({})
+        self.assertIsNone(chassis.instrumentation)
+
+
+class TestExplain(ChassisTestCase):
+
+    def test_critical_path_and_slack(self):
+        from chassis2024 import explain
+        edges = [("A", "B"), ("B", "D"), ("A", "C"), ("C", "D"), ("A", "D")]
+        report = explain.explain(edges, {"A": 1, "B": 5, "C": 2, "D": 1})
+        self.assertEqual(report[explain.CRITICAL_PATH], ["A", "B", "D"])
+        self.assertEqual(report[explain.LENGTH], 7)
+        self.assertEqual(report[explain.TOTAL], 9)
+        self.assertAlmostEqual(report[explain.SPEEDUP], 9 / 7)
+        self.assertEqual(report[explain.NODES]["C"][explain.SLACK], 3)
+        self.assertEqual(report[explain.NODES]["B"][explain.SLACK], 0)
+        self.assertEqual(report[explain.REDUNDANT_EDGES], [("A", "D")])
+
+    def test_redundant_edges(self):
+        from chassis2024 import explain
+        edges = [("A", "B"), ("B", "C"), ("C", "D"), ("A", "C"), ("B", "D"),
+                 ("X", "D")]
+        self.assertEqual(explain.redundant_edges(edges),
+                         [("B", "D"), ("A", "C")])
+
+    def test_explain_file(self):
+        import json, tempfile, pathlib
+        from chassis2024 import explain
+        filepath = pathlib.Path(tempfile.mkdtemp()) / "explain.json"
+        def perform(n):
+            time.sleep(0.02 if n == "A1" else 0.001)
+        self.installed.append("_test_a")
+        make_component("_test_a", {EXECUTES_GRAPH_NODES: ["A1", "A2"],
+                                   EXECUTION_GRAPH_SEQUENCES:
+                                       [(RESET, "A1", ARGPARSE),
+                                        (RESET, "A2", ARGPARSE),
+                                        (CLEAR, ARGPARSE)]},
+                       perform)
+        chassis2024.run({CHASSIS2024: {EXPLAIN_FILEPATH: str(filepath),
+                                       NODE_COSTS: {"A2": 10.0}}})
+        report = json.loads(filepath.read_text())
+        self.assertIn("A1", report[explain.CRITICAL_PATH])
+        self.assertNotIn("A2", report[explain.CRITICAL_PATH])
+        self.assertGreater(report[explain.NODES]["A2"][explain.COST], 0.0)
+        self.assertLess(report[explain.NODES]["A2"][explain.COST], 10.0)
+        self.assertIn([CLEAR, ARGPARSE], report[explain.REDUNDANT_EDGES])
+        report = chassis.default.explain({"A2": 10.0})
+        self.assertIn("A2", report[explain.CRITICAL_PATH])
+        self.assertNotIn("A1", report[explain.CRITICAL_PATH])
+        self.assertEqual(report[explain.LENGTH], 10.0)
+
+
+class TestHistory(ChassisTestCase):
+
+    def setUp(self):
+        import tempfile, pathlib
+        ChassisTestCase.setUp(self)
+        self.filepath = pathlib.Path(tempfile.mkdtemp()) / "history.json"
+        # B1 is declared first; A1 -> A2 is the longer chain, once timed
+        self.component("_test_a", ["B1", "A1", "A2"],
+                       [(RESET, "B1", ARGPARSE),
+                        (RESET, "A1", "A2", ARGPARSE)])
+
+    def test_same_order_without_history(self):
+        from chassis2024 import history
+        chassis2024.run({})
+        order = list(chassis.execution_node_order_calculated)
+        chassis2024.run({CHASSIS2024: {HISTORY_FILEPATH: str(self.filepath)}})
+        self.assertEqual(chassis.execution_node_order_calculated, order)
+        self.assertIsNone(chassis.default.priorities)
+        self.assertEqual(sorted(history.load(self.filepath)),
+                         ["A1", "A2", "B1"])
+
+    def test_longest_remaining_path_first(self):
+        from chassis2024 import history
+        history.save(self.filepath, {"A1": 0.5, "A2": 0.5, "B1": 0.1})
+        spec = {CHASSIS2024: {HISTORY_FILEPATH: str(self.filepath)}}
+        chassis2024.run(spec)
+        self.assertEqual(self.performed, ["A1", "A2", "B1"])
+        self.assertEqual(chassis.default.priorities["A1"], 1.0)
+        del self.performed[:]
+        spec[CHASSIS2024][PARALLEL_WORKERS] = 1
+        chassis2024.run(spec)
+        self.assertEqual(self.performed[0], "A1")  # (submitted before B1)
+        # (the measured durations, blended in)
+        self.assertLess(history.load(self.filepath)["A1"], 0.5)
+
+    def test_blend(self):
+        from chassis2024 import history
+        self.assertEqual(history.blend({"A": 1.0, "B": 2.0},
+                                       {"A": 3.0, "C": 4.0}),
+                         {"A": 2.0, "B": 2.0, "C": 4.0})
+
+    def test_failure_recorded(self):
+        from chassis2024 import history
+        def broken_blend(old, new):
+            raise RuntimeError("blend")
+        blend, history.blend = history.blend, broken_blend
+        try:
+            chassis2024.run({CHASSIS2024: {HISTORY_FILEPATH:
+                                               str(self.filepath)}})
+        finally:
+            history.blend = blend
+        exceptions = chassis.exception_type_value_tracebacks_encountered
+        self.assertEqual(len(exceptions), 1)
+        self.assertIs(exceptions[0][0], RuntimeError)
+        self.assertEqual(self.performed, ["B1", "A1", "A2"])
+
+
+class TestHotPlug(ChassisTestCase):
+
+    def test_add_and_remove_package(self):
+        self.component("_test_a", ["A1"], [(CONNECT, "A1", ACTIVATE)])
+        chassis2024.run({})
+        c = chassis.default
+        b = types.ModuleType("_test_b")
+        b.CHASSIS2024_SPEC = {EXECUTES_GRAPH_NODES: ["B1", "B2"],
+                              EXECUTION_GRAPH_SEQUENCES:
+                                  [("A1", "B1", "B2", ACTIVATE)],
+                              INTERFACES: {"B": b}}
+        b.perform_execution_graph_node = self.performed.append
+        self.assertEqual(c.add_package(b), ["B1", "B2"])
+        order = c.planner.order()
+        self.assertLess(order.index("A1"), order.index("B1"))
+        self.assertLess(order.index("B2"), order.index(ACTIVATE))
+        self.assertIs(c.interface("B"), b)
+        c.perform_nodes(["B1", "B2"])
+        self.assertEqual(self.performed, ["A1", "B1", "B2"])
+
+        c.remove_package(b)
+        self.assertNotIn("B1", c.planner)
+        self.assertIsNone(c.interface("B"))
+        self.assertIn("A1", c.planner)
+
+    def test_handler_for_existing_node(self):
+        # (a node already in the graph, that gains a handler)
+        self.component("_test_a", [], [(CONNECT, "X1", ACTIVATE)])
+        chassis2024.run({})
+        c = chassis.default
+        b = types.ModuleType("_test_b")
+        b.CHASSIS2024_SPEC = {EXECUTES_GRAPH_NODES: ["X1"]}
+        self.assertEqual(c.add_package(b), ["X1"])
+
+    def test_shared_edge_survives_removal_after_cache_load(self):
+        import tempfile, pathlib
+        filepath = pathlib.Path(tempfile.mkdtemp()) / "plan.json"
+        spec = {CHASSIS2024: {PLAN_CACHE_FILEPATH: str(filepath)}}
+        a = self.component("_test_a", ["A1"], [(CONNECT, "A1", ACTIVATE)])
+        self.component("_test_b", ["B1"], [(CONNECT, "A1", ACTIVATE),
+                                           (ACTIVATE, "B1", UP)])
+        chassis2024.run(spec)
+        chassis2024.run(spec)  # (from the cache)
+        c = chassis.default
+        c.remove_package(sys.modules["_test_b"])
+        self.assertIn("ACTIVATE", c.planner.successors["A1"])
+        self.assertIs(c.execution_node_handlers["A1"], a)
+
+    def test_cycle_rolled_back(self):
+        chassis2024.run({})
+        c = chassis.default
+        b = types.ModuleType("_test_b")
+        b.CHASSIS2024_SPEC = {EXECUTION_GRAPH_SEQUENCES:
+                                  [(UP, "B1", CLEAR)]}
+        with self.assertRaises(chassis2024.ExecutionGraphCycleDetected):
+            c.add_package(b)
+        self.assertNotIn("B1", c.planner)
+        self.assertEqual(c.planner.order(), chassis.kMAJOR_STAGES)
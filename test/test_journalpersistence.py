@@ -0,0 +1,150 @@
+import sys
+import json
+import types
+import pathlib
+import tempfile
+import importlib
+import unittest
+
+import chassis2024
+from chassis2024 import chassis
+from chassis2024.words import *
+from chassis2024.journalpersistence.words import *
+
+
+kMODULE_NAME = "chassis2024.journalpersistence"
+
+# importing the words imported (and registered) the component; each test
+# imports it afresh, so that other tests' runs don't pick it up
+del sys.modules[kMODULE_NAME]
+chassis.registered_packages.pop(kMODULE_NAME, None)
+
+
+class JournalTestCase(unittest.TestCase):
+    """Runs chassis2024.journalpersistence, plus a small UP component."""
+
+    def setUp(self):
+        self.persistence = importlib.import_module(kMODULE_NAME)
+        self.dirpath = pathlib.Path(tempfile.mkdtemp())
+        self.filepath = self.dirpath / "data.json"
+        self.journal_filepath = self.dirpath / "data.json.journal"
+        self.up = types.ModuleType("_test_up")
+        self.up.CHASSIS2024_SPEC = {EXECUTES_GRAPH_NODES: [UP]}
+        self.up.perform_execution_graph_node = self.perform_up
+        sys.modules["_test_up"] = self.up
+        self.at_up = lambda P: None
+
+    def tearDown(self):
+        del sys.modules["_test_up"]
+        # so that other tests' runs don't pick up the component
+        del sys.modules[kMODULE_NAME]
+        chassis.registered_packages.pop(kMODULE_NAME, None)
+
+    def perform_up(self, n):
+        self.at_up(chassis2024.interface(PERSISTENCE_DATA, required=True))
+
+    def run_chassis(self, at_up, **kwargs):
+        self.at_up = at_up
+        D = {FILEPATH: str(self.filepath)}
+        D.update(kwargs)
+        chassis2024.run({JOURNALPERSISTENCE: D})
+        self.assertEqual(chassis.exception_type_value_tracebacks_encountered,
+                         [])
+
+    def load(self):
+        seen = []
+        self.run_chassis(lambda P: seen.append(dict(P.data())),
+                         SAVE_AT_EXIT=False)
+        return seen[0]
+
+    def journal_lines(self):
+        return self.journal_filepath.read_bytes().splitlines()
+
+
+class TestJournal(JournalTestCase):
+
+    def test_round_trip(self):
+        self.run_chassis(lambda P: P.data().update(a=1, b=[1, 2]))
+        self.assertFalse(self.filepath.exists())  # journal only
+        def at_up(P):
+            del P.data()["a"]
+            P.data()["b"].append(3)
+            P.data().touch("b")
+        self.run_chassis(at_up)
+        self.assertEqual(self.load(), {"b": [1, 2, 3]})
+        self.assertEqual(len(self.journal_lines()), 2)  # one per save
+
+    def test_only_changed_keys_appended(self):
+        self.filepath.write_text(json.dumps({"k%d" % i: i
+                                             for i in range(100)}))
+        def at_up(P):
+            P.data()["k5"] = "five"
+            P.save()
+            P.save()  # nothing more to write
+        self.run_chassis(at_up)
+        self.assertEqual(self.journal_lines(), [b'[["set", "k5", "five"]]'])
+        self.assertEqual(self.load()["k5"], "five")
+
+    def test_clear(self):
+        self.filepath.write_text('{"a": 1}')
+        def at_up(P):
+            P.data().clear()
+            P.data()["b"] = 2
+        self.run_chassis(at_up)
+        self.assertEqual(self.load(), {"b": 2})
+
+    def test_torn_tail_discarded(self):
+        self.run_chassis(lambda P: P.data().update(a=1),
+                         FSYNC=FSYNC_NEVER)
+        with open(self.journal_filepath, "ab") as f:
+            f.write(b'["set", "a", 2')  # crash mid-write
+        self.assertEqual(self.load(), {"a": 1})
+        self.run_chassis(lambda P: P.data().update(b=2))
+        self.assertEqual(self.load(), {"a": 1, "b": 2})
+
+    def test_torn_save_discarded_whole(self):
+        self.run_chassis(lambda P: P.data().update(a=1, b=1))
+        self.run_chassis(lambda P: P.data().update(a=2, b=2))
+        raw = self.journal_filepath.read_bytes()
+        # crash after the first of the second save's changes was written
+        self.journal_filepath.write_bytes(raw[:raw.rindex(b'["set", "b"')])
+        self.assertEqual(self.load(), {"a": 1, "b": 1})
+
+    def test_compaction(self):
+        def at_up(P):
+            for i in range(20):
+                P.data()["n"] = i
+                P.save()
+        self.run_chassis(at_up, COMPACT_THRESHOLD=100)
+        self.assertLess(self.journal_filepath.stat().st_size, 100)
+        self.assertIn("n", json.loads(self.filepath.read_text()))
+        self.assertEqual(self.load(), {"n": 19})
+
+    def test_replay_after_interrupted_compaction(self):
+        self.run_chassis(lambda P: P.data().update(a=1, b=2))
+        saved_journal = self.journal_filepath.read_bytes()
+        self.run_chassis(lambda P: P.compact())
+        # as if the process died between the rename and the truncation
+        self.journal_filepath.write_bytes(saved_journal)
+        self.assertEqual(self.load(), {"a": 1, "b": 2})
+
+    def test_interrupted_compaction_keeps_unsaved_changes(self):
+        self.run_chassis(lambda P: P.data().update(a=1))
+        journals = []
+        # (called between the rename and the truncation)
+        self.persistence._fsync_folder = lambda folderpath: journals.append(
+            self.journal_filepath.read_bytes())
+        def at_up(P):
+            P.data()["a"] = 2  # (not yet in the journal)
+            P.compact()
+        self.run_chassis(at_up, SAVE_AT_EXIT=False)
+        # as if the process died between the rename and the truncation
+        self.journal_filepath.write_bytes(journals[0])
+        self.assertEqual(self.load(), {"a": 2})
+
+    def test_bad_fsync_policy(self):
+        chassis2024.run({JOURNALPERSISTENCE: {FILEPATH: str(self.filepath),
+                                              FSYNC: "SOMETIMES"}})
+        [(exc_type, exc, tb)] = \
+            chassis.exception_type_value_tracebacks_encountered
+        self.assertIs(exc_type, ValueError)
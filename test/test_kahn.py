@@ -0,0 +1,94 @@
+import unittest
+
+from chassis2024 import kahn
+
+
+A = [("A", "E"), ("E", "M"), ("M", "Z"), ("C", "E"), ("B", "C"), ("D", "Z"),
+     ("C", "D"), ("D", "E"), ("foo", "M"), ("D", "foo")]
+
+B = [("A", "E"), ("E", "M"), ("M", "Z"), ("C", "E"), ("B", "C"), ("D", "Z"),
+     ("C", "D"), ("D", "E"), ("E", "C")]
+
+
+class TestTopologicalSort(unittest.TestCase):
+
+    def assertSatisfies(self, order, edges):
+        position = {n: i for i, n in enumerate(order)}
+        for u, v in edges:
+            self.assertLess(position[u], position[v], (u, v))
+
+    def test_sort(self):
+        order = kahn.topological_sort(A)
+        self.assertEqual(sorted(order), sorted(set(n for e in A for n in e)))
+        self.assertSatisfies(order, A)
+
+    def test_duplicate_edges(self):
+        edges = [("A", "B"), ("B", "C"), ("A", "B"), ("B", "C")]
+        self.assertEqual(kahn.topological_sort(edges), ["A", "B", "C"])
+        self.assertEqual(kahn.index_graph(edges)[2], [0, 1, 1])
+
+    def test_declaration_order(self):
+        edges = [("ROOT", "b"), ("ROOT", "a"), ("ROOT", "c")]
+        self.assertEqual(kahn.topological_sort(edges),
+                         ["ROOT", "b", "a", "c"])
+
+    def test_key(self):
+        edges = [("ROOT", "b"), ("ROOT", "a"), ("ROOT", "c")]
+        self.assertEqual(kahn.topological_sort(edges, key=str),
+                         ["ROOT", "a", "b", "c"])
+
+    def test_cycle(self):
+        with self.assertRaises(kahn.CycleDetected) as cm:
+            kahn.topological_sort(B)
+        cycle = cm.exception.cycle
+        self.assertEqual(cycle[0], cycle[-1])
+        self.assertLessEqual(set(cycle), {"C", "D", "E"})
+        for u, v in zip(cycle, cycle[1:]):
+            self.assertIn((u, v), B)
+        self.assertIsNone(kahn.find_cycle(A))
+
+
+class TestIncrementalOrder(unittest.TestCase):
+
+    def assertConsistent(self, order, edges):
+        for u, v in edges:
+            self.assertLess(order.position[u], order.position[v], (u, v))
+
+    def test_reorders_only_as_needed(self):
+        order = kahn.IncrementalOrder(["A", "B", "C", "D"],
+                                      [("A", "B"), ("C", "D")])
+        order.add_edge("D", "A")
+        self.assertEqual(order.order(), ["C", "D", "A", "B"])
+        self.assertConsistent(order, [("A", "B"), ("C", "D"), ("D", "A")])
+
+    def test_cycle_rejected(self):
+        order = kahn.IncrementalOrder([], [("A", "B"), ("B", "C")])
+        with self.assertRaises(kahn.CycleDetected) as cm:
+            order.add_edge("C", "A")
+        self.assertEqual(cm.exception.cycle, ["C", "A", "B", "C"])
+        self.assertNotIn(("C", "A"), order.edge_count)
+
+    def test_self_loop_rejected(self):
+        order = kahn.IncrementalOrder(["A", "B"])
+        with self.assertRaises(kahn.CycleDetected) as cm:
+            order.add_edge("A", "A")
+        self.assertEqual(cm.exception.cycle, ["A", "A"])
+        self.assertEqual(order.edge_count, {})
+        self.assertTrue(order.is_isolated("A"))
+        self.assertEqual(order.order(), ["A", "B"])
+
+    def test_rejected_edge_adds_no_nodes(self):
+        order = kahn.IncrementalOrder(["A", "B"])
+        with self.assertRaises(kahn.CycleDetected):
+            order.add_edge("N", "N")
+        self.assertNotIn("N", order)
+        self.assertEqual(order.order(), ["A", "B"])
+
+    def test_reference_counted_edges(self):
+        order = kahn.IncrementalOrder([], [("A", "B"), ("A", "B")])
+        order.remove_edge("A", "B")
+        self.assertFalse(order.is_isolated("A"))
+        order.remove_edge("A", "B")
+        self.assertTrue(order.is_isolated("A"))
+        order.remove_node("A")
+        self.assertNotIn("A", order)
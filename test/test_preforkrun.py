@@ -0,0 +1,140 @@
+import os
+import sys
+import time
+import types
+import signal
+import pathlib
+import tempfile
+import importlib
+import threading
+import unittest
+
+import chassis2024
+from chassis2024 import chassis
+from chassis2024.words import *
+from chassis2024.preforkrun.words import *
+
+
+kMODULE_NAME = "chassis2024.preforkrun"
+
+# importing the words imported (and registered) the component; each test
+# imports it afresh, so that other tests' runs don't pick it up
+del sys.modules[kMODULE_NAME]
+chassis.registered_packages.pop(kMODULE_NAME, None)
+
+
+@unittest.skipUnless(hasattr(os, "fork"), "requires os.fork()")
+class TestPreforkRun(unittest.TestCase):
+    """Runs chassis2024.preforkrun, plus a RUN component.
+
+    Workers can't report back through memory, so each one appends a
+    line to a file, for each thing that happens.
+    """
+
+    def setUp(self):
+        self.prefork = importlib.import_module(kMODULE_NAME)
+        self.dirpath = pathlib.Path(tempfile.mkdtemp())
+        self.logpath = self.dirpath / "log.txt"
+        self.app = types.ModuleType("_test_app")
+        self.app.CHASSIS2024_SPEC = {EXECUTES_GRAPH_NODES: ["_TEST_SETUP"],
+                                     EXECUTION_GRAPH_SEQUENCES:
+                                         [(CONNECT, "_TEST_SETUP", ACTIVATE)],
+                                     INTERFACES: {RUN: self.app}}
+        self.app.perform_execution_graph_node = self.setup
+        self.app.run = self.run_worker
+        sys.modules["_test_app"] = self.app
+        self.at_setup = lambda P: None
+        self.at_run = lambda P: None
+
+    def tearDown(self):
+        del sys.modules["_test_app"]
+        # so that other tests' runs don't pick up the component
+        del sys.modules[kMODULE_NAME]
+        chassis.registered_packages.pop(kMODULE_NAME, None)
+
+    def log(self, text):
+        with open(self.logpath, "a") as f:
+            f.write(text + "\n")
+
+    def lines(self):
+        if not self.logpath.exists():
+            return []
+        return sorted(self.logpath.read_text().splitlines())
+
+    def setup(self, n):
+        self.log("setup %d" % os.getpid())
+        self.at_setup(chassis2024.interface(PREFORK, required=True))
+
+    def run_worker(self):
+        self.at_run(chassis2024.interface(PREFORK, required=True))
+
+    def run_chassis(self, **kwargs):
+        D = {WORKERS: 2, SHUTDOWN_TIMEOUT: 5.0}
+        D.update(kwargs)
+        chassis2024.run({PREFORKRUN: D})
+        return chassis.exception_type_value_tracebacks_encountered
+
+    def test_setup_once_run_per_worker(self):
+        parent = os.getpid()
+        def at_setup(P):
+            chassis.call_before_termination(lambda: self.log("parent exit"))
+            P.call_after_fork(lambda: self.log("forked %d" %
+                                               P.worker_number()))
+            P.call_before_worker_termination(
+                lambda: self.log("worker exit %d" % P.worker_number()))
+        def at_run(P):
+            self.assertNotEqual(os.getpid(), parent)
+            chassis.call_before_termination(
+                lambda: self.log("run exit %d" % P.worker_number()))
+            self.log("run %d" % P.worker_number())
+        self.at_setup = at_setup
+        self.at_run = at_run
+        self.assertEqual(self.run_chassis(), [])
+        self.assertEqual(self.lines(),
+                         ["forked 0", "forked 1", "parent exit",
+                          "run 0", "run 1", "run exit 0", "run exit 1",
+                          "setup %d" % parent,
+                          "worker exit 0", "worker exit 1"])
+        self.assertIsNone(self.prefork.worker_number())
+
+    def test_failed_worker_restarts(self):
+        marker = self.dirpath / "failed"
+        def at_run(P):
+            self.log("run %d" % P.worker_number())
+            if P.worker_number() == 1 and not marker.exists():
+                marker.touch()
+                raise RuntimeError("first run fails")
+        self.at_run = at_run
+        self.assertEqual(self.run_chassis(), [])
+        self.assertEqual([line for line in self.lines()
+                          if line.startswith("run")],
+                         ["run 0", "run 1", "run 1"])
+
+    def test_failure_reported(self):
+        def at_run(P):
+            os._exit(3)
+        self.at_run = at_run
+        exceptions = self.run_chassis(MAX_RESTARTS=1)
+        self.assertEqual(len(exceptions), 1)
+        self.assertIs(exceptions[0][0], ChildProcessError)
+
+    def test_no_workers(self):
+        self.at_run = lambda P: self.log("run %s" % P.worker_number())
+        self.assertEqual(self.run_chassis(WORKERS=0), [])
+        self.assertEqual(self.lines()[0], "run None")
+
+    def test_sigterm_stops_workers(self):
+        def at_setup(P):
+            P.call_before_worker_termination(
+                lambda: self.log("worker exit %d" % P.worker_number()))
+            threading.Timer(0.5, os.kill, (os.getpid(),
+                                           signal.SIGTERM)).start()
+        def at_run(P):
+            self.log("run %d" % P.worker_number())
+            time.sleep(60)
+        self.at_setup = at_setup
+        self.at_run = at_run
+        t = time.monotonic()
+        self.assertEqual(self.run_chassis(), [])
+        self.assertLess(time.monotonic() - t, 30)
+        self.assertEqual(self.lines()[-2:], ["worker exit 0", "worker exit 1"])
@@ -0,0 +1,137 @@
+import sys
+import types
+import sqlite3
+import pathlib
+import tempfile
+import importlib
+import unittest
+
+import chassis2024
+from chassis2024 import chassis
+from chassis2024.words import *
+from chassis2024.sqlitedict import SQLiteDict
+from chassis2024.sqlitepersistence.words import *
+
+
+kMODULE_NAME = "chassis2024.sqlitepersistence"
+
+# importing the words imported (and registered) the component; each test
+# imports it afresh, so that other tests' runs don't pick it up
+del sys.modules[kMODULE_NAME]
+chassis.registered_packages.pop(kMODULE_NAME, None)
+
+
+class SQLiteTestCase(unittest.TestCase):
+    """Runs chassis2024.sqlitepersistence, plus a small UP component."""
+
+    def setUp(self):
+        self.persistence = importlib.import_module(kMODULE_NAME)
+        self.dirpath = pathlib.Path(tempfile.mkdtemp())
+        self.filepath = self.dirpath / "data.sqlite3"
+        self.up = types.ModuleType("_test_up")
+        self.up.CHASSIS2024_SPEC = {EXECUTES_GRAPH_NODES: [UP]}
+        self.up.perform_execution_graph_node = self.perform_up
+        sys.modules["_test_up"] = self.up
+        self.at_up = lambda P: None
+
+    def tearDown(self):
+        del sys.modules["_test_up"]
+        # so that other tests' runs don't pick up the component
+        del sys.modules[kMODULE_NAME]
+        chassis.registered_packages.pop(kMODULE_NAME, None)
+
+    def perform_up(self, n):
+        self.at_up(chassis2024.interface(PERSISTENCE_DATA, required=True))
+
+    def run_chassis(self, at_up, **kwargs):
+        self.at_up = at_up
+        D = {FILEPATH: str(self.filepath)}
+        D.update(kwargs)
+        chassis2024.run({SQLITEPERSISTENCE: D})
+        self.assertEqual(chassis.exception_type_value_tracebacks_encountered,
+                         [])
+
+    def load(self):
+        seen = []
+        self.run_chassis(lambda P: seen.append(dict(P.data())),
+                         SAVE_AT_EXIT=False)
+        return seen[0]
+
+    def rows(self):
+        c = sqlite3.connect(str(self.filepath))
+        try:
+            return dict(c.execute("SELECT key, value FROM data"))
+        finally:
+            c.close()
+
+
+class TestSQLitePersistence(SQLiteTestCase):
+
+    def test_round_trip(self):
+        self.run_chassis(lambda P: P.data().update(a=1, b=[1, 2], c=None))
+        def at_up(P):
+            del P.data()["a"]
+            P.data()["b"].append(3)
+            P.data().touch("b")
+        self.run_chassis(at_up)
+        self.assertEqual(self.load(), {"b": [1, 2, 3], "c": None})
+        self.assertEqual(self.rows(), {"b": "[1, 2, 3]", "c": "null"})
+
+    def test_no_file_until_saved(self):
+        self.run_chassis(lambda P: P.data().get("a"))
+        self.assertFalse(self.filepath.exists())
+
+    def test_reads_on_demand(self):
+        self.run_chassis(lambda P: P.data().update(("k%d" % i, i)
+                                                   for i in range(100)))
+        def at_up(P):
+            D = P.data()
+            self.assertEqual(D["k5"], 5)
+            self.assertEqual(len(D), 100)
+            self.assertNotIn("k6", D.cache)
+            D["k7"] = "seven"
+            P.save()
+            self.assertFalse(P.dirty())
+        self.run_chassis(at_up)
+        self.assertEqual(self.rows()["k7"], '"seven"')
+
+    def test_clear(self):
+        self.run_chassis(lambda P: P.data().update(a=1))
+        def at_up(P):
+            P.data().clear()
+            P.data()["b"] = 2
+            self.assertEqual(list(P.data()), ["b"])
+        self.run_chassis(at_up)
+        self.assertEqual(self.load(), {"b": 2})
+
+    def test_failed_save_writes_nothing(self):
+        self.run_chassis(lambda P: P.data().update(a=1))
+        def at_up(P):
+            P.data()["b"] = 2
+            P.data()["c"] = object()  # can't be encoded
+            with self.assertRaises(TypeError):
+                P.save()
+            self.assertTrue(P.dirty())
+            P.save_at_exit(False)
+        self.run_chassis(at_up)
+        self.assertEqual(self.load(), {"a": 1})
+
+
+class TestSQLiteDict(unittest.TestCase):
+
+    def test_cache_size(self):
+        D = SQLiteDict(sqlite3.connect(":memory:", isolation_level=None),
+                       cache_size=2)
+        D.connection.execute("CREATE TABLE data (key TEXT PRIMARY KEY "
+                             "NOT NULL, value TEXT NOT NULL)")
+        D.update(("k%d" % i, i) for i in range(10))
+        self.assertEqual(len(D.cache), 10)  # (changed values are kept)
+        D.commit()
+        self.assertEqual(len(D.cache), 2)
+        self.assertEqual(sorted(D.values()), list(range(10)))
+        self.assertEqual(len(D.cache), 2)
+
+    def test_keys_must_be_strings(self):
+        D = SQLiteDict()
+        with self.assertRaises(TypeError):
+            D[1] = "one"